@@ -24,7 +24,7 @@ try:
     from components.sidebar import render_sidebar, initialize_session_state
     from pages import dashboard, clients, devices, buildings, service_orders, communication, voice_interface
     from components import quantum_visualization
-    from services import quantum_communication, voice_communication
+    from services import quantum_communication, voice_communication, email_service
     from config import APP_NAME, COMPANY_NAME, PRIMARY_COLOR, SECONDARY_COLOR, BACKGROUND_COLOR
 except Exception as e:
     logger.error(f"Error importing modules: {e}")
@@ -271,6 +271,9 @@ def render_page():
 
 def main():
     try:
+        # Start the outbound email senders (once per process; reruns are no-ops)
+        email_service.start_email_queue_processor()
+
         # Add custom CSS
         add_custom_css()
 
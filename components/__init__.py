@@ -1,2 +1,6 @@
 # Import components
 from . import sidebar
+from . import pagination
+from . import export
+from . import bulk_import
+from . import ui_cache
@@ -0,0 +1,72 @@
+import logging
+import streamlit as st
+import pandas as pd
+from utils import bulk_import
+
+logger = logging.getLogger(__name__)
+
+# Labels of the importable tables in the form
+IMPORT_TABLE_LABELS = {
+    "klienci": "Klienci",
+    "budynki": "Budynki",
+    "urządzenia_hvac": "Urządzenia",
+    "zlecenia_serwisowe": "Zlecenia serwisowe",
+}
+
+def render_import_form(key):
+    """Render a CSV/XLSX upload form importing into one of the ``bulk_import.IMPORT_SPECS`` tables.
+    
+    The first row of the file names the columns (as in the database, plus an
+    optional ``id``). Rows with an ``id`` or a matching natural key update the
+    existing record; the rest are inserted.
+    """
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        table = st.selectbox(
+            "Tabela",
+            options=list(bulk_import.IMPORT_SPECS),
+            format_func=lambda t: IMPORT_TABLE_LABELS.get(t, t),
+            key=f"{key}_table"
+        )
+    
+    with col2:
+        st.caption("Kolumny: id (opcjonalnie), " + ", ".join(bulk_import.IMPORT_SPECS[table].columns))
+    
+    types = ["csv", "xlsx"] if bulk_import.openpyxl is not None else ["csv"]
+    uploaded = st.file_uploader("Plik do importu", type=types, key=f"{key}_file")
+    dry_run = st.checkbox("Tylko sprawdź (bez zapisu)", key=f"{key}_dry_run")
+    
+    if uploaded is not None and st.button("Importuj", key=f"{key}_run"):
+        try:
+            with st.spinner("Importowanie danych..."):
+                report = bulk_import.import_file(table, uploaded, dry_run=dry_run)
+        except Exception as e:
+            logger.error(f"Error importing {table}: {str(e)}")
+            st.error(f"Import nie powiódł się: {e}")
+            return
+        
+        render_import_report(report)
+
+def render_import_report(report):
+    """Show the summary and per-row errors of a ``bulk_import`` report."""
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Wiersze", report["rows"])
+    col2.metric("Dodane", report["inserted"])
+    col3.metric("Zaktualizowane", report["updated"])
+    col4.metric("Odrzucone", report["rejected"])
+    
+    st.caption(f"Czas: {report['seconds']:.1f} s ({report['rows_per_second']:.0f} wierszy/s)")
+    
+    if report["dry_run"]:
+        st.info("Tryb sprawdzania: zmiany nie zostały zapisane.")
+    elif report["rejected"]:
+        st.warning("Część wierszy została odrzucona.")
+    else:
+        st.success("Import zakończony.")
+    
+    if report["errors"]:
+        errors = pd.DataFrame(report["errors"]).rename(columns={"row": "Wiersz", "error": "Błąd"})
+        st.dataframe(errors, use_container_width=True)
+        if report["rejected"] > len(report["errors"]):
+            st.caption(f"Pokazano {len(report['errors'])} z {report['rejected']} błędów.")
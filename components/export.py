@@ -0,0 +1,56 @@
+import os
+import logging
+import streamlit as st
+from config import EXPORT_MAX_DOWNLOAD_MB
+from utils import export
+
+logger = logging.getLogger(__name__)
+
+def render_export_button(name, key, query=None, params=None):
+    """Render a format picker and an export button for table ``name``.
+    
+    ``name`` is a key of ``export.EXPORT_QUERIES`` unless ``query`` is given. The
+    export is streamed to a temporary file, so memory stays bounded while it runs.
+    The download itself is not streamed: Streamlit reads the whole file into
+    memory and keeps it for the session, so files larger than
+    ``EXPORT_MAX_DOWNLOAD_MB`` are not offered for download.
+    """
+    col1, col2 = st.columns([1, 2])
+    
+    with col1:
+        fmt = st.selectbox("Format", options=export.available_formats(), key=f"{key}_format")
+    
+    with col2:
+        st.write("")  # Spacer
+        prepare = st.button("Przygotuj eksport", key=f"{key}_prepare")
+    
+    if prepare:
+        try:
+            with st.spinner("Eksportowanie danych..."):
+                path, rows = export.export_to_tempfile(query or export.EXPORT_QUERIES[name], fmt, params)
+        except Exception as e:
+            logger.error(f"Error exporting {name}: {str(e)}")
+            st.error("Nie udało się przygotować eksportu.")
+            return
+        
+        suffix, mime = export.EXPORT_FORMATS[fmt]
+        try:
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+            if size_mb > EXPORT_MAX_DOWNLOAD_MB:
+                logger.warning(f"Export of {name} is {size_mb:.0f} MB, above the {EXPORT_MAX_DOWNLOAD_MB:.0f} MB download limit")
+                st.warning(
+                    f"Plik eksportu ma {size_mb:.0f} MB i przekracza limit pobierania "
+                    f"({EXPORT_MAX_DOWNLOAD_MB:.0f} MB). Zawęź eksport albo wykonaj go poza aplikacją "
+                    f"(utils.export.export_query)."
+                )
+                return
+            with open(path, "rb") as f:
+                st.download_button(
+                    label=f"Pobierz ({rows} wierszy)",
+                    data=f,
+                    file_name=f"{name}{suffix}",
+                    mime=mime,
+                    key=f"{key}_download"
+                )
+        finally:
+            os.remove(path)
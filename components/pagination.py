@@ -0,0 +1,33 @@
+import streamlit as st
+
+# Page navigation for keyset-paginated lists (utils.pagination). The cursors of
+# the pages visited so far are kept in the session, so "back" needs no query.
+
+def current_cursor(key, filters=None):
+    """Return the cursor of the page shown for list ``key``.
+    
+    The list goes back to its first page whenever ``filters`` change.
+    """
+    state = st.session_state.setdefault(f"{key}_pages", {"filters": filters, "cursors": [None]})
+    if state["filters"] != filters:
+        state["filters"] = filters
+        state["cursors"] = [None]
+    return state["cursors"][-1]
+
+def render_page_controls(key, next_cursor):
+    """Render previous/next buttons for list ``key`` below the current page."""
+    state = st.session_state[f"{key}_pages"]
+    col1, col2, col3 = st.columns([1, 4, 1])
+    
+    with col1:
+        if st.button("← Poprzednia", key=f"{key}_prev", disabled=len(state["cursors"]) == 1):
+            state["cursors"].pop()
+            st.experimental_rerun()
+    
+    with col2:
+        st.caption(f"Strona {len(state['cursors'])}")
+    
+    with col3:
+        if st.button("Następna →", key=f"{key}_next", disabled=next_cursor is None):
+            state["cursors"].append(next_cursor)
+            st.experimental_rerun()
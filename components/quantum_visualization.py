@@ -16,7 +16,11 @@ import math
 import random
 from typing import List, Dict, Any, Tuple
 
-from services import quantum_communication
+from services import quantum_communication, communication_service
+from components import ui_cache
+
+# Tables the entanglement scores are computed from
+ENTANGLEMENT_TABLES = ("klienci", "urządzenia_hvac", "komunikacja")
 
 
 def render_client_entanglement_network(client_ids: List[int] = None, limit: int = 10):
@@ -27,23 +31,45 @@ def render_client_entanglement_network(client_ids: List[int] = None, limit: int
     """
     st.subheader("Sieć splątania kwantowego klientów")
     
+    # The scores and layout are recomputed only after writes to their tables (see components/ui_cache.py)
+    fig = ui_cache.session_figure(
+        "entanglement_network",
+        lambda: entanglement_network_figure(client_ids, limit),
+        deps=(tuple(client_ids or ()), limit),
+        tables=ENTANGLEMENT_TABLES
+    )
+    
+    if fig is None:
+        st.info("Brak danych o klientach do wizualizacji.")
+        return
+    
+    st.plotly_chart(fig, use_container_width=True)
+    
+    # Add explanation
+    with st.expander("Jak interpretować wizualizację?"):
+        st.write("""
+        **Sieć splątania kwantowego klientów** pokazuje powiązania między klientami i ich urządzeniami.
+        
+        - **Niebieskie węzły** reprezentują klientów, a ich rozmiar odpowiada wartości splątania kwantowego.
+        - **Żółte węzły** reprezentują urządzenia HVAC.
+        - **Połączenia** między węzłami pokazują relacje - grubsze linie oznaczają silniejsze powiązania.
+        
+        Klienci o wyższym stopniu splątania kwantowego powinni być traktowani priorytetowo w komunikacji.
+        """)
+
+
+def entanglement_network_figure(client_ids: List[int] = None, limit: int = 10) -> go.Figure:
+    """
+    Build the client entanglement network figure (None if there are no clients).
+    """
     # Get client data
     if not client_ids:
-        clients = quantum_communication.get_client_entanglement_scores(limit=limit)
+        clients = quantum_communication.rank_clients_by_entanglement(limit=limit)
     else:
-        clients = []
-        for client_id in client_ids:
-            # Get client data
-            query = "SELECT id, nazwa, email FROM klienci WHERE id = %s"
-            result = db.execute_query(query, [client_id])
-            if result:
-                client = result[0]
-                client['entanglement_score'] = quantum_communication.QuantumPrioritizer.calculate_entanglement_score(client_id)
-                clients.append(client)
+        clients = quantum_communication.get_client_entanglement_scores(client_ids=client_ids)
     
     if not clients:
-        st.info("Brak danych o klientach do wizualizacji.")
-        return
+        return None
     
     # Create a network graph
     G = nx.Graph()
@@ -153,28 +179,42 @@ def render_client_entanglement_network(client_ids: List[int] = None, limit: int
                         plot_bgcolor='rgba(0,0,0,0)',
                         paper_bgcolor='rgba(0,0,0,0)',
                     ))
+    return fig
+
+
+def render_communication_priority_heatmap(days: int = 7):
+    """
+    Render a heatmap of communication priorities over time.
+    """
+    st.subheader("Mapa ciepła priorytetów komunikacji")
+    
+    fig = ui_cache.session_figure(
+        "priority_heatmap", lambda: priority_heatmap_figure(days), deps=(days, datetime.now().date())
+    )
     
     st.plotly_chart(fig, use_container_width=True)
     
     # Add explanation
-    with st.expander("Jak interpretować wizualizację?"):
+    with st.expander("Jak interpretować mapę ciepła?"):
         st.write("""
-        **Sieć splątania kwantowego klientów** pokazuje powiązania między klientami i ich urządzeniami.
+        **Mapa ciepła priorytetów komunikacji** pokazuje, kiedy komunikacja z klientami ma najwyższy priorytet.
         
-        - **Niebieskie węzły** reprezentują klientów, a ich rozmiar odpowiada wartości splątania kwantowego.
-        - **Żółte węzły** reprezentują urządzenia HVAC.
-        - **Połączenia** między węzłami pokazują relacje - grubsze linie oznaczają silniejsze powiązania.
+        - **Ciemniejsze kolory** oznaczają wyższy priorytet komunikacji.
+        - **Jaśniejsze kolory** oznaczają niższy priorytet.
         
-        Klienci o wyższym stopniu splątania kwantowego powinni być traktowani priorytetowo w komunikacji.
+        Priorytety są obliczane na podstawie:
+        - Godzin pracy (9-17)
+        - Historycznych wzorców komunikacji z klientami
+        - Stopnia splątania kwantowego klientów
+        
+        Wykorzystaj tę mapę, aby zoptymalizować czas odpowiedzi na komunikację od klientów.
         """)
 
 
-def render_communication_priority_heatmap(days: int = 7):
+def priority_heatmap_figure(days: int = 7) -> go.Figure:
     """
-    Render a heatmap of communication priorities over time.
+    Build the communication priority heatmap of the last ``days`` days.
     """
-    st.subheader("Mapa ciepła priorytetów komunikacji")
-    
     # Generate sample data (in a real implementation, this would come from the database)
     dates = [(datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(days)]
     hours = list(range(24))
@@ -212,24 +252,7 @@ def render_communication_priority_heatmap(days: int = 7):
         yaxis_title="Data",
         coloraxis_colorbar=dict(title="Priorytet")
     )
-    
-    st.plotly_chart(fig, use_container_width=True)
-    
-    # Add explanation
-    with st.expander("Jak interpretować mapę ciepła?"):
-        st.write("""
-        **Mapa ciepła priorytetów komunikacji** pokazuje, kiedy komunikacja z klientami ma najwyższy priorytet.
-        
-        - **Ciemniejsze kolory** oznaczają wyższy priorytet komunikacji.
-        - **Jaśniejsze kolory** oznaczają niższy priorytet.
-        
-        Priorytety są obliczane na podstawie:
-        - Godzin pracy (9-17)
-        - Historycznych wzorców komunikacji z klientami
-        - Stopnia splątania kwantowego klientów
-        
-        Wykorzystaj tę mapę, aby zoptymalizować czas odpowiedzi na komunikację od klientów.
-        """)
+    return fig
 
 
 def render_communication_flow_diagram():
@@ -409,6 +432,12 @@ def render_quantum_communication_dashboard():
     if not prioritized_comms:
         st.info("Brak priorytetowych komunikacji.")
     else:
+        if st.button("Oznacz wszystkie jako przeczytane", key="quantum_mark_all_read"):
+            communication_service.CommunicationManager.update_communication_statuses(
+                [comm['id'] for comm in prioritized_comms], "przeczytane"
+            )
+            st.experimental_rerun()
+        
         for i, comm in enumerate(prioritized_comms):
             with st.container():
                 col1, col2 = st.columns([3, 1])
@@ -0,0 +1,104 @@
+"""
+Streamlit caching for the pages, in three tiers.
+
+- Global resources (``st.cache_resource``): the storage backend, created once
+  per server process and shared by all sessions.
+- Query results (``cached_data``): loaders wrapped in ``st.cache_data``,
+  shared across sessions until their TTL runs out (by default the
+  ``utils.cache`` TTL of the tables they read) or one of those tables is
+  written to. Loaders return None when loading fails; None is not cached.
+- Figures (``session_figure``): Plotly figures memoized in the session, so a
+  rerun triggered by an unrelated widget doesn't rebuild them.
+
+Writes need no extra step: the write helpers call ``utils.cache.invalidate``
+with the tables they changed, which bumps those tables' versions. Loaders and
+figures depending on the tables are keyed on the versions and refresh on the
+next rerun; everything else stays cached.
+"""
+
+import functools
+import time
+
+import streamlit as st
+
+from utils import cache
+
+# Session state key of the memoized figures
+FIGURES_KEY = "_ui_cache_figures"
+
+class _LoadFailed(Exception):
+    """Raised inside st.cache_data when a loader returned None; exceptions are not cached."""
+
+# Global resources
+@st.cache_resource(show_spinner=False)
+def get_backend():
+    """The storage backend selected by ``DATA_BACKEND`` (see utils.backend)."""
+    from utils import backend
+    return backend.get_backend()
+
+# Query results shared across sessions
+def cached_data(*tables, ttl=None, max_entries=None):
+    """Decorator caching a loader's results across sessions until ``ttl`` or a write to ``tables``.
+
+    Results are pickled into the cache, so loaders must return picklable
+    values (rows, DataFrames) and callers get their own copy. A loader
+    signals a failed load by returning None, which is passed on to the
+    caller without being cached, so the next rerun tries again.
+    """
+    def decorator(func):
+        if not cache.result_cache.enabled:
+            return func
+
+        def load(versions, *args, **kwargs):
+            result = func(*args, **kwargs)
+            if result is None:
+                raise _LoadFailed()
+            return result
+
+        # st.cache_data tells cached functions apart by module and qualified name
+        load.__module__ = func.__module__
+        load.__name__ = func.__name__
+        load.__qualname__ = func.__qualname__
+
+        load = st.cache_data(
+            ttl=ttl if ttl is not None else cache.result_cache.ttl_for(tables),
+            max_entries=max_entries,
+            show_spinner=False
+        )(load)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                return load(cache.table_versions(*tables), *args, **kwargs)
+            except _LoadFailed:
+                return None
+
+        wrapper.clear = load.clear
+        return wrapper
+    return decorator
+
+# Figures memoized per session
+def session_figure(key, build, deps=(), tables=(), ttl=None):
+    """Return this session's figure ``key``, calling ``build()`` only when it is missing,
+    ``deps`` changed, one of ``tables`` was written to since it was built, or
+    it is older than ``ttl`` (by default the cache TTL of ``tables``; figures
+    without tables don't expire).
+
+    ``deps`` is compared with ``==``, so pass plain values (ids, dates,
+    tuples), not DataFrames.
+    """
+    if ttl is None and tables:
+        ttl = cache.result_cache.ttl_for(tables)
+    token = (deps, cache.table_versions(*tables))
+    now = time.monotonic()
+    figures = st.session_state.setdefault(FIGURES_KEY, {})
+    entry = figures.get(key)
+    if entry is not None and entry[0] == token and (ttl is None or now - entry[1] < ttl):
+        return entry[2]
+    figure = build()
+    figures[key] = (token, now, figure)
+    return figure
+
+def forget_figures():
+    """Drop this session's memoized figures."""
+    st.session_state.pop(FIGURES_KEY, None)
@@ -7,6 +7,13 @@ load_dotenv()
 # Supabase configuration
 SUPABASE_URL = os.getenv("SUPABASE_URL", "")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY", "")
+SUPABASE_MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "20"))  # shared REST connection pool
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "30"))  # seconds per REST request
+SUPABASE_IN_BATCH_SIZE = int(os.getenv("SUPABASE_IN_BATCH_SIZE", "200"))  # values per in.(...) filter
+SUPABASE_HEALTH_TTL = float(os.getenv("SUPABASE_HEALTH_TTL", "30"))  # seconds is_connected() reuses its result
+
+# Storage backend of the pages (utils/backend.py): "postgres" or "supabase"
+DATA_BACKEND = os.getenv("DATA_BACKEND", "postgres").lower()
 
 # Qdrant configuration
 QDRANT_URL = os.getenv("QDRANT_URL", "")
@@ -20,6 +27,52 @@ DB_USER = os.getenv("DB_USER", "hvac_admin")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "")
 DB_PORT = os.getenv("DB_PORT", "5432")
 
+# Database connection pool configuration
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds to wait for a free connection
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))  # seconds before idle connections are reaped
+DB_POOL_HEALTH_CHECK_INTERVAL = float(os.getenv("DB_POOL_HEALTH_CHECK_INTERVAL", "30"))  # seconds
+
+# Async connection pool (utils/adb.py, psycopg 3); timeouts as above
+ADB_POOL_MIN_SIZE = int(os.getenv("ADB_POOL_MIN_SIZE", "1"))
+ADB_POOL_MAX_SIZE = int(os.getenv("ADB_POOL_MAX_SIZE", "20"))
+
+# Apply pending schema migrations when the connection pool is created
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "True").lower() == "true"
+
+# Rows fetched per round trip by server-side (streaming) cursors and exports
+DB_STREAM_BATCH_SIZE = int(os.getenv("DB_STREAM_BATCH_SIZE", "5000"))
+
+# Largest export offered for download from the pages; Streamlit holds the whole file in memory
+EXPORT_MAX_DOWNLOAD_MB = float(os.getenv("EXPORT_MAX_DOWNLOAD_MB", "200"))
+
+# Prepare hot queries once per pooled connection (utils/prepared.py); disable behind transaction-pooling pgbouncer
+DB_PREPARED_STATEMENTS = os.getenv("DB_PREPARED_STATEMENTS", "True").lower() == "true"
+
+# Query instrumentation (utils/metrics.py)
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "500"))  # queries at least this slow are logged; 0 disables
+DB_SLOW_QUERY_LOG_SIZE = int(os.getenv("DB_SLOW_QUERY_LOG_SIZE", "100"))
+DB_EXPLAIN_SLOW_QUERIES = os.getenv("DB_EXPLAIN_SLOW_QUERIES", "False").lower() == "true"  # re-run slow queries with EXPLAIN ANALYZE
+DB_METRICS_PORT = int(os.getenv("DB_METRICS_PORT", "0"))  # serve /metrics and /metrics.json; 0 disables
+
+# Query result cache (utils/cache.py); TTLs in seconds
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "True").lower() == "true"
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "2000"))
+CACHE_DEFAULT_TTL = float(os.getenv("CACHE_DEFAULT_TTL", "30"))
+CACHE_TTL_CLIENTS = float(os.getenv("CACHE_TTL_CLIENTS", "120"))  # clients and buildings
+CACHE_TTL_DEVICES = float(os.getenv("CACHE_TTL_DEVICES", "120"))
+CACHE_TTL_ORDERS = float(os.getenv("CACHE_TTL_ORDERS", "30"))
+CACHE_TTL_COMMUNICATION = float(os.getenv("CACHE_TTL_COMMUNICATION", "15"))
+
+# Dashboard snapshot refresh interval in seconds
+DASHBOARD_SNAPSHOT_TTL = float(os.getenv("DASHBOARD_SNAPSHOT_TTL", "60"))
+
+# In-memory client lookup index (email/phone -> client id), seconds between refreshes
+CLIENT_INDEX_REFRESH_INTERVAL = float(os.getenv("CLIENT_INDEX_REFRESH_INTERVAL", "30"))
+CLIENT_INDEX_FULL_REFRESH_INTERVAL = float(os.getenv("CLIENT_INDEX_FULL_REFRESH_INTERVAL", "900"))  # also drops deleted clients
+DEFAULT_PHONE_COUNTRY_CODE = os.getenv("DEFAULT_PHONE_COUNTRY_CODE", "48")  # for numbers without a prefix
+
 # Application settings
 APP_NAME = "HVAC CRM/ERP System"
 COMPANY_NAME = "HVAC Solutions"
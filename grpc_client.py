@@ -91,6 +91,30 @@ def get_emails(stub, folder: str = "INBOX", limit: int = 10, unread_only: bool =
     
     return response
 
+def list_clients(stub, page_size: int = 50, search: str = ""):
+    """List all clients, following next_page_token page by page."""
+    logger.info(f"Listing clients (page size {page_size})")
+    
+    clients = []
+    page_token = ""
+    while True:
+        request = service_pb2.ListClientsRequest(
+            page_size=page_size,
+            page_token=page_token,
+            search=search
+        )
+        response = stub.ListClients(request)
+        clients.extend(response.clients)
+        page_token = response.next_page_token
+        if not page_token:
+            break
+    
+    logger.info(f"Retrieved {len(clients)} clients")
+    for client in clients:
+        logger.info(f"  {client.id}: {client.name} <{client.email}>")
+    
+    return clients
+
 def health_check(stub, service: str = "grpc"):
     """Health check."""
     logger.info(f"Checking health of service {service}")
@@ -113,7 +137,7 @@ def health_check(stub, service: str = "grpc"):
 def main():
     """Main function."""
     parser = argparse.ArgumentParser(description="gRPC client for HVAC CRM/ERP system")
-    parser.add_argument("--action", choices=["status", "email", "emails", "health"], default="status",
+    parser.add_argument("--action", choices=["status", "email", "emails", "clients", "health"], default="status",
                         help="Action to perform")
     parser.add_argument("--client-id", default="test-client",
                         help="Client ID for status request")
@@ -129,6 +153,8 @@ def main():
                         help="Limit for emails request")
     parser.add_argument("--unread-only", type=bool, default=True,
                         help="Unread only for emails request")
+    parser.add_argument("--search", default="",
+                        help="Search phrase for clients request")
     parser.add_argument("--service", default="grpc",
                         help="Service for health check request")
     args = parser.parse_args()
@@ -159,6 +185,8 @@ def main():
             send_email(stub, args.subject, args.to_email, args.text_content)
         elif args.action == "emails":
             get_emails(stub, args.folder, args.limit, args.unread_only)
+        elif args.action == "clients":
+            list_clients(stub, search=args.search)
         elif args.action == "health":
             health_check(stub, args.service)
         else:
@@ -8,6 +8,7 @@ This module implements a gRPC server for the HVAC CRM/ERP system.
 import os
 import sys
 import time
+import asyncio
 import logging
 import grpc
 import json
@@ -46,6 +47,24 @@ except ImportError:
     EmailSender = None
     EmailReceiver = None
 
+# Import database utilities
+try:
+    from utils import db
+except ImportError:
+    logger.warning("Database utilities not found. Client listing will be unavailable.")
+    db = None
+
+# Async database access for the asyncio server (needs psycopg 3)
+try:
+    from utils import adb
+    if adb.AsyncConnectionPool is None:
+        adb = None
+except ImportError:
+    adb = None
+
+# Largest page ListClients returns
+MAX_PAGE_SIZE = 500
+
 class HvacServiceServicer(service_pb2_grpc.HvacServiceServicer):
     """Implementation of the HvacService service."""
     
@@ -147,8 +166,11 @@ class HvacServiceServicer(service_pb2_grpc.HvacServiceServicer):
             for attachment in email_data.get("attachments", []):
                 attachments.append(service_pb2.Attachment(
                     filename=attachment.get("filename", ""),
-                    content=attachment.get("content", b""),
-                    content_type=attachment.get("content_type", "")
+                    content=attachment.get("content") or b"",
+                    content_type=attachment.get("content_type", ""),
+                    path=attachment.get("path", ""),
+                    size=attachment.get("size", 0),
+                    sha256=attachment.get("sha256", "")
                 ))
             
             response_emails.append(service_pb2.Email(
@@ -168,6 +190,38 @@ class HvacServiceServicer(service_pb2_grpc.HvacServiceServicer):
             message=f"Retrieved {len(response_emails)} emails"
         )
     
+    def ListClients(self, request, context):
+        """List clients page by page."""
+        logger.info(f"ListClients request (page_size={request.page_size})")
+        
+        if db is None:
+            context.set_code(grpc.StatusCode.UNAVAILABLE)
+            context.set_details("Database not available")
+            return service_pb2.ListClientsResponse()
+        
+        if request.page_size < 0:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details("page_size must not be negative")
+            return service_pb2.ListClientsResponse()
+        page_size = min(request.page_size or 50, MAX_PAGE_SIZE)
+        try:
+            clients, next_cursor = db.get_clients_page(
+                search=request.search or None,
+                client_type=request.client_type or None,
+                cursor=request.page_token or None,
+                limit=page_size
+            )
+        except ValueError as e:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(e))
+            return service_pb2.ListClientsResponse()
+        except db.QueryError as e:
+            context.set_code(grpc.StatusCode.UNAVAILABLE)
+            context.set_details(str(e))
+            return service_pb2.ListClientsResponse()
+        
+        return list_clients_response(clients, next_cursor)
+    
     def HealthCheck(self, request, context):
         """Health check."""
         logger.info(f"HealthCheck request for service {request.service}")
@@ -185,6 +239,98 @@ class HvacServiceServicer(service_pb2_grpc.HvacServiceServicer):
         
         return service_pb2.HealthCheckResponse(status=status)
 
+class AsyncHvacServiceServicer(HvacServiceServicer):
+    """HvacService for the asyncio server.
+    
+    Database lookups are coroutines on the event loop (utils.adb), so many
+    can be in flight at once; the blocking methods inherited from
+    HvacServiceServicer run in the server's thread pool.
+    """
+    
+    async def ListClients(self, request, context):
+        """List clients page by page."""
+        logger.info(f"ListClients request (page_size={request.page_size})")
+        
+        if request.page_size < 0:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, "page_size must not be negative")
+        page_size = min(request.page_size or 50, MAX_PAGE_SIZE)
+        try:
+            clients, next_cursor = await adb.get_clients_page(
+                search=request.search or None,
+                client_type=request.client_type or None,
+                cursor=request.page_token or None,
+                limit=page_size
+            )
+        except ValueError as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        except db.QueryError as e:
+            await context.abort(grpc.StatusCode.UNAVAILABLE, str(e))
+        
+        return list_clients_response(clients, next_cursor)
+
+def list_clients_response(clients, next_cursor):
+    """Build a ListClientsResponse from client rows."""
+    response_clients = []
+    for client in clients:
+        registered_at = client.get("data_rejestracji")
+        response_clients.append(service_pb2.Client(
+            id=client["id"],
+            name=client.get("nazwa") or "",
+            email=client.get("email") or "",
+            phone=client.get("telefon") or "",
+            address=client.get("adres") or "",
+            client_type=client.get("typ_klienta") or "",
+            registered_at=registered_at.isoformat() if registered_at else ""
+        ))
+    
+    return service_pb2.ListClientsResponse(
+        clients=response_clients,
+        next_page_token=next_cursor or ""
+    )
+
+def enable_reflection(server):
+    """Enable server reflection if grpcio-reflection is installed."""
+    try:
+        from grpc_reflection.v1alpha import reflection
+        service_names = [
+            service_pb2.DESCRIPTOR.services_by_name['HvacService'].full_name,
+            reflection.SERVICE_NAME
+        ]
+        reflection.enable_server_reflection(service_names, server)
+        logger.info("gRPC reflection enabled")
+    except ImportError:
+        logger.warning("grpcio-reflection not installed. Reflection disabled.")
+
+async def serve_async(config):
+    """Run the asyncio gRPC server until it is terminated."""
+    grpc_address = config.get("grpc_address", "0.0.0.0")
+    grpc_port = config.get("grpc_port", 8080)
+    grpc_max_workers = config.get("grpc_max_workers", 10)
+    
+    # Blocking (non-async) methods run in this pool
+    server = grpc.aio.server(
+        migration_thread_pool=futures.ThreadPoolExecutor(max_workers=grpc_max_workers)
+    )
+    service_pb2_grpc.add_HvacServiceServicer_to_server(
+        AsyncHvacServiceServicer(), server
+    )
+    
+    if config.get("grpc_reflection_enabled", True):
+        enable_reflection(server)
+    
+    server_address = f"{grpc_address}:{grpc_port}"
+    server.add_insecure_port(server_address)
+    
+    await server.start()
+    logger.info(f"gRPC server (asyncio) started on {server_address}")
+    logger.info(f"gRPC URL: {get_grpc_url(config)}")
+    
+    try:
+        await server.wait_for_termination()
+    finally:
+        await server.stop(0)
+        await adb.close_pool()
+
 def serve():
     """Start the gRPC server."""
     # Load configuration
@@ -201,6 +347,17 @@ def serve():
     grpc_max_workers = config.get("grpc_max_workers", 10)
     grpc_reflection_enabled = config.get("grpc_reflection_enabled", True)
     
+    # Serve on asyncio when requested and the async database driver is installed
+    if config.get("grpc_asyncio", False):
+        if adb is None:
+            logger.warning("psycopg 3 not installed. Falling back to the threaded gRPC server.")
+        else:
+            try:
+                asyncio.run(serve_async(config))
+            except KeyboardInterrupt:
+                logger.info("Shutting down gRPC server")
+            return
+    
     # Create gRPC server
     server = grpc.server(
         futures.ThreadPoolExecutor(max_workers=grpc_max_workers)
@@ -213,16 +370,7 @@ def serve():
     
     # Enable reflection if requested
     if grpc_reflection_enabled:
-        try:
-            from grpc_reflection.v1alpha import reflection
-            service_names = [
-                service_pb2.DESCRIPTOR.services_by_name['HvacService'].full_name,
-                reflection.SERVICE_NAME
-            ]
-            reflection.enable_server_reflection(service_names, server)
-            logger.info("gRPC reflection enabled")
-        except ImportError:
-            logger.warning("grpcio-reflection not installed. Reflection disabled.")
+        enable_reflection(server)
     
     # Add secure port
     server_address = f"{grpc_address}:{grpc_port}"
@@ -32,6 +32,7 @@ DEFAULT_CONFIG = {
     "grpc_address": "0.0.0.0",
     "grpc_port": 8080,
     "grpc_max_workers": 10,
+    "grpc_asyncio": False,
     "grpc_reflection_enabled": True,
     "grpc_compression": False,
     "grpc_ssl_enabled": False
@@ -77,6 +78,7 @@ def load_config() -> Dict[str, Any]:
         "GRPC_ADDRESS": "grpc_address",
         "GRPC_PORT": "grpc_port",
         "GRPC_MAX_WORKERS": "grpc_max_workers",
+        "GRPC_ASYNCIO": "grpc_asyncio",
         "GRPC_REFLECTION_ENABLED": "grpc_reflection_enabled",
         "GRPC_COMPRESSION": "grpc_compression",
         "GRPC_SSL_ENABLED": "grpc_ssl_enabled"
@@ -198,6 +200,7 @@ def print_network_info() -> None:
     print(f"  Enabled: {config.get('grpc_enabled', True)}")
     print(f"  URL: {grpc_url}")
     print(f"  Max Workers: {config.get('grpc_max_workers', 10)}")
+    print(f"  Asyncio: {config.get('grpc_asyncio', False)}")
     print(f"  Reflection Enabled: {config.get('grpc_reflection_enabled', True)}")
     print(f"  Compression: {config.get('grpc_compression', False)}")
     print(f"  SSL Enabled: {config.get('grpc_ssl_enabled', False)}")
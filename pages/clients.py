@@ -1,8 +1,19 @@
 import streamlit as st
 import pandas as pd
-from utils import db
+from utils import db, cache
+from components import pagination, export, bulk_import, ui_cache
 import plotly.express as px
 
+# Client columns the analysis tab is computed from
+CLIENT_ANALYSIS_QUERY = "SELECT typ_klienta, ocena_zamożności, data_rejestracji FROM klienci"
+
+COMMUNICATION_CHANNELS_QUERY = """
+SELECT typ AS "Kanał", COUNT(*) AS "Liczba"
+FROM komunikacja
+GROUP BY typ
+ORDER BY COUNT(*) DESC
+"""
+
 def render():
     """Render the clients page."""
     st.title("👥 Klienci")
@@ -39,12 +50,19 @@ def render_client_list():
         st.write("")  # Spacer
         refresh = st.button("Odśwież")
     
-    # Get clients from database
-    clients = db.get_clients(search=search if search else None)
+    # Reload the client list (and everything else showing clients) from the database
+    if refresh:
+        cache.invalidate("klienci")
     
-    # Filter by client type if selected
-    if client_type != "Wszyscy" and clients:
-        clients = [c for c in clients if c.get('typ_klienta') == client_type]
+    # Get one page of clients from the database
+    search = search if search else None
+    client_type = None if client_type == "Wszyscy" else client_type
+    cursor = pagination.current_cursor("client_list", filters=(search, client_type))
+    try:
+        clients, next_cursor = ui_cache.get_backend().get_clients_page(search=search, client_type=client_type, cursor=cursor)
+    except db.QueryError:
+        st.error("Nie udało się pobrać listy klientów. Spróbuj ponownie później.")
+        return
     
     # Display clients
     if clients:
@@ -57,6 +75,7 @@ def render_client_list():
         
         # Add action buttons using Streamlit's experimental data editor
         st.dataframe(display_df, use_container_width=True)
+        pagination.render_page_controls("client_list", next_cursor)
         
         # Allow selecting a client for details
         selected_client_id = st.selectbox(
@@ -69,10 +88,21 @@ def render_client_list():
             display_client_details(selected_client_id)
     else:
         st.info("Brak klientów spełniających kryteria wyszukiwania.")
+    
+    with st.expander("Eksport danych"):
+        dataset = st.selectbox(
+            "Dane do eksportu",
+            options=["klienci", "urządzenia", "budynki", "zlecenia"],
+            key="client_export_dataset"
+        )
+        export.render_export_button(dataset, key="client_export")
+    
+    with st.expander("Import danych"):
+        bulk_import.render_import_form(key="client_import")
 
 def display_client_details(client_id):
     """Display details for a selected client."""
-    client = db.get_client_by_id(client_id)
+    client = ui_cache.get_backend().get_client_by_id(client_id)
     
     if client:
         with st.expander("Szczegóły klienta", expanded=True):
@@ -127,7 +157,7 @@ def display_client_details(client_id):
             
             with client_tabs[0]:
                 # Get devices for this client
-                devices = db.get_devices(client_id=client_id)
+                devices = ui_cache.get_backend().get_devices(client_id=client_id)
                 
                 if devices:
                     # Convert to DataFrame for display
@@ -151,7 +181,7 @@ def display_client_details(client_id):
             
             with client_tabs[1]:
                 # Get buildings for this client
-                buildings = db.get_buildings(client_id=client_id)
+                buildings = ui_cache.get_backend().get_buildings(client_id=client_id)
                 
                 if buildings:
                     # Convert to DataFrame for display
@@ -175,7 +205,7 @@ def display_client_details(client_id):
             
             with client_tabs[2]:
                 # Get service orders for this client
-                orders = db.get_service_orders(client_id=client_id)
+                orders = ui_cache.get_backend().get_service_orders(client_id=client_id)
                 
                 if orders:
                     # Convert to DataFrame for display
@@ -308,7 +338,7 @@ def render_add_client_form():
                 }
                 
                 # Create client in database
-                client_id = db.create_client(client_data)
+                client_id = ui_cache.get_backend().create_client(client_data)
                 
                 if client_id:
                     st.success(f"Klient '{nazwa}' został dodany pomyślnie!")
@@ -336,22 +366,20 @@ def render_add_client_form():
                 else:
                     st.error("Wystąpił błąd podczas dodawania klienta.")
 
-def render_client_analysis():
-    """Render client analysis view."""
-    st.subheader("Analiza klientów")
-    
-    # Sample data for analysis
-    # In a real application, this would come from the database
-    
-    # Client types distribution
-    st.write("**Rozkład typów klientów**")
-    
-    client_types_data = {
-        'Typ': ['indywidualny', 'biznesowy'],
-        'Liczba': [65, 35]
-    }
-    
-    df_types = pd.DataFrame(client_types_data)
+@ui_cache.cached_data("klienci")
+def load_client_analysis():
+    """Client columns of the analysis tab, shared across sessions (None on error)."""
+    # Fetched columnar (COPY), so large client tables skip the per-row dict stage
+    return db.query_to_dataframe(CLIENT_ANALYSIS_QUERY, columnar=True, empty_on_error=False)
+
+@ui_cache.cached_data("komunikacja")
+def load_communication_channels():
+    """Communication counts by channel, shared across sessions (None on error)."""
+    return db.query_to_dataframe(COMMUNICATION_CHANNELS_QUERY, columnar=True, empty_on_error=False)
+
+def client_types_figure(df_clients):
+    types = df_clients['typ_klienta'].fillna('nieokreślony').value_counts()
+    df_types = pd.DataFrame({'Typ': types.index, 'Liczba': types.values})
     
     fig = px.pie(
         df_types,
@@ -360,75 +388,45 @@ def render_client_analysis():
         color_discrete_sequence=px.colors.qualitative.Plotly
     )
     fig.update_traces(textposition='inside', textinfo='percent+label')
+    return fig
+
+def client_wealth_figure(df_clients):
+    wealth = df_clients['ocena_zamożności'].dropna().round().astype(int).value_counts().sort_index()
+    df_wealth = pd.DataFrame({'Ocena': wealth.index, 'Liczba klientów': wealth.values})
     
-    st.plotly_chart(fig, use_container_width=True)
-    
-    # Client wealth distribution
-    st.write("**Rozkład oceny zamożności klientów**")
-    
-    # Generate sample data
-    wealth_data = {
-        'Ocena': [1, 2, 3, 4, 5, 6, 7, 8, 9, 10],
-        'Liczba klientów': [5, 8, 12, 15, 20, 18, 10, 7, 3, 2]
-    }
-    
-    df_wealth = pd.DataFrame(wealth_data)
-    
-    fig = px.bar(
+    return px.bar(
         df_wealth,
         x='Ocena',
         y='Liczba klientów',
         color='Liczba klientów',
         color_continuous_scale='Viridis'
     )
-    
-    st.plotly_chart(fig, use_container_width=True)
-    
-    # Client acquisition over time
-    st.write("**Pozyskiwanie klientów w czasie**")
-    
-    # Generate sample data
-    months = ['Sty', 'Lut', 'Mar', 'Kwi', 'Maj', 'Cze', 'Lip', 'Sie', 'Wrz', 'Paź', 'Lis', 'Gru']
-    acquisition_data = {
-        'Miesiąc': months,
-        'Liczba nowych klientów': [3, 5, 7, 8, 10, 12, 15, 13, 11, 9, 7, 5]
-    }
-    
-    df_acquisition = pd.DataFrame(acquisition_data)
-    
-    fig = px.line(
+
+def client_acquisition_figure(df_clients):
+    # Last 12 months with registrations
+    acquisition = df_clients['data_rejestracji'].dropna().dt.to_period('M').value_counts().sort_index().tail(12)
+    df_acquisition = pd.DataFrame({
+        'Miesiąc': acquisition.index.astype(str),
+        'Liczba nowych klientów': acquisition.values
+    })
+    
+    return px.line(
         df_acquisition,
         x='Miesiąc',
         y='Liczba nowych klientów',
         markers=True
     )
-    
-    st.plotly_chart(fig, use_container_width=True)
-    
-    # Client communication analysis
-    st.write("**Analiza komunikacji z klientami**")
-    
-    # Generate sample data
-    communication_data = {
-        'Kanał': ['Email', 'Telefon', 'SMS', 'Osobisty'],
-        'Liczba': [45, 30, 15, 10]
-    }
-    
-    df_communication = pd.DataFrame(communication_data)
-    
-    fig = px.bar(
+
+def communication_channels_figure(df_communication):
+    return px.bar(
         df_communication,
         x='Kanał',
         y='Liczba',
         color='Kanał'
     )
-    
-    st.plotly_chart(fig, use_container_width=True)
-    
-    # Client satisfaction
-    st.write("**Satysfakcja klientów**")
-    
-    # Generate sample data
+
+def client_satisfaction_figure():
+    # Sample data (satisfaction ratings are not collected yet)
     satisfaction_data = {
         'Ocena': ['1 (Niezadowolony)', '2', '3', '4', '5 (Bardzo zadowolony)'],
         'Procent': [5, 10, 20, 35, 30]
@@ -443,5 +441,57 @@ def render_client_analysis():
         color_discrete_sequence=px.colors.sequential.RdBu
     )
     fig.update_traces(textposition='inside', textinfo='percent+label')
+    return fig
+
+def render_client_analysis():
+    """Render client analysis view."""
+    st.subheader("Analiza klientów")
+    
+    df_clients = load_client_analysis()
+    
+    if df_clients is None:
+        st.error("Nie udało się pobrać danych klientów do analizy.")
+        return
+    
+    if df_clients.empty:
+        st.info("Brak danych klientów do analizy.")
+        return
+    
+    # Figures are rebuilt only after the client table changes (see components/ui_cache.py)
+    st.write("**Rozkład typów klientów**")
+    fig = ui_cache.session_figure(
+        "clients_types", lambda: client_types_figure(df_clients), tables=("klienci",)
+    )
+    st.plotly_chart(fig, use_container_width=True)
+    
+    st.write("**Rozkład oceny zamożności klientów**")
+    fig = ui_cache.session_figure(
+        "clients_wealth", lambda: client_wealth_figure(df_clients), tables=("klienci",)
+    )
+    st.plotly_chart(fig, use_container_width=True)
     
+    st.write("**Pozyskiwanie klientów w czasie**")
+    fig = ui_cache.session_figure(
+        "clients_acquisition", lambda: client_acquisition_figure(df_clients), tables=("klienci",)
+    )
+    st.plotly_chart(fig, use_container_width=True)
+    
+    # Client communication analysis
+    st.write("**Analiza komunikacji z klientami**")
+    
+    df_communication = load_communication_channels()
+    
+    if df_communication is None:
+        st.error("Nie udało się pobrać danych komunikacji.")
+    elif not df_communication.empty:
+        fig = ui_cache.session_figure(
+            "clients_channels", lambda: communication_channels_figure(df_communication),
+            tables=("komunikacja",)
+        )
+        st.plotly_chart(fig, use_container_width=True)
+    else:
+        st.info("Brak zarejestrowanej komunikacji.")
+    
+    st.write("**Satysfakcja klientów**")
+    fig = ui_cache.session_figure("clients_satisfaction", client_satisfaction_figure)
     st.plotly_chart(fig, use_container_width=True)
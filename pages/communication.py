@@ -5,6 +5,7 @@ from datetime import datetime
 import logging
 from services import communication_service
 from utils import db
+from components import pagination, export
 
 logger = logging.getLogger(__name__)
 
@@ -32,17 +33,27 @@ def render_inbox():
     """Render the inbox tab."""
     st.subheader("Skrzynka odbiorcza")
     
-    # Add refresh button
-    col1, col2 = st.columns([6, 1])
+    # Add refresh and mark-all buttons
+    col1, col2, col3 = st.columns([4, 2, 1])
     with col2:
+        if st.button("✔️ Oznacz wszystkie jako przeczytane", key="mark_all_read"):
+            count = communication_service.CommunicationManager.mark_all_as_read(
+                comm_type="email", direction="przychodzący"
+            )
+            st.success(f"Oznaczono {count} wiadomości jako przeczytane")
+            st.experimental_rerun()
+    with col3:
         if st.button("🔄 Odśwież", key="refresh_inbox"):
             with st.spinner("Pobieranie nowych wiadomości..."):
                 result = communication_service.process_incoming_communications()
                 st.success(f"Pobrano {result['emails']} nowych wiadomości")
                 st.experimental_rerun()
     
-    # Get recent communications
-    communications = get_recent_communications(comm_type="email", direction="przychodzący", limit=10)
+    # Get recent communications, one page at a time
+    cursor = pagination.current_cursor("inbox")
+    communications, next_cursor = get_recent_communications(
+        comm_type="email", direction="przychodzący", cursor=cursor, limit=10
+    )
     
     if not communications:
         st.info("Brak nowych wiadomości w skrzynce odbiorczej.")
@@ -54,6 +65,7 @@ def render_inbox():
             col1, col2 = st.columns([3, 1])
             
             with col1:
+                st.checkbox("Zaznacz", key=f"select_{comm['id']}")
                 st.write(f"**Od:** {comm['from_name']} ({comm['from_email']})")
                 st.write(f"**Data:** {comm['data_czas'].strftime('%d.%m.%Y %H:%M')}")
                 st.write(f"**Temat:** {comm['subject']}")
@@ -88,6 +100,46 @@ def render_inbox():
             st.markdown("---")
             st.write("**Treść wiadomości:**")
             st.write(comm['treść'])
+    
+    render_bulk_actions([comm['id'] for comm in communications])
+    
+    pagination.render_page_controls("inbox", next_cursor)
+
+
+def render_bulk_actions(page_ids):
+    """Render actions applied in one statement to the selected messages (or the whole page)."""
+    selected = [comm_id for comm_id in page_ids if st.session_state.get(f"select_{comm_id}")]
+    target = selected or page_ids
+    label = f"zaznaczone ({len(selected)})" if selected else f"całą stronę ({len(page_ids)})"
+    
+    st.write(f"**Akcje dla:** {label}")
+    col1, col2, col3, col4 = st.columns([1, 1, 2, 1])
+    
+    with col1:
+        if st.button("Oznacz jako przeczytane", key="bulk_mark_read"):
+            count = communication_service.CommunicationManager.update_communication_statuses(target, "przeczytane")
+            st.success(f"Oznaczono {count} wiadomości jako przeczytane")
+            st.experimental_rerun()
+    
+    with col2:
+        if st.button("Archiwizuj", key="bulk_archive"):
+            count = communication_service.CommunicationManager.update_communication_statuses(target, "zarchiwizowane")
+            st.success(f"Zarchiwizowano {count} wiadomości")
+            st.experimental_rerun()
+    
+    with col3:
+        category = st.selectbox(
+            "Kategoria",
+            options=communication_service.CLASSIFICATION_CATEGORIES,
+            key="bulk_category",
+            label_visibility="collapsed"
+        )
+    
+    with col4:
+        if st.button("Zmień kategorię", key="bulk_categorize"):
+            count = communication_service.CommunicationManager.categorize_communications(target, category)
+            st.success(f"Zmieniono kategorię {count} wiadomości")
+            st.experimental_rerun()
 
 
 def render_send_message():
@@ -206,14 +258,20 @@ def render_communication_history():
         index=0
     )
     
-    # Get communications for selected client
-    communications = get_client_communications(
+    # Get communications for selected client, one page at a time
+    comm_type = None if comm_type == "wszystkie" else comm_type
+    cursor = pagination.current_cursor("communication_history", filters=(selected_client_id, comm_type))
+    communications, next_cursor = get_client_communications_page(
         client_id=selected_client_id,
-        comm_type=None if comm_type == "wszystkie" else comm_type
+        comm_type=comm_type,
+        cursor=cursor
     )
     
+    with st.expander("Eksport całej komunikacji"):
+        export.render_export_button("komunikacja", key="communication_export")
+    
     if not communications:
-        st.info(f"Brak historii komunikacji dla wybranego klienta{' i typu komunikacji' if comm_type != 'wszystkie' else ''}.")
+        st.info(f"Brak historii komunikacji dla wybranego klienta{' i typu komunikacji' if comm_type else ''}.")
         return
     
     # Convert to DataFrame for display
@@ -228,6 +286,7 @@ def render_communication_history():
         display_df['Data'] = display_df['Data'].dt.strftime('%d.%m.%Y %H:%M')
         
         st.dataframe(display_df, use_container_width=True)
+        pagination.render_page_controls("communication_history", next_cursor)
         
         # Allow selecting a communication for details
         selected_comm_id = st.selectbox(
@@ -561,7 +620,7 @@ def get_clients():
     """Get all clients from the database."""
     try:
         query = "SELECT id, nazwa, email, telefon FROM klienci ORDER BY nazwa"
-        result = db.execute_query(query)
+        result = db.cached_query(query)
         return result if result else []
     except Exception as e:
         logger.error(f"Error getting clients: {str(e)}")
@@ -578,32 +637,21 @@ def get_client_communications(client_id, comm_type=None, limit=50, offset=0):
     )
 
 
-def get_recent_communications(comm_type=None, direction=None, limit=10):
-    """Get recent communications."""
-    try:
-        query = """
-        SELECT k.id as id_komunikacji, k.*, c.nazwa as from_name, c.email as from_email,
-               CASE WHEN k.treść LIKE '%\n%' THEN SUBSTRING(k.treść, 1, POSITION('\n' IN k.treść) - 1) ELSE k.treść END as subject
-        FROM komunikacja k
-        JOIN klienci c ON k.id_klienta = c.id
-        WHERE 1=1
-        """
-        
-        params = []
-        
-        if comm_type:
-            query += " AND k.typ = %s"
-            params.append(comm_type)
-        
-        if direction:
-            query += " AND k.kierunek = %s"
-            params.append(direction)
-        
-        query += " ORDER BY k.data_czas DESC LIMIT %s"
-        params.append(limit)
-        
-        result = db.execute_query(query, params)
-        return result if result else []
-    except Exception as e:
-        logger.error(f"Error getting recent communications: {str(e)}")
-        return []
+def get_client_communications_page(client_id, comm_type=None, cursor=None, limit=50):
+    """Get a page of communications for a specific client. Returns (communications, next_cursor)."""
+    return communication_service.CommunicationManager.get_client_communications_page(
+        client_id=client_id,
+        comm_type=comm_type,
+        cursor=cursor,
+        limit=limit
+    )
+
+
+def get_recent_communications(comm_type=None, direction=None, cursor=None, limit=10):
+    """Get a page of recent communications. Returns (communications, next_cursor)."""
+    return communication_service.CommunicationManager.get_recent_communications(
+        comm_type=comm_type,
+        direction=direction,
+        cursor=cursor,
+        limit=limit
+    )
@@ -2,8 +2,41 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from utils import db
+from components import ui_cache
+
+def orders_by_status_figure(orders_by_status):
+    """Pie chart of the service orders by status."""
+    fig = px.pie(
+        pd.DataFrame(orders_by_status),
+        values='count',
+        names='status',
+        color_discrete_sequence=px.colors.qualitative.Plotly
+    )
+    fig.update_traces(textposition='inside', textinfo='percent+label')
+    fig.update_layout(margin=dict(t=0, b=0, l=0, r=0))
+    return fig
+
+def activity_figure():
+    """Line chart of the activity in the last 30 days."""
+    # Generate sample data for activity chart (placeholder)
+    dates = [(datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(30, 0, -1)]
+    values = [5, 7, 3, 8, 10, 6, 4, 7, 8, 5, 3, 6, 9, 11, 7, 5, 4, 6, 8, 9, 7, 5, 3, 6, 8, 10, 7, 5, 4, 6]
+    
+    df_activity = pd.DataFrame({
+        'date': dates,
+        'value': values
+    })
+    
+    fig = px.line(
+        df_activity,
+        x='date',
+        y='value',
+        title=None
+    )
+    fig.update_layout(margin=dict(t=0, b=0, l=0, r=0))
+    return fig
 
 def render():
     """Render the dashboard page."""
@@ -50,19 +83,13 @@ def render():
     with col_left:
         st.subheader("Zlecenia według statusu")
         
-        # Convert orders by status to DataFrame
-        df_status = pd.DataFrame(metrics['orders_by_status'])
-        
-        if not df_status.empty:
-            # Create a pie chart
-            fig = px.pie(
-                df_status,
-                values='count',
-                names='status',
-                color_discrete_sequence=px.colors.qualitative.Plotly
+        if metrics['orders_by_status']:
+            # Rebuilt only when the counts change (see components/ui_cache.py)
+            counts = tuple((row['status'], row['count']) for row in metrics['orders_by_status'])
+            fig = ui_cache.session_figure(
+                "dashboard_orders_by_status", lambda: orders_by_status_figure(metrics['orders_by_status']),
+                deps=counts
             )
-            fig.update_traces(textposition='inside', textinfo='percent+label')
-            fig.update_layout(margin=dict(t=0, b=0, l=0, r=0))
             
             st.plotly_chart(fig, use_container_width=True)
         else:
@@ -71,23 +98,7 @@ def render():
     with col_right:
         st.subheader("Aktywność w ostatnim miesiącu")
         
-        # Generate sample data for activity chart (placeholder)
-        dates = [(datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(30, 0, -1)]
-        values = [5, 7, 3, 8, 10, 6, 4, 7, 8, 5, 3, 6, 9, 11, 7, 5, 4, 6, 8, 9, 7, 5, 3, 6, 8, 10, 7, 5, 4, 6]
-        
-        df_activity = pd.DataFrame({
-            'date': dates,
-            'value': values
-        })
-        
-        # Create a line chart
-        fig = px.line(
-            df_activity,
-            x='date',
-            y='value',
-            title=None
-        )
-        fig.update_layout(margin=dict(t=0, b=0, l=0, r=0))
+        fig = ui_cache.session_figure("dashboard_activity", activity_figure, deps=date.today())
         
         st.plotly_chart(fig, use_container_width=True)
     
@@ -14,6 +14,7 @@ from io import BytesIO
 
 from services import voice_communication
 from utils import db
+from components import ui_cache
 
 logger = logging.getLogger(__name__)
 
@@ -63,6 +64,10 @@ def render_voice_messages():
     # Get clients for dropdown
     clients = get_clients()
     
+    if clients is None:
+        st.error("Nie udało się pobrać listy klientów.")
+        return
+    
     if not clients:
         st.warning("Brak klientów w bazie danych. Dodaj klienta, aby wysłać wiadomość głosową.")
         return
@@ -148,7 +153,9 @@ def render_voice_messages():
     # Get recent voice messages (placeholder)
     voice_messages = get_voice_messages(client_id=selected_client_id)
     
-    if not voice_messages:
+    if voice_messages is None:
+        st.error("Nie udało się pobrać wiadomości głosowych.")
+    elif not voice_messages:
         st.info("Brak wiadomości głosowych dla wybranego klienta.")
     else:
         for msg in voice_messages:
@@ -343,18 +350,8 @@ def render_voice_assistant():
                 st.write("**Odpowiedź asystenta:**")
                 st.write("Generuję raport miesięczny...")
                 
-                # Display sample chart
-                import numpy as np
-                import pandas as pd
-                import plotly.express as px
-                
-                # Sample data
-                dates = pd.date_range(start='2023-01-01', end='2023-01-31', freq='D')
-                values = np.random.randint(1, 10, size=len(dates))
-                df = pd.DataFrame({'Data': dates, 'Liczba zleceń': values})
-                
-                # Create chart
-                fig = px.line(df, x='Data', y='Liczba zleceń', title='Liczba zleceń w styczniu 2023')
+                # Display sample chart (kept for the session, so reruns show the same report)
+                fig = ui_cache.session_figure("voice_monthly_report", monthly_report_figure)
                 st.plotly_chart(fig)
                 
                 # Generate voice response
@@ -362,20 +359,35 @@ def render_voice_assistant():
 
 
 # Helper functions
+def monthly_report_figure():
+    """Sample chart of the monthly report command."""
+    import numpy as np
+    import pandas as pd
+    import plotly.express as px
+    
+    # Sample data
+    dates = pd.date_range(start='2023-01-01', end='2023-01-31', freq='D')
+    values = np.random.randint(1, 10, size=len(dates))
+    df = pd.DataFrame({'Data': dates, 'Liczba zleceń': values})
+    
+    return px.line(df, x='Data', y='Liczba zleceń', title='Liczba zleceń w styczniu 2023')
+
+
+@ui_cache.cached_data("klienci")
 def get_clients(limit=None):
-    """Get clients from the database."""
+    """Get clients from the database (None on error, so the failure isn't cached)."""
     try:
         query = "SELECT id, nazwa, email, telefon FROM klienci ORDER BY nazwa"
         if limit:
             query += f" LIMIT {limit}"
         
-        result = db.execute_query(query)
-        return result if result else []
+        return db.execute_query(query)
     except Exception as e:
         logger.error(f"Error getting clients: {str(e)}")
-        return []
+        return None
 
 
+@ui_cache.cached_data("komunikacja")
 def get_voice_messages(client_id=None, limit=5):
     """Get voice messages from the database."""
     try:
@@ -396,11 +408,10 @@ def get_voice_messages(client_id=None, limit=5):
             query += " LIMIT %s"
             params.append(limit)
         
-        result = db.execute_query(query, params)
-        return result if result else []
+        return db.execute_query(query, params)
     except Exception as e:
         logger.error(f"Error getting voice messages: {str(e)}")
-        return []
+        return None
 
 
 def generate_assistant_response(text):
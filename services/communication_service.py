@@ -16,11 +16,18 @@ Features:
 import os
 import logging
 import json
+import time
+import random
+from email.utils import parsedate_to_datetime
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional, Union, Tuple
+from typing import List, Dict, Any, Optional, Union, Tuple, Iterable, Callable
 
 from services import email_service
 from utils import db
+from utils import cache
+from utils import client_index
+from utils import prepared
+from utils.pagination import Keyset, MIN_TIMESTAMP
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -29,11 +36,76 @@ logger = logging.getLogger(__name__)
 ENABLE_EMAIL = os.getenv("ENABLE_EMAIL", "True").lower() == "true"
 ENABLE_SMS = os.getenv("ENABLE_SMS", "False").lower() == "true"
 ENABLE_LLM = os.getenv("ENABLE_LLM", "True").lower() == "true"
+ENABLE_EMAIL_IDLE = os.getenv("ENABLE_EMAIL_IDLE", "False").lower() == "true"
+# Seconds between sweeps of attachment spool files no communication references
+EMAIL_SPOOL_CLEANUP_INTERVAL = float(os.getenv("EMAIL_SPOOL_CLEANUP_INTERVAL", "3600"))
+_last_spool_cleanup = float('-inf')
+
+
+# Newest first; matches the komunikacja indexes from migration 004
+COMMUNICATION_KEYSET = Keyset("komunikacja", f"COALESCE(data_czas, {MIN_TIMESTAMP})", "id", descending=True)
+
+# Categories assigned by classification
+CLASSIFICATION_CATEGORIES = ["zapytanie", "reklamacja", "podziękowanie", "zamówienie", "inne"]
+
+# Categories of outgoing emails sent through the queue (see send_bulk_template_email)
+QUEUED_CATEGORY = "w kolejce"
+SENT_CATEGORY = "wysłany"
+SEND_FAILED_CATEGORY = "błąd wysyłki"
+
+# Columns written for every komunikacja record, in insert order
+COMMUNICATION_COLUMNS = [
+    "id_klienta", "typ", "kierunek", "data_czas", "treść", "transkrypcja",
+    "kategoria", "status", "załączniki", "analiza_sentymentu", "klasyfikacja"
+]
+
+# Single-record insert, run for every stored email/SMS/call, as a prepared
+# statement; the client's score features are updated by a trigger
+SAVE_COMMUNICATION = prepared.register("zapisz_komunikacje", f"""
+INSERT INTO komunikacja ({", ".join(COMMUNICATION_COLUMNS)})
+VALUES ({", ".join(f"%({column})s" for column in COMMUNICATION_COLUMNS)})
+RETURNING id
+""")
 
 
 class CommunicationManager:
     """Class for managing all types of communication."""
     
+    @staticmethod
+    def build_communication_record(
+        client_id: int,
+        comm_type: str,
+        direction: str,
+        content: str,
+        category: str = None,
+        attachments: List[Dict[str, Any]] = None,
+        sentiment_score: float = None,
+        classification: str = None,
+        transcription: str = None,
+        timestamp: datetime = None
+    ) -> Dict[str, Any]:
+        """Build the komunikacja row for a communication."""
+        # Only attachment metadata is stored; file contents are not JSON-serializable
+        if attachments:
+            attachments = [
+                {key: value for key, value in attachment.items() if key != "content"}
+                for attachment in attachments
+            ]
+        
+        return {
+            "id_klienta": client_id,
+            "typ": comm_type,  # email, telefon, SMS
+            "kierunek": direction,  # przychodzący/wychodzący
+            "data_czas": timestamp or datetime.now(),
+            "treść": content,
+            "transkrypcja": transcription,
+            "kategoria": category,
+            "status": "nowy",
+            "załączniki": json.dumps(attachments) if attachments else None,
+            "analiza_sentymentu": sentiment_score,
+            "klasyfikacja": classification
+        }
+    
     @staticmethod
     def save_communication(
         client_id: int,
@@ -44,39 +116,29 @@ class CommunicationManager:
         attachments: List[Dict[str, Any]] = None,
         sentiment_score: float = None,
         classification: str = None,
-        transcription: str = None
+        transcription: str = None,
+        timestamp: datetime = None
     ) -> int:
         """Save a communication record to the database."""
         try:
-            # Convert attachments to JSON if provided
-            attachments_json = json.dumps(attachments) if attachments else None
-            
-            # Create communication data dictionary
-            communication_data = {
-                "id_klienta": client_id,
-                "typ": comm_type,  # email, telefon, SMS
-                "kierunek": direction,  # przychodzący/wychodzący
-                "data_czas": datetime.now(),
-                "treść": content,
-                "transkrypcja": transcription,
-                "kategoria": category,
-                "status": "nowy",
-                "załączniki": attachments_json,
-                "analiza_sentymentu": sentiment_score,
-                "klasyfikacja": classification
-            }
+            communication_data = CommunicationManager.build_communication_record(
+                client_id=client_id,
+                comm_type=comm_type,
+                direction=direction,
+                content=content,
+                category=category,
+                attachments=attachments,
+                sentiment_score=sentiment_score,
+                classification=classification,
+                transcription=transcription,
+                timestamp=timestamp
+            )
             
             # Save to database
-            query = """
-            INSERT INTO komunikacja 
-            (id_klienta, typ, kierunek, data_czas, treść, transkrypcja, kategoria, status, załączniki, analiza_sentymentu, klasyfikacja)
-            VALUES 
-            (%(id_klienta)s, %(typ)s, %(kierunek)s, %(data_czas)s, %(treść)s, %(transkrypcja)s, %(kategoria)s, %(status)s, %(załączniki)s, %(analiza_sentymentu)s, %(klasyfikacja)s)
-            RETURNING id
-            """
-            
-            result = db.execute_query(query, communication_data)
+            result = db.execute_query(SAVE_COMMUNICATION, communication_data)
             communication_id = result[0]['id'] if result else None
+            if communication_id:
+                cache.invalidate("komunikacja")
             
             logger.info(f"Communication saved with ID: {communication_id}")
             return communication_id
@@ -85,6 +147,35 @@ class CommunicationManager:
             logger.error(f"Error saving communication: {str(e)}")
             return None
     
+    @staticmethod
+    def save_communications(records: List[Dict[str, Any]], page_size: int = 500) -> List[int]:
+        """Save many communication records (see build_communication_record) with batched INSERTs."""
+        if not records:
+            return []
+        
+        try:
+            # One multi-row INSERT per page; the score features are updated by a trigger
+            query = f"""
+            INSERT INTO komunikacja ({", ".join(COMMUNICATION_COLUMNS)})
+            VALUES %s
+            RETURNING id
+            """
+            template = "(" + ", ".join(f"%({column})s" for column in COMMUNICATION_COLUMNS) + ")"
+            
+            result = db.execute_values_query(query, records, template=template, page_size=page_size)
+            if result is None:
+                logger.error(f"Failed to save {len(records)} communications")
+                return []
+            
+            communication_ids = [row["id"] for row in result]
+            cache.invalidate("komunikacja")
+            logger.info(f"Saved {len(communication_ids)} communications")
+            return communication_ids
+        
+        except Exception as e:
+            logger.error(f"Error saving communications: {str(e)}")
+            return []
+    
     @staticmethod
     def get_client_communications(
         client_id: int,
@@ -108,19 +199,84 @@ class CommunicationManager:
             query += " ORDER BY data_czas DESC LIMIT %s OFFSET %s"
             params.extend([limit, offset])
             
-            result = db.execute_query(query, params)
+            result = db.cached_query(query, params)
             return result if result else []
         
         except Exception as e:
             logger.error(f"Error getting client communications: {str(e)}")
             return []
     
+    @staticmethod
+    def get_client_communications_page(
+        client_id: int,
+        comm_type: str = None,
+        cursor: str = None,
+        limit: int = 50
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Get the page of a client's communications after ``cursor`` (newest first).
+        
+        Returns ``(communications, next_cursor)``; ``next_cursor`` is None on the last page.
+        """
+        try:
+            query = "SELECT * FROM komunikacja WHERE id_klienta = %s"
+            params = [client_id]
+            
+            if comm_type:
+                query += " AND typ = %s"
+                params.append(comm_type)
+            
+            return db.fetch_page(COMMUNICATION_KEYSET, query, params, cursor, limit)
+        
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"Error getting client communications: {str(e)}")
+            return [], None
+    
+    @staticmethod
+    def get_recent_communications(
+        comm_type: str = None,
+        direction: str = None,
+        cursor: str = None,
+        limit: int = 10
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Get the page of all clients' communications after ``cursor`` (newest first).
+        
+        Rows include the client's name and email (``from_name``/``from_email``) and the
+        first line of the content as ``subject``. Returns ``(communications, next_cursor)``.
+        """
+        try:
+            query = """
+            SELECT k.id as id_komunikacji, k.*, c.nazwa as from_name, c.email as from_email,
+                   split_part(k.treść, chr(10), 1) as subject
+            FROM komunikacja k
+            JOIN klienci c ON k.id_klienta = c.id
+            WHERE 1=1
+            """
+            params = []
+            
+            if comm_type:
+                query += " AND k.typ = %s"
+                params.append(comm_type)
+            
+            if direction:
+                query += " AND k.kierunek = %s"
+                params.append(direction)
+            
+            return db.fetch_page(COMMUNICATION_KEYSET, query, params, cursor, limit)
+        
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"Error getting recent communications: {str(e)}")
+            return [], None
+    
     @staticmethod
     def get_communication_by_id(communication_id: int) -> Dict[str, Any]:
         """Get a specific communication by ID."""
         try:
             query = "SELECT * FROM komunikacja WHERE id = %s"
-            result = db.execute_query(query, [communication_id])
+            result = db.cached_query(query, [communication_id])
             return result[0] if result else None
         
         except Exception as e:
@@ -133,6 +289,7 @@ class CommunicationManager:
         try:
             query = "UPDATE komunikacja SET status = %s WHERE id = %s"
             db.execute_query(query, [status, communication_id], fetch=False)
+            cache.invalidate("komunikacja")
             logger.info(f"Communication {communication_id} status updated to {status}")
             return True
         
@@ -146,6 +303,7 @@ class CommunicationManager:
         try:
             query = "UPDATE komunikacja SET kategoria = %s WHERE id = %s"
             db.execute_query(query, [category, communication_id], fetch=False)
+            cache.invalidate("komunikacja")
             logger.info(f"Communication {communication_id} categorized as {category}")
             return True
         
@@ -153,6 +311,122 @@ class CommunicationManager:
             logger.error(f"Error categorizing communication: {str(e)}")
             return False
     
+    @staticmethod
+    def _pairs(updates: Iterable, value: Optional[str]) -> List[Tuple[int, str]]:
+        """Normalize ids (with a shared ``value``) or (id, value) pairs; the last value per id wins."""
+        if value is not None:
+            pairs = ((communication_id, value) for communication_id in updates)
+        else:
+            pairs = updates
+        return list({int(communication_id): item for communication_id, item in pairs}.items())
+    
+    @staticmethod
+    def _bulk_update(column: str, updates: Iterable, value: Optional[str]) -> int:
+        """Set ``column`` for many communications in one UPDATE ... FROM (VALUES ...) statement."""
+        pairs = CommunicationManager._pairs(updates, value)
+        if not pairs:
+            return 0
+        
+        query = f"""
+        UPDATE komunikacja k SET {column} = v.wartosc
+        FROM (VALUES %s) AS v(id, wartosc)
+        WHERE k.id = v.id
+        RETURNING k.id
+        """
+        # A single page, so the whole batch is one statement in one transaction
+        result = db.execute_values_query(query, pairs, template="(%s::integer, %s)", page_size=len(pairs))
+        if result is None:
+            raise RuntimeError(f"Bulk update of {column} failed")
+        cache.invalidate("komunikacja")
+        return len(result)
+    
+    @staticmethod
+    def update_communication_statuses(updates: Iterable, status: str = None) -> int:
+        """Update the status of many communications in one statement.
+        
+        ``updates`` is a list of ids, all set to ``status``, or of (id, status)
+        pairs. Returns the number of communications updated.
+        """
+        try:
+            count = CommunicationManager._bulk_update("status", updates, status)
+            logger.info(f"Updated status of {count} communications")
+            return count
+        
+        except Exception as e:
+            logger.error(f"Error updating communication statuses: {str(e)}")
+            return 0
+    
+    @staticmethod
+    def categorize_communications(updates: Iterable, category: str = None) -> int:
+        """Categorize many communications in one statement.
+        
+        ``updates`` is a list of ids, all set to ``category``, or of (id, category)
+        pairs. Returns the number of communications updated.
+        """
+        try:
+            count = CommunicationManager._bulk_update("kategoria", updates, category)
+            logger.info(f"Categorized {count} communications")
+            return count
+        
+        except Exception as e:
+            logger.error(f"Error categorizing communications: {str(e)}")
+            return 0
+    
+    @staticmethod
+    def referenced_attachments() -> Optional[set]:
+        """SHA-256 names of the spooled attachment files referenced by communications (None on error)."""
+        result = db.execute_query("""
+            SELECT DISTINCT a->>'sha256' AS sha256
+            FROM komunikacja k, jsonb_array_elements(k.załączniki::jsonb) a
+            WHERE k.załączniki IS NOT NULL AND jsonb_typeof(k.załączniki::jsonb) = 'array'
+              AND a ? 'path'
+        """)
+        if result is None:
+            return None
+        return {row['sha256'] for row in result if row['sha256']}
+    
+    @staticmethod
+    def mark_all_as_read(comm_type: str = None, direction: str = None) -> int:
+        """Mark every new communication (optionally of one type/direction) as read. Returns the count."""
+        try:
+            query = "UPDATE komunikacja SET status = 'przeczytane' WHERE status = 'nowy'"
+            params = []
+            
+            if comm_type:
+                query += " AND typ = %s"
+                params.append(comm_type)
+            
+            if direction:
+                query += " AND kierunek = %s"
+                params.append(direction)
+            
+            result = db.execute_query(query + " RETURNING id", params)
+            if result is None:
+                return 0
+            cache.invalidate("komunikacja")
+            logger.info(f"Marked {len(result)} communications as read")
+            return len(result)
+        
+        except Exception as e:
+            logger.error(f"Error marking communications as read: {str(e)}")
+            return 0
+    
+    @staticmethod
+    def score_sentiments(contents: List[str]) -> List[float]:
+        """Score the sentiment of many texts at once (-1 negative to 1 positive)."""
+        # This is a placeholder for actual sentiment analysis
+        # In a real implementation, you would send the batch to an LLM or sentiment analysis service
+        # For now, we'll return random scores between -1 and 1
+        return [random.uniform(-1, 1) for _ in contents]
+    
+    @staticmethod
+    def classify_contents(contents: List[str]) -> List[str]:
+        """Classify many texts at once into CLASSIFICATION_CATEGORIES."""
+        # This is a placeholder for actual classification
+        # In a real implementation, you would send the batch to an LLM or classification service
+        # For now, we'll randomly select from predefined categories
+        return [random.choice(CLASSIFICATION_CATEGORIES) for _ in contents]
+    
     @staticmethod
     def analyze_sentiment(communication_id: int, content: str) -> float:
         """Analyze the sentiment of a communication."""
@@ -161,15 +435,12 @@ class CommunicationManager:
             return None
         
         try:
-            # This is a placeholder for actual sentiment analysis
-            # In a real implementation, you would use an LLM or sentiment analysis service
-            # For now, we'll return a random score between -1 and 1
-            import random
-            sentiment_score = random.uniform(-1, 1)
+            sentiment_score = CommunicationManager.score_sentiments([content])[0]
             
             # Update the communication record
             query = "UPDATE komunikacja SET analiza_sentymentu = %s WHERE id = %s"
             db.execute_query(query, [sentiment_score, communication_id], fetch=False)
+            cache.invalidate("komunikacja")
             
             logger.info(f"Communication {communication_id} sentiment analyzed: {sentiment_score}")
             return sentiment_score
@@ -186,16 +457,12 @@ class CommunicationManager:
             return None
         
         try:
-            # This is a placeholder for actual classification
-            # In a real implementation, you would use an LLM or classification service
-            # For now, we'll randomly select from predefined categories
-            categories = ["zapytanie", "reklamacja", "podziękowanie", "zamówienie", "inne"]
-            import random
-            classification = random.choice(categories)
+            classification = CommunicationManager.classify_contents([content])[0]
             
             # Update the communication record
             query = "UPDATE komunikacja SET klasyfikacja = %s WHERE id = %s"
             db.execute_query(query, [classification, communication_id], fetch=False)
+            cache.invalidate("komunikacja")
             
             logger.info(f"Communication {communication_id} classified as {classification}")
             return classification
@@ -267,17 +534,15 @@ class EmailManager:
             return None
         
         try:
-            # Render the template
-            html_content = email_service.EmailTemplate.render_template(template_name, context)
+            # Render the template (compiled once and cached)
+            template = email_service.EmailTemplate.compile_template(template_name)
+            html_content = template.render(context) if template else ""
             
             if not html_content:
                 logger.error(f"Failed to render email template {template_name}")
                 return None
             
-            # Generate plain text from HTML (simple version)
-            import re
-            text_content = re.sub(r'<.*?>', '', html_content)
-            text_content = re.sub(r'\s+', ' ', text_content).strip()
+            text_content = template.render_text(context)
             
             # Send the email
             return EmailManager.send_email(
@@ -294,53 +559,154 @@ class EmailManager:
             return None
     
     @staticmethod
-    def process_incoming_emails(limit: int = 10) -> List[int]:
+    def send_bulk_template_email(
+        template_name: str,
+        subject: str,
+        recipients: Iterable[Tuple[Dict[str, Any], Dict[str, Any]]],
+        attachments: List[Dict[str, Any]] = None,
+        priority: int = 3,
+        batch_size: int = 500,
+        progress_callback: Callable[[int, int, int], None] = None
+    ) -> Dict[str, Any]:
+        """Queue one template for many clients.
+        
+        ``recipients`` yields ``(client, context)`` pairs, where ``client`` has
+        at least ``id`` and ``email``. The template (and ``{{key}}``
+        placeholders in the subject) are compiled once. Attachments are
+        spooled to disk once and every message references them. Each batch of
+        ``batch_size`` messages is recorded with one INSERT (category
+        ``QUEUED_CATEGORY``) and then handed to the SMTP sender workers, which
+        set the category to ``SENT_CATEGORY`` or ``SEND_FAILED_CATEGORY`` once
+        the message was delivered or gave up.
+        ``progress_callback(processed, queued, failed)`` is called after each
+        batch.
+        
+        Returns a report with counts, the enqueueing rate and per-recipient
+        failures; delivery happens afterwards, see the records' category.
+        """
+        if not ENABLE_EMAIL:
+            logger.warning("Email functionality is disabled.")
+            return None
+        
+        template = email_service.EmailTemplate.compile_template(template_name)
+        if template is None:
+            logger.error(f"Failed to load email template {template_name}")
+            return None
+        subject_template = email_service.CompiledTemplate(subject)
+        
+        # One copy of the attachment bytes on disk, referenced by every queued message
+        try:
+            attachments = [email_service.spool_attachment(attachment) for attachment in attachments or []] or None
+        except Exception as e:
+            logger.error(f"Failed to spool attachments for bulk email {template_name}: {str(e)}")
+            return None
+        
+        started = time.monotonic()
+        report = {
+            "processed": 0,
+            "queued": 0,
+            "failed": [],
+            "communication_ids": [],
+            "unsaved_records": 0
+        }
+        pending = []  # (client, message, record)
+        
+        def flush():
+            if not pending:
+                return
+            communication_ids = CommunicationManager.save_communications(
+                [record for _, _, record in pending], page_size=batch_size
+            )
+            if len(communication_ids) != len(pending):
+                # Still sent, but without records to track the delivery in
+                report["unsaved_records"] += len(pending) - len(communication_ids)
+                communication_ids = [None] * len(pending)
+            
+            not_queued = []
+            for (client, message, _), communication_id in zip(pending, communication_ids):
+                try:
+                    email_service.EmailSender.queue_email(
+                        **message, priority=priority, communication_id=communication_id
+                    )
+                except Exception as e:
+                    logger.error(f"Queueing bulk email to client {client.get('id')} failed: {str(e)}")
+                    report["failed"].append({"client_id": client.get("id"), "email": message["to_emails"], "error": str(e)})
+                    if communication_id is not None:
+                        not_queued.append(communication_id)
+                else:
+                    report["queued"] += 1
+                    if communication_id is not None:
+                        report["communication_ids"].append(communication_id)
+            if not_queued:
+                CommunicationManager.categorize_communications(not_queued, SEND_FAILED_CATEGORY)
+            pending.clear()
+            
+            if progress_callback:
+                progress_callback(report["processed"], report["queued"], len(report["failed"]))
+        
+        for client, context in recipients:
+            report["processed"] += 1
+            to_email = client.get("email")
+            
+            try:
+                if not to_email:
+                    raise ValueError("client has no email address")
+                
+                text_content = template.render_text(context)
+                message = {
+                    "subject": subject_template.render(context),
+                    "to_emails": to_email,
+                    "text_content": text_content,
+                    "html_content": template.render(context),
+                    "attachments": attachments,
+                }
+            except Exception as e:
+                logger.error(f"Bulk email to client {client.get('id')} failed: {str(e)}")
+                report["failed"].append({"client_id": client.get("id"), "email": to_email, "error": str(e)})
+                continue
+            
+            pending.append((client, message, CommunicationManager.build_communication_record(
+                client_id=client.get("id"),
+                comm_type="email",
+                direction="wychodzący",
+                content=text_content,
+                category=QUEUED_CATEGORY,
+                attachments=attachments
+            )))
+            if len(pending) >= batch_size:
+                flush()
+        
+        flush()
+        
+        elapsed = time.monotonic() - started
+        report["elapsed_seconds"] = elapsed
+        report["queued_per_second"] = report["queued"] / elapsed if elapsed > 0 else 0.0
+        
+        logger.info(
+            f"Bulk email {template_name}: {report['queued']} queued, {len(report['failed'])} failed "
+            f"in {elapsed:.1f}s ({report['queued_per_second']:.1f}/s)"
+        )
+        return report
+    
+    @staticmethod
+    def process_incoming_emails(limit: int = 10, folder: str = "INBOX") -> List[int]:
         """Process incoming emails and save them as communications."""
         if not ENABLE_EMAIL:
             logger.warning("Email functionality is disabled.")
             return []
         
         try:
-            # Get incoming emails
-            emails = email_service.process_incoming_emails(limit=limit)
+            # Get incoming emails; the sync position is only advanced once they are saved
+            emails, position = email_service.process_incoming_emails(limit=limit, folder=folder)
             
             if not emails:
+                email_service.commit_incoming_emails(position)
                 logger.info("No new emails to process")
                 return []
             
-            communication_ids = []
-            
-            for email_data in emails:
-                # Extract email information
-                from_email = email_data["from"]
-                subject = email_data["subject"]
-                body = email_data["body"]
-                
-                # Find the client by email
-                query = "SELECT id FROM klienci WHERE email = %s"
-                result = db.execute_query(query, [from_email])
-                
-                if not result:
-                    logger.warning(f"No client found with email {from_email}")
-                    continue
-                
-                client_id = result[0]["id"]
-                
-                # Save the communication
-                communication_id = CommunicationManager.save_communication(
-                    client_id=client_id,
-                    comm_type="email",
-                    direction="przychodzący",
-                    content=body,
-                    category="odebrany"
-                )
-                
-                if communication_id:
-                    communication_ids.append(communication_id)
-                    
-                    # Analyze sentiment and classify
-                    CommunicationManager.analyze_sentiment(communication_id, body)
-                    CommunicationManager.classify_communication(communication_id, body)
+            communication_ids = EmailManager.ingest_emails(emails)
+            email_service.commit_incoming_emails(position)
+            cleanup_attachment_spool(EMAIL_SPOOL_CLEANUP_INTERVAL)
             
             logger.info(f"Processed {len(communication_ids)} incoming emails")
             return communication_ids
@@ -348,6 +714,118 @@ class EmailManager:
         except Exception as e:
             logger.error(f"Error processing incoming emails: {str(e)}")
             return []
+    
+    @staticmethod
+    def received_at(date_header: str) -> datetime:
+        """Convert an email Date header to a local naive datetime (now if missing or invalid)."""
+        try:
+            received = parsedate_to_datetime(date_header)
+        except (TypeError, ValueError, IndexError):
+            return datetime.now()
+        if received is None:
+            return datetime.now()
+        if received.tzinfo is not None:
+            received = received.astimezone().replace(tzinfo=None)
+        return received
+    
+    @staticmethod
+    def resolve_senders(from_headers: List[str]) -> Dict[str, int]:
+        """Map sender addresses (normalized) to client ids using the in-memory client index."""
+        return client_index.lookup_emails(from_headers)
+    
+    @staticmethod
+    def ingest_emails(emails: List[Dict[str, Any]], page_size: int = 500) -> List[int]:
+        """Save received emails from known clients as communications in one batch.
+        
+        Senders are resolved with a single lookup, sentiment and classification
+        are scored for the whole batch, and the rows are written with one
+        multi-row INSERT ... RETURNING per ``page_size`` emails.
+        """
+        if not emails:
+            return []
+        
+        client_ids = EmailManager.resolve_senders([email_data.get("from") for email_data in emails])
+        
+        known = []
+        unknown = set()
+        for email_data in emails:
+            address = client_index.normalize_email(email_data.get("from"))
+            client_id = client_ids.get(address)
+            if client_id is None:
+                unknown.add(address or email_data.get("from"))
+                continue
+            body = email_data.get("body") or email_data.get("body_text") or email_data.get("body_html") or ""
+            # Every attachment is kept in the spool; the record stores its handle
+            attachments = [email_service.spool_attachment(attachment) for attachment in email_data.get("attachments") or []]
+            known.append((client_id, body, EmailManager.received_at(email_data.get("date")), attachments))
+        
+        if unknown:
+            logger.warning(f"No client found for {len(unknown)} sender(s): {', '.join(sorted(map(str, unknown))[:10])}")
+        if not known:
+            return []
+        
+        contents = [body for _, body, _, _ in known]
+        if ENABLE_LLM:
+            sentiments = CommunicationManager.score_sentiments(contents)
+            classifications = CommunicationManager.classify_contents(contents)
+        else:
+            sentiments = classifications = [None] * len(known)
+        
+        records = [
+            CommunicationManager.build_communication_record(
+                client_id=client_id,
+                comm_type="email",
+                direction="przychodzący",
+                content=body,
+                category="odebrany",
+                sentiment_score=sentiment,
+                classification=classification,
+                timestamp=received,
+                attachments=attachments
+            )
+            for (client_id, body, received, attachments), sentiment, classification
+            in zip(known, sentiments, classifications)
+        ]
+        communication_ids = CommunicationManager.save_communications(records, page_size=page_size)
+        if len(communication_ids) != len(records):
+            # Callers keep the mailbox position, so the emails are fetched again
+            raise RuntimeError(f"Failed to save {len(records) - len(communication_ids)} of {len(records)} emails")
+        return communication_ids
+    
+    @staticmethod
+    def backfill_mailbox(
+        folder: str = "INBOX",
+        since_date: datetime = None,
+        chunk_size: int = 200,
+        progress_callback: Callable[[int, int, int], None] = None
+    ) -> Dict[str, Any]:
+        """Import the existing contents of a mailbox as communications.
+        
+        Messages are fetched and ingested ``chunk_size`` at a time, so memory
+        use stays flat for large mailboxes. Flags and the incremental sync
+        position are not touched. ``progress_callback(done, total, saved)`` is
+        called after each chunk.
+        """
+        criteria = f'SINCE "{since_date.strftime("%d-%b-%Y")}"' if since_date else "ALL"
+        uids = email_service.EmailReceiver.search_uids(folder=folder, criteria=criteria)
+        
+        started = time.monotonic()
+        report = {"total": len(uids), "fetched": 0, "saved": 0}
+        
+        for start in range(0, len(uids), chunk_size):
+            emails = email_service.EmailReceiver.fetch_messages(uids[start:start + chunk_size], folder=folder)
+            report["fetched"] += len(emails)
+            report["saved"] += len(EmailManager.ingest_emails(emails))
+            
+            if progress_callback:
+                progress_callback(min(start + chunk_size, len(uids)), len(uids), report["saved"])
+        
+        report["elapsed_seconds"] = time.monotonic() - started
+        logger.info(
+            f"Backfilled {report['saved']} communications from {report['fetched']} emails "
+            f"in {folder} in {report['elapsed_seconds']:.1f}s"
+        )
+        return report
 
 
 class SMSManager:
@@ -355,16 +833,22 @@ class SMSManager:
     
     @staticmethod
     def send_sms(
-        client_id: int,
+        client_id: Optional[int],
         content: str,
         phone_number: str
     ) -> int:
-        """Send an SMS and save it as a communication."""
+        """Send an SMS and save it as a communication (client resolved from the number if not given)."""
         if not ENABLE_SMS:
             logger.warning("SMS functionality is disabled.")
             return None
         
         try:
+            if client_id is None:
+                client_id = client_index.lookup_phone(phone_number)
+                if client_id is None:
+                    logger.warning(f"No client found with phone number {phone_number}")
+                    return None
+            
             # This is a placeholder for actual SMS sending
             # In a real implementation, you would use a service like Twilio
             logger.info(f"Sending SMS to {phone_number}: {content}")
@@ -383,6 +867,30 @@ class SMSManager:
         except Exception as e:
             logger.error(f"Error sending SMS: {str(e)}")
             return None
+    
+    @staticmethod
+    def receive_sms(phone_number: str, content: str, received_at: datetime = None) -> int:
+        """Save an incoming SMS from a client identified by the sender's number."""
+        client_id = client_index.lookup_phone(phone_number)
+        if client_id is None:
+            logger.warning(f"No client found with phone number {phone_number}")
+            return None
+        
+        sentiment_score = classification = None
+        if ENABLE_LLM:
+            sentiment_score = CommunicationManager.score_sentiments([content])[0]
+            classification = CommunicationManager.classify_contents([content])[0]
+        
+        return CommunicationManager.save_communication(
+            client_id=client_id,
+            comm_type="SMS",
+            direction="przychodzący",
+            content=content,
+            category="odebrany",
+            sentiment_score=sentiment_score,
+            classification=classification,
+            timestamp=received_at
+        )
 
 
 class PhoneCallManager:
@@ -390,13 +898,30 @@ class PhoneCallManager:
     
     @staticmethod
     def save_call_transcription(
-        client_id: int,
+        client_id: Optional[int],
         transcription: str,
         call_duration: int = None,
-        call_date: datetime = None
+        call_date: datetime = None,
+        phone_number: str = None
     ) -> int:
-        """Save a phone call transcription as a communication."""
+        """Save a phone call transcription as a communication.
+        
+        Pass ``client_id=None`` with the caller's ``phone_number`` to resolve
+        the client from the number.
+        """
         try:
+            if client_id is None:
+                client_id = client_index.lookup_phone(phone_number)
+                if client_id is None:
+                    logger.warning(f"No client found with phone number {phone_number}")
+                    return None
+            
+            # Analyze sentiment and classify before saving, so it is a single INSERT
+            sentiment_score = classification = None
+            if ENABLE_LLM:
+                sentiment_score = CommunicationManager.score_sentiments([transcription])[0]
+                classification = CommunicationManager.classify_contents([transcription])[0]
+            
             # Save the communication record
             communication_id = CommunicationManager.save_communication(
                 client_id=client_id,
@@ -404,14 +929,12 @@ class PhoneCallManager:
                 direction="przychodzący",  # This could be parameterized
                 content=f"Rozmowa telefoniczna, czas trwania: {call_duration} sekund",
                 category="transkrypcja",
-                transcription=transcription
+                sentiment_score=sentiment_score,
+                classification=classification,
+                transcription=transcription,
+                timestamp=call_date
             )
             
-            if communication_id:
-                # Analyze sentiment and classify
-                CommunicationManager.analyze_sentiment(communication_id, transcription)
-                CommunicationManager.classify_communication(communication_id, transcription)
-            
             return communication_id
         
         except Exception as e:
@@ -543,9 +1066,63 @@ def process_incoming_communications():
     }
 
 
+def start_inbound_listener(folder: str = "INBOX", limit: int = 100):
+    """Ingest new emails as soon as the mail server reports them (IMAP IDLE)."""
+    if not ENABLE_EMAIL:
+        logger.warning("Email functionality is disabled.")
+        return None
+
+    def on_new_mail():
+        # Drain everything that arrived; each pass syncs at most ``limit`` messages
+        while True:
+            position = email_service.get_mailbox_state().get(folder)
+            EmailManager.process_incoming_emails(limit=limit, folder=folder)
+            if email_service.get_mailbox_state().get(folder) == position:
+                break
+
+    return email_service.start_idle_listener(on_new_mail, folder=folder)
+
+
+def cleanup_attachment_spool(min_interval: float = 0) -> int:
+    """Delete spooled attachment files that no communication references.
+
+    With ``min_interval`` the sweep is skipped if the last one ran less than
+    that many seconds ago. Returns the number of files removed.
+    """
+    global _last_spool_cleanup
+    if time.monotonic() - _last_spool_cleanup < min_interval:
+        return 0
+    _last_spool_cleanup = time.monotonic()
+    
+    referenced = CommunicationManager.referenced_attachments()
+    if referenced is None:
+        # Without the references every file would look unused
+        logger.error("Skipping attachment spool cleanup: could not read referenced attachments")
+        return 0
+    try:
+        return email_service.purge_spool(referenced)
+    except Exception as e:
+        logger.error(f"Error cleaning up attachment spool: {str(e)}")
+        return 0
+
+
+def _record_delivery_result(email_data: Dict[str, Any], sent: bool, error: str = None):
+    """Sender worker hook: move a queued email's record to its delivery category."""
+    communication_id = email_data.get("communication_id")
+    if communication_id is None:
+        return
+    category = SENT_CATEGORY if sent else SEND_FAILED_CATEGORY
+    CommunicationManager.categorize_communications([(communication_id, category)])
+
+
+email_service.on_queued_email_result(_record_delivery_result)
+
+
 # Initialize the module
 def init():
     """Initialize the communication service module."""
+    if ENABLE_EMAIL_IDLE:
+        start_inbound_listener()
     logger.info("Communication service initialized")
 
 
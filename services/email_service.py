@@ -10,9 +10,14 @@ Features:
 - Receive and process emails
 - Email templates for common communications
 - Email queue for handling failures and retries
+- Pooled SMTP sessions shared by concurrent sender workers
 """
 
 import os
+import base64
+import hashlib
+import quopri
+import tempfile
 import smtplib
 import imaplib
 import poplib
@@ -22,15 +27,19 @@ import time
 import json
 import re
 import threading
-import queue
 from email.message import EmailMessage
+from email.parser import BytesFeedParser
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.application import MIMEApplication
 from email.utils import formatdate, make_msgid
-from datetime import datetime, timedelta
+from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Union, Tuple
+from typing import List, Dict, Any, Optional, Union, Tuple, Iterable, Iterator, Callable
+
+from services.email_store import OutboundEmailQueue, MailboxSyncState
+from services.smtp_pool import SMTPConnectionPool
+from services.imap_session import IMAPSession, IdleListener
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -43,10 +52,23 @@ EMAIL_USE_SSL = os.getenv("EMAIL_USE_SSL", "False").lower() == "true"
 EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER", "")
 EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD", "")
 
+# SMTP session pool and sender workers
+EMAIL_SMTP_POOL_SIZE = int(os.getenv("EMAIL_SMTP_POOL_SIZE", "3"))
+EMAIL_SMTP_TIMEOUT = float(os.getenv("EMAIL_SMTP_TIMEOUT", "30"))
+EMAIL_SMTP_MAX_IDLE = float(os.getenv("EMAIL_SMTP_MAX_IDLE", "120"))
+EMAIL_SENDER_WORKERS = int(os.getenv("EMAIL_SENDER_WORKERS", "3"))
+
 # IMAP configuration
 EMAIL_IMAP_SERVER = os.getenv("EMAIL_IMAP_SERVER", "")
 EMAIL_IMAP_PORT = int(os.getenv("EMAIL_IMAP_PORT", "993"))
 EMAIL_IMAP_USE_SSL = os.getenv("EMAIL_IMAP_USE_SSL", "True").lower() == "true"
+# Messages larger than this are synced as headers only and fetched on demand
+EMAIL_IMAP_MAX_INLINE_SIZE = int(os.getenv("EMAIL_IMAP_MAX_INLINE_SIZE", str(5 * 1024 * 1024)))
+# Number of message bodies requested per UID FETCH
+EMAIL_IMAP_FETCH_BATCH = int(os.getenv("EMAIL_IMAP_FETCH_BATCH", "50"))
+# IDLE listener: seconds before IDLE is re-issued, and the polling fallback interval
+EMAIL_IMAP_IDLE_TIMEOUT = float(os.getenv("EMAIL_IMAP_IDLE_TIMEOUT", str(29 * 60)))
+EMAIL_IMAP_POLL_INTERVAL = float(os.getenv("EMAIL_IMAP_POLL_INTERVAL", "60"))
 
 # POP3 configuration
 EMAIL_POP3_SERVER = os.getenv("EMAIL_POP3_SERVER", "")
@@ -59,15 +81,172 @@ EMAIL_RETRIEVAL_METHOD = os.getenv("EMAIL_RETRIEVAL_METHOD", "IMAP").upper()
 # Email templates directory
 TEMPLATE_DIR = Path(__file__).parent.parent / "templates" / "email"
 
-# Email queue for handling retries
-email_queue = queue.Queue()
+# Incoming attachments larger than this are written to EMAIL_SPOOL_DIR instead of kept in memory
+EMAIL_SPOOL_DIR = os.getenv("EMAIL_SPOOL_DIR", str(Path(__file__).parent.parent / "data" / "attachments"))
+EMAIL_SPOOL_THRESHOLD = int(os.getenv("EMAIL_SPOOL_THRESHOLD", str(1024 * 1024)))
+# Unreferenced spool files younger than this are kept (e.g. emails being ingested right now)
+EMAIL_SPOOL_RETENTION = float(os.getenv("EMAIL_SPOOL_RETENTION", "86400"))
+PARSER_CHUNK_SIZE = 64 * 1024
+
+# Persistent email queue for handling retries
+EMAIL_STATE_DB = os.getenv(
+    "EMAIL_STATE_DB", str(Path(__file__).parent.parent / "data" / "email_state.db")
+)
+EMAIL_QUEUE_POLL_INTERVAL = float(os.getenv("EMAIL_QUEUE_POLL_INTERVAL", "30"))
+# Seconds a sender may hold a claimed message before another process may send it again
+EMAIL_QUEUE_LEASE = float(os.getenv("EMAIL_QUEUE_LEASE", "900"))
 MAX_RETRIES = 3
 RETRY_DELAY = 300  # 5 minutes
 
+# The queue and the per-folder IMAP sync position share EMAIL_STATE_DB. Both are
+# opened on first use, so importing this module doesn't touch the filesystem.
+_email_queue: Optional[OutboundEmailQueue] = None
+_mailbox_state: Optional[MailboxSyncState] = None
+_state_lock = threading.Lock()
+
+
+def get_email_queue() -> OutboundEmailQueue:
+    """The persistent outbound email queue, opened on first use."""
+    global _email_queue
+    with _state_lock:
+        if _email_queue is None:
+            _email_queue = OutboundEmailQueue(
+                EMAIL_STATE_DB, poll_interval=EMAIL_QUEUE_POLL_INTERVAL, lease=EMAIL_QUEUE_LEASE
+            )
+        return _email_queue
+
+
+def get_mailbox_state() -> MailboxSyncState:
+    """The stored IMAP sync position of each folder, opened on first use."""
+    global _mailbox_state
+    with _state_lock:
+        if _mailbox_state is None:
+            _mailbox_state = MailboxSyncState(EMAIL_STATE_DB)
+        return _mailbox_state
+
+# Shared authenticated IMAP connection for sync, flag and move operations
+imap_session = IMAPSession(lambda: EmailReceiver.connect_to_imap())
+
+# Running IDLE listeners by folder
+_idle_listeners: Dict[str, IdleListener] = {}
+
+# Sender worker threads of this process
+_sender_threads: List[threading.Thread] = []
+_sender_lock = threading.Lock()
+
+# Callbacks run with (email_data, sent, error) once a queued email is sent or has failed for good
+_queue_result_hooks: List[Callable[[Dict[str, Any], bool, Optional[str]], None]] = []
+
+
+def _smtp_connect() -> smtplib.SMTP:
+    """Open and authenticate a new SMTP session."""
+    if EMAIL_USE_SSL:
+        smtp = smtplib.SMTP_SSL(EMAIL_HOST, EMAIL_PORT, timeout=EMAIL_SMTP_TIMEOUT)
+    else:
+        smtp = smtplib.SMTP(EMAIL_HOST, EMAIL_PORT, timeout=EMAIL_SMTP_TIMEOUT)
+        if EMAIL_USE_TLS:
+            smtp.starttls()
+
+    smtp.login(EMAIL_HOST_USER, EMAIL_HOST_PASSWORD)
+    return smtp
+
+
+# Authenticated SMTP sessions reused across messages and sender threads
+smtp_pool = SMTPConnectionPool(
+    _smtp_connect,
+    size=EMAIL_SMTP_POOL_SIZE,
+    max_idle=EMAIL_SMTP_MAX_IDLE,
+    timeout=EMAIL_SMTP_TIMEOUT * 2
+)
+
+
+# {{key}} placeholders in templates and subjects
+PLACEHOLDER_PATTERN = re.compile(r"\{\{(\w+)\}\}")
+TAG_PATTERN = re.compile(r"<.*?>")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+# Private-use character marking placeholder positions while deriving the plain-text layout
+TEXT_MARKER = "\ue000"
+TEXT_MARKER_PATTERN = re.compile(f"{TEXT_MARKER}(\\d+){TEXT_MARKER}")
+
+
+def html_to_text(html_content: str) -> str:
+    """Generate plain text from HTML (simple version)."""
+    text_content = TAG_PATTERN.sub("", html_content)
+    return WHITESPACE_PATTERN.sub(" ", text_content).strip()
+
+
+class CompiledTemplate:
+    """A template split once into literal text and placeholder names.
+
+    Rendering is a single join. The plain-text alternative is derived once by
+    stripping the template with markers in place of the placeholders, so
+    placeholders inside tags (e.g. links) drop out and the rest keep their
+    position between the pre-stripped literals.
+    """
+
+    def __init__(self, source: str):
+        # re.split with one group alternates literal, name, literal, ...
+        parts = PLACEHOLDER_PATTERN.split(source)
+        self.literals = parts[0::2]
+        self.names = parts[1::2]
+        self._text_literals = None
+        self._text_names = None
+
+    @staticmethod
+    def _value(context: Dict[str, Any], name: str) -> str:
+        # Unknown keys are left as they are
+        return str(context[name]) if name in context else f"{{{{{name}}}}}"
+
+    def render(self, context: Dict[str, Any]) -> str:
+        """Fill the placeholders."""
+        out = [self.literals[0]]
+        for name, literal in zip(self.names, self.literals[1:]):
+            out.append(self._value(context, name))
+            out.append(literal)
+        return "".join(out)
+
+    def _compile_text(self):
+        marked = [self.literals[0]]
+        for index, literal in enumerate(self.literals[1:]):
+            marked.append(f"{TEXT_MARKER}{index}{TEXT_MARKER}")
+            marked.append(literal)
+        parts = TEXT_MARKER_PATTERN.split(html_to_text("".join(marked)))
+        self._text_names = [self.names[int(index)] for index in parts[1::2]]
+        self._text_literals = parts[0::2]
+
+    def render_text(self, context: Dict[str, Any]) -> str:
+        """Render the plain-text alternative; equal to html_to_text(render(context))."""
+        if self._text_literals is None:
+            self._compile_text()
+
+        out = [self._text_literals[0]]
+        collapse = False
+        for name, literal in zip(self._text_names, self._text_literals[1:]):
+            value = self._value(context, name)
+            if "<" in value or ">" in value or "\n" in value:
+                # The value could change what the tag pattern matches
+                return html_to_text(self.render(context))
+            value = WHITESPACE_PATTERN.sub(" ", value)
+            if not value or value[0] == " " or value[-1] == " ":
+                # Spacing around the value no longer matches the pre-collapsed literals
+                collapse = True
+            out.append(value)
+            out.append(literal)
+
+        text_content = "".join(out)
+        if collapse:
+            text_content = WHITESPACE_PATTERN.sub(" ", text_content).strip()
+        return text_content
+
 
 class EmailTemplate:
     """Class for managing email templates."""
 
+    # template name -> (file mtime, CompiledTemplate)
+    _cache: Dict[str, Tuple[int, CompiledTemplate]] = {}
+    _cache_lock = threading.Lock()
+
     @staticmethod
     def load_template(template_name: str) -> str:
         """Load an email template from the templates directory."""
@@ -80,17 +259,50 @@ class EmailTemplate:
             return f.read()
 
     @staticmethod
-    def render_template(template_name: str, context: Dict[str, Any]) -> str:
-        """Render an email template with the given context."""
+    def compile_template(template_name: str) -> Optional[CompiledTemplate]:
+        """Get the compiled template, recompiling only when the file changed."""
+        template_path = TEMPLATE_DIR / f"{template_name}.html"
+        try:
+            mtime = template_path.stat().st_mtime_ns
+        except OSError:
+            logger.warning(f"Template {template_name} not found at {template_path}")
+            return None
+
+        cached = EmailTemplate._cache.get(template_name)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
         template = EmailTemplate.load_template(template_name)
         if not template:
+            return None
+
+        compiled = CompiledTemplate(template)
+        with EmailTemplate._cache_lock:
+            EmailTemplate._cache[template_name] = (mtime, compiled)
+        return compiled
+
+    @staticmethod
+    def render_template(template_name: str, context: Dict[str, Any]) -> str:
+        """Render an email template with the given context."""
+        template = EmailTemplate.compile_template(template_name)
+        if template is None:
             return ""
 
-        # Simple template rendering with string replacement
-        for key, value in context.items():
-            template = template.replace(f"{{{{{key}}}}}", str(value))
+        return template.render(context)
 
-        return template
+    @staticmethod
+    def render_template_text(template_name: str, context: Dict[str, Any]) -> str:
+        """Render the plain-text alternative of an email template."""
+        template = EmailTemplate.compile_template(template_name)
+        if template is None:
+            return ""
+
+        return template.render_text(context)
+
+    @staticmethod
+    def html_to_text(html_content: str) -> str:
+        """Generate plain text from HTML (simple version)."""
+        return html_to_text(html_content)
 
 
 class EmailSender:
@@ -152,7 +364,7 @@ class EmailSender:
         if attachments:
             for attachment in attachments:
                 filename = attachment.get("filename", "")
-                content = attachment.get("content", b"")
+                content = load_attachment(attachment)
                 content_type = attachment.get("content_type", "application/octet-stream")
 
                 maintype, subtype = content_type.split("/", 1)
@@ -177,78 +389,99 @@ class EmailSender:
         if not from_email:
             from_email = EMAIL_HOST_USER
 
-        try:
-            # Create the email message
-            msg = EmailSender.create_message(
-                subject=subject,
-                from_email=from_email,
-                to_emails=to_emails,
-                text_content=text_content,
-                html_content=html_content,
-                cc_emails=cc_emails,
-                bcc_emails=bcc_emails,
-                attachments=attachments,
-                reply_to=reply_to
-            )
-
-            # Connect to the SMTP server
-            if EMAIL_USE_SSL:
-                smtp = smtplib.SMTP_SSL(EMAIL_HOST, EMAIL_PORT)
-            else:
-                smtp = smtplib.SMTP(EMAIL_HOST, EMAIL_PORT)
-                if EMAIL_USE_TLS:
-                    smtp.starttls()
-
-            # Login to the SMTP server
-            smtp.login(EMAIL_HOST_USER, EMAIL_HOST_PASSWORD)
-
-            # Send the email
-            recipients = []
-            if isinstance(to_emails, str):
-                recipients.append(to_emails)
-            else:
-                recipients.extend(to_emails)
-
-            if cc_emails:
-                if isinstance(cc_emails, str):
-                    recipients.append(cc_emails)
-                else:
-                    recipients.extend(cc_emails)
-
-            if bcc_emails:
-                if isinstance(bcc_emails, str):
-                    recipients.append(bcc_emails)
-                else:
-                    recipients.extend(bcc_emails)
-
-            smtp.send_message(msg)
-            smtp.quit()
+        email_data = {
+            "subject": subject,
+            "to_emails": to_emails,
+            "text_content": text_content,
+            "html_content": html_content,
+            "from_email": from_email,
+            "cc_emails": cc_emails,
+            "bcc_emails": bcc_emails,
+            "attachments": attachments,
+            "reply_to": reply_to
+        }
 
+        try:
+            recipients = EmailSender.deliver(email_data)
             logger.info(f"Email sent successfully to {', '.join(recipients)}")
             return True
 
         except Exception as e:
             logger.error(f"Failed to send email: {str(e)}")
 
-            # Add to retry queue
-            email_data = {
-                "subject": subject,
-                "to_emails": to_emails,
-                "text_content": text_content,
-                "html_content": html_content,
-                "from_email": from_email,
-                "cc_emails": cc_emails,
-                "bcc_emails": bcc_emails,
-                "attachments": attachments,
-                "reply_to": reply_to,
-                "priority": priority,
-                "retries": 0,
-                "next_retry": datetime.now() + timedelta(seconds=RETRY_DELAY)
-            }
-            email_queue.put(email_data)
+            # Add to the persistent retry queue
+            get_email_queue().enqueue(email_data, priority=priority, delay=RETRY_DELAY)
 
             return False
 
+    @staticmethod
+    def get_recipients(email_data: Dict[str, Any]) -> List[str]:
+        """Collect the To, Cc and Bcc recipients of an email."""
+        recipients = []
+        for key in ("to_emails", "cc_emails", "bcc_emails"):
+            value = email_data.get(key)
+            if not value:
+                continue
+            if isinstance(value, str):
+                recipients.append(value)
+            else:
+                recipients.extend(value)
+        return recipients
+
+    @staticmethod
+    def deliver(email_data: Dict[str, Any]) -> List[str]:
+        """Build and send a message over SMTP. Raises on failure; returns the recipients."""
+        msg = EmailSender.create_message(
+            subject=email_data["subject"],
+            from_email=email_data.get("from_email") or EMAIL_HOST_USER,
+            to_emails=email_data["to_emails"],
+            text_content=email_data.get("text_content", ""),
+            html_content=email_data.get("html_content", ""),
+            cc_emails=email_data.get("cc_emails"),
+            bcc_emails=email_data.get("bcc_emails"),
+            attachments=email_data.get("attachments"),
+            reply_to=email_data.get("reply_to")
+        )
+
+        # Send over a pooled session (reconnects once if the server dropped it)
+        smtp_pool.send_message(msg)
+
+        return EmailSender.get_recipients(email_data)
+
+    @staticmethod
+    def queue_email(
+        subject: str,
+        to_emails: Union[str, List[str]],
+        text_content: str = "",
+        html_content: str = "",
+        from_email: str = None,
+        cc_emails: Union[str, List[str]] = None,
+        bcc_emails: Union[str, List[str]] = None,
+        attachments: List[Dict[str, Any]] = None,
+        reply_to: str = None,
+        priority: int = 3,
+        communication_id: int = None
+    ) -> int:
+        """Queue an email for the sender workers instead of sending it inline. Returns the queue id.
+
+        ``communication_id`` is handed to the ``on_queued_email_result``
+        callbacks once the email is sent or has failed for good.
+        """
+        email_data = {
+            "subject": subject,
+            "to_emails": to_emails,
+            "text_content": text_content,
+            "html_content": html_content,
+            "from_email": from_email or EMAIL_HOST_USER,
+            "cc_emails": cc_emails,
+            "bcc_emails": bcc_emails,
+            "attachments": attachments,
+            "reply_to": reply_to
+        }
+        if communication_id is not None:
+            email_data["communication_id"] = communication_id
+        return get_email_queue().enqueue(email_data, priority=priority)
+
     @staticmethod
     def send_template_email(
         template_name: str,
@@ -260,16 +493,20 @@ class EmailSender:
         bcc_emails: Union[str, List[str]] = None,
         attachments: List[Dict[str, Any]] = None,
         reply_to: str = None,
-        priority: int = 3
+        priority: int = 3,
+        queue: bool = False
     ) -> bool:
-        """Send an email using a template."""
-        html_content = EmailTemplate.render_template(template_name, context)
+        """Send an email using a template.
 
-        # Generate plain text from HTML (simple version)
-        text_content = re.sub(r'<.*?>', '', html_content)
-        text_content = re.sub(r'\s+', ' ', text_content).strip()
+        With ``queue=True`` the message is handed to the sender workers and
+        True is returned once it is queued.
+        """
+        template = EmailTemplate.compile_template(template_name)
+        html_content = template.render(context) if template else ""
+        text_content = template.render_text(context) if template else ""
 
-        return EmailSender.send_email(
+        send = EmailSender.queue_email if queue else EmailSender.send_email
+        return bool(send(
             subject=subject,
             to_emails=to_emails,
             text_content=text_content,
@@ -280,7 +517,275 @@ class EmailSender:
             attachments=attachments,
             reply_to=reply_to,
             priority=priority
+        ))
+
+
+# Phase one of an IMAP fetch: everything needed to decide whether to download the body
+IMAP_SUMMARY_ITEMS = (
+    "(UID FLAGS RFC822.SIZE BODYSTRUCTURE "
+    "BODY.PEEK[HEADER.FIELDS (FROM TO CC SUBJECT DATE MESSAGE-ID CONTENT-TYPE)])"
+)
+IMAP_BODY_ITEMS = "(UID BODY.PEEK[])"
+
+FETCH_START_PATTERN = re.compile(rb"^\d+ \(")
+FETCH_UID_PATTERN = re.compile(rb"\bUID (\d+)")
+FETCH_SIZE_PATTERN = re.compile(rb"\bRFC822\.SIZE (\d+)")
+FETCH_FLAGS_PATTERN = re.compile(rb"\bFLAGS \(([^)]*)\)")
+FETCH_SECTION_PATTERN = re.compile(rb"(BODY\[[^\]]*\])(?:<\d+>)? \{\d+\}$")
+ATTACHMENT_PATTERN = re.compile(rb'"attachment"', re.IGNORECASE)
+BODYSTRUCTURE_PATTERN = re.compile(rb"\bBODYSTRUCTURE ")
+SEXP_TOKEN_PATTERN = re.compile(rb'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|\{(\d+)\}(?:\r\n)?|([^\s()"]+))')
+
+
+def uid_set(uids: List[int]) -> str:
+    """Format UIDs as a compact IMAP sequence set, e.g. ``1:5,8,10:12``."""
+    ranges = []
+    for uid in sorted(set(uids)):
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ",".join(str(start) if start == end else f"{start}:{end}" for start, end in ranges)
+
+
+def parse_fetch_response(data: List[Any]) -> Dict[int, Dict[str, Any]]:
+    """Split an imaplib FETCH response into per-UID items.
+
+    imaplib returns ``(prefix, literal)`` tuples for every literal and plain
+    bytes for the rest of a line, so one message can span several items.
+    """
+    messages = []
+    current = None
+    for item in data:
+        meta, literal = item if isinstance(item, tuple) else (item, None)
+        if not isinstance(meta, bytes):
+            continue
+        if FETCH_START_PATTERN.match(meta):
+            current = {"meta": b"", "sections": {}}
+            messages.append(current)
+        if current is None:
+            continue
+        current["meta"] += meta
+        if literal is not None:
+            section = FETCH_SECTION_PATTERN.search(meta)
+            if section:
+                current["sections"][section.group(1).decode()] = literal
+            else:
+                # A literal inside BODYSTRUCTURE (e.g. an unusual filename)
+                current["meta"] += literal
+
+    parsed = {}
+    for message in messages:
+        meta = message["meta"]
+        uid = FETCH_UID_PATTERN.search(meta)
+        if not uid:
+            # Unsolicited flag updates carry no UID
+            continue
+        size = FETCH_SIZE_PATTERN.search(meta)
+        flags = FETCH_FLAGS_PATTERN.search(meta)
+        header = next(
+            (value for key, value in message["sections"].items() if key.startswith("BODY[HEADER")), None
         )
+        structure = BODYSTRUCTURE_PATTERN.search(meta)
+        parsed[int(uid.group(1))] = {
+            "uid": int(uid.group(1)),
+            "size": int(size.group(1)) if size else None,
+            "flags": flags.group(1).decode().split() if flags else [],
+            "has_attachments": bool(ATTACHMENT_PATTERN.search(meta)),
+            "structure": parse_bodystructure(meta, structure.end()) if structure else None,
+            "header": header,
+            "body": message["sections"].get("BODY[]"),
+            "sections": message["sections"],
+        }
+    return parsed
+
+
+def _parse_sexp(data: bytes, pos: int) -> Tuple[Any, int]:
+    """Parse one IMAP parenthesized value starting at ``pos``; returns ``(value, end)``."""
+    match = SEXP_TOKEN_PATTERN.match(data, pos)
+    if not match:
+        raise ValueError(f"Unexpected IMAP data at offset {pos}")
+    pos = match.end()
+    if match.group(1):
+        items = []
+        while True:
+            closing = SEXP_TOKEN_PATTERN.match(data, pos)
+            if closing and closing.group(2):
+                return items, closing.end()
+            item, pos = _parse_sexp(data, pos)
+            items.append(item)
+    if match.group(2):
+        raise ValueError(f"Unbalanced parenthesis at offset {pos}")
+    if match.group(3) is not None:
+        return re.sub(rb"\\(.)", rb"\1", match.group(3)).decode(errors="replace"), pos
+    if match.group(4):
+        end = pos + int(match.group(4))
+        return data[pos:end].decode(errors="replace"), end
+    atom = match.group(5).decode(errors="replace")
+    return (None if atom.upper() == "NIL" else atom), pos
+
+
+def parse_bodystructure(meta: bytes, pos: int = 0) -> Optional[list]:
+    """Parse a BODYSTRUCTURE value into nested lists (None if it can't be parsed)."""
+    try:
+        structure, _ = _parse_sexp(meta, pos)
+    except (ValueError, IndexError) as e:
+        logger.warning(f"Could not parse BODYSTRUCTURE: {str(e)}")
+        return None
+    return structure if isinstance(structure, list) else None
+
+
+def text_sections(structure: list, section: str = "") -> Iterator[Tuple[str, str, str, Optional[str]]]:
+    """Yield ``(section, subtype, encoding, charset)`` for the inline text/plain and text/html parts."""
+    if not structure:
+        return
+    if isinstance(structure[0], list):
+        # Multipart: the child parts come first, then the subtype and extension data
+        for index, child in enumerate(structure, start=1):
+            if not isinstance(child, list):
+                break
+            yield from text_sections(child, f"{section}.{index}" if section else str(index))
+        return
+
+    content_type, subtype = str(structure[0]).lower(), str(structure[1]).lower()
+    if content_type != "text" or subtype not in ("plain", "html") or len(structure) < 7:
+        return
+    # text parts: type, subtype, params, id, description, encoding, size, lines, md5, disposition
+    disposition = structure[9] if len(structure) > 9 else None
+    if isinstance(disposition, list) and disposition and str(disposition[0]).lower() == "attachment":
+        return
+    params = structure[2] if isinstance(structure[2], list) else []
+    charset = {str(key).lower(): value for key, value in zip(params[::2], params[1::2])}.get("charset")
+    yield section or "1", subtype, str(structure[5] or "7bit").lower(), charset
+
+
+def decode_text_section(data: bytes, encoding: str, charset: Optional[str]) -> str:
+    """Decode a fetched body section by its transfer encoding and charset."""
+    if encoding == "base64":
+        data = base64.b64decode(data)
+    elif encoding == "quoted-printable":
+        data = quopri.decodestring(data)
+    try:
+        return data.decode(charset or "utf-8", errors="replace")
+    except LookupError:
+        return data.decode("utf-8", errors="replace")
+
+
+BASE64_JUNK_PATTERN = re.compile(r"[^A-Za-z0-9+/]")
+
+
+def _iter_part_bytes(part: email.message.Message, chunk_chars: int = 1024 * 1024) -> Iterator[bytes]:
+    """Decode a MIME part's payload piecewise (base64 in bounded chunks)."""
+    payload = part.get_payload()
+    encoding = str(part.get("Content-Transfer-Encoding", "")).strip().lower()
+    if encoding == "base64" and isinstance(payload, str):
+        pending = ""
+        for start in range(0, len(payload), chunk_chars):
+            pending += BASE64_JUNK_PATTERN.sub("", payload[start:start + chunk_chars])
+            usable = len(pending) - len(pending) % 4
+            if usable:
+                yield base64.b64decode(pending[:usable])
+                pending = pending[usable:]
+        if len(pending) > 1:
+            # Tolerate a missing final padding, like get_payload(decode=True)
+            yield base64.b64decode(pending + "=" * (-len(pending) % 4))
+    else:
+        yield part.get_payload(decode=True) or b""
+
+
+def _spool_chunks(chunks: Iterable[bytes]) -> Dict[str, Any]:
+    """Write bytes to ``EMAIL_SPOOL_DIR/<sha[:2]>/<sha256>``; identical contents share one file."""
+    os.makedirs(EMAIL_SPOOL_DIR, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=EMAIL_SPOOL_DIR, suffix=".part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+
+        sha256 = digest.hexdigest()
+        path = Path(EMAIL_SPOOL_DIR) / sha256[:2] / sha256
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.exists():
+            os.remove(temp_path)
+            # Reused now, so purge_spool treats it as fresh
+            os.utime(path)
+        else:
+            os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return {"path": str(path), "size": size, "sha256": sha256}
+
+
+def spool_part(part: email.message.Message) -> Dict[str, Any]:
+    """Write a part's decoded payload to the spool (see ``_spool_chunks``).
+
+    The part's payload is dropped afterwards so the message no longer holds
+    it in memory.
+    """
+    spooled = _spool_chunks(_iter_part_bytes(part))
+    part.set_payload("")
+    return spooled
+
+
+def spool_attachment(attachment: Dict[str, Any]) -> Dict[str, Any]:
+    """Return ``attachment`` with its ``content`` moved to the spool.
+
+    Messages queued with the result reference one file on disk instead of
+    each carrying its own (base64-encoded) copy of the bytes.
+    """
+    if attachment.get("content") is None:
+        return attachment
+    spooled = {key: value for key, value in attachment.items() if key != "content"}
+    spooled.update(_spool_chunks([attachment["content"]]))
+    return spooled
+
+
+def load_attachment(attachment: Dict[str, Any]) -> bytes:
+    """Return an attachment's bytes, reading spooled attachments from disk."""
+    if attachment.get("content") is not None:
+        return attachment["content"]
+    if attachment.get("path"):
+        with open(attachment["path"], "rb") as f:
+            return f.read()
+    return b""
+
+
+def purge_spool(referenced: Iterable[str], min_age: float = EMAIL_SPOOL_RETENTION) -> int:
+    """Delete spool files that nothing references any more. Returns the number removed.
+
+    ``referenced`` holds the SHA-256 names still in use (e.g. by stored
+    communications); files of messages waiting in the outbound queue are
+    always kept. Files modified in the last ``min_age`` seconds, and
+    interrupted writes younger than that, are left alone.
+    """
+    keep = set(referenced) | get_email_queue().spooled_attachments()
+    cutoff = time.time() - min_age
+    removed = 0
+    for path in Path(EMAIL_SPOOL_DIR).glob("*/*"):
+        if path.name in keep:
+            continue
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+                removed += 1
+        except FileNotFoundError:
+            continue
+    for path in Path(EMAIL_SPOOL_DIR).glob("*.part"):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except FileNotFoundError:
+            continue
+    if removed:
+        logger.info(f"Removed {removed} unreferenced attachment files from {EMAIL_SPOOL_DIR}")
+    return removed
 
 
 class EmailReceiver:
@@ -304,6 +809,105 @@ class EmailReceiver:
         mail.pass_(EMAIL_HOST_PASSWORD)
         return mail
 
+    @staticmethod
+    def _fetch_summaries(mail: imaplib.IMAP4, uids: str) -> Dict[int, Dict[str, Any]]:
+        """Fetch headers, flags, size and structure for a UID set in one round trip."""
+        status, data = mail.uid("FETCH", uids, IMAP_SUMMARY_ITEMS)
+        if status != "OK":
+            logger.error(f"Failed to fetch email summaries {uids}: {status}")
+            return {}
+        return parse_fetch_response(data)
+
+    @staticmethod
+    def _fetch_bodies(mail: imaplib.IMAP4, summaries: Dict[int, Dict[str, Any]]):
+        """Download full bodies of messages below the inline size limit, in batched ranges.
+
+        Larger messages get only their text parts (see ``_fetch_text_parts``).
+        Raises RuntimeError if a FETCH fails, so no message is passed on
+        without its body.
+        """
+        uids = [
+            uid for uid, summary in sorted(summaries.items())
+            if summary["body"] is None and (summary["size"] or 0) <= EMAIL_IMAP_MAX_INLINE_SIZE
+        ]
+        for start in range(0, len(uids), EMAIL_IMAP_FETCH_BATCH):
+            batch = uids[start:start + EMAIL_IMAP_FETCH_BATCH]
+            status, data = mail.uid("FETCH", uid_set(batch), IMAP_BODY_ITEMS)
+            if status != "OK":
+                raise RuntimeError(f"Failed to fetch email bodies {uid_set(batch)}: {status}")
+            for uid, fetched in parse_fetch_response(data).items():
+                if uid in summaries:
+                    summaries[uid]["body"] = fetched["body"]
+
+        missing = [uid for uid in uids if summaries[uid]["body"] is None]
+        if missing:
+            raise RuntimeError(f"Server returned no body for emails {uid_set(missing)}")
+        EmailReceiver._fetch_text_parts(mail, summaries)
+
+    @staticmethod
+    def _fetch_text_parts(mail: imaplib.IMAP4, summaries: Dict[int, Dict[str, Any]]):
+        """Fetch just the text/plain and text/html parts of messages left without a body.
+
+        The sections come from the BODYSTRUCTURE of the summary, so the
+        attachments stay on the server. A message whose structure couldn't
+        be parsed is fetched whole.
+        """
+        for uid, summary in sorted(summaries.items()):
+            if summary["body"] is not None:
+                continue
+            if summary["structure"] is None:
+                status, data = mail.uid("FETCH", str(uid), IMAP_BODY_ITEMS)
+                body = parse_fetch_response(data).get(uid, {}).get("body") if status == "OK" else None
+                if body is None:
+                    raise RuntimeError(f"Failed to fetch email {uid}: {status}")
+                summary["body"] = body
+                continue
+
+            sections = list(text_sections(summary["structure"]))
+            summary["text"] = {}
+            if not sections:
+                continue
+            items = " ".join(f"BODY.PEEK[{section}]" for section, _, _, _ in sections)
+            status, data = mail.uid("FETCH", str(uid), f"(UID {items})")
+            fetched = parse_fetch_response(data).get(uid) if status == "OK" else None
+            if fetched is None:
+                raise RuntimeError(f"Failed to fetch text of email {uid}: {status}")
+            for section, subtype, encoding, charset in sections:
+                content = fetched["sections"].get(f"BODY[{section}]")
+                if content is not None and subtype not in summary["text"]:
+                    summary["text"][subtype] = decode_text_section(content, encoding, charset)
+
+    @staticmethod
+    def _build_emails(summaries: Dict[int, Dict[str, Any]], folder: str) -> List[Dict[str, Any]]:
+        """Parse fetched messages, oldest first.
+
+        Messages fetched without their full body carry the headers and the
+        text parts from ``_fetch_text_parts``, but no attachments.
+        """
+        emails = []
+        for uid, summary in sorted(summaries.items()):
+            truncated = summary["body"] is None
+            parsed_email = EmailReceiver.parse_email_bytes(summary["header"] if truncated else summary["body"] or b"")
+            if truncated:
+                text = summary.get("text") or {}
+                parsed_email["body_text"] = text.get("plain", "")
+                parsed_email["body_html"] = text.get("html", "")
+            # Drop the raw message once parsed; large attachments now live in the spool
+            summary["body"] = None
+            summary["sections"] = None
+            parsed_email.update({
+                "id": str(uid),
+                "uid": uid,
+                "folder": folder,
+                "size": summary["size"],
+                "seen": "\\Seen" in summary["flags"],
+                "has_attachments": summary["has_attachments"] or bool(parsed_email["attachments"]),
+                # Large messages: call fetch_message(uid, folder) for the attachments
+                "truncated": truncated
+            })
+            emails.append(parsed_email)
+        return emails
+
     @staticmethod
     def get_emails_imap(
         folder: str = "INBOX",
@@ -311,54 +915,203 @@ class EmailReceiver:
         unread_only: bool = True,
         since_date: datetime = None
     ) -> List[Dict[str, Any]]:
-        """Get emails from the specified folder using IMAP."""
+        """Get emails from the specified folder using IMAP (read-only, no sync state)."""
         try:
-            mail = EmailReceiver.connect_to_imap()
-            mail.select(folder)
+            with imap_session.session() as mail:
+                mail.select(folder, readonly=True)
 
-            search_criteria = []
-            if unread_only:
-                search_criteria.append("UNSEEN")
+                search_criteria = []
+                if unread_only:
+                    search_criteria.append("UNSEEN")
 
-            if since_date:
-                date_str = since_date.strftime("%d-%b-%Y")
-                search_criteria.append(f'SINCE "{date_str}"')
+                if since_date:
+                    date_str = since_date.strftime("%d-%b-%Y")
+                    search_criteria.append(f'SINCE "{date_str}"')
 
-            search_query = " ".join(search_criteria) if search_criteria else "ALL"
-            status, data = mail.search(None, search_query)
+                search_query = " ".join(search_criteria) if search_criteria else "ALL"
+                status, data = mail.uid("SEARCH", None, search_query)
 
-            if status != "OK":
-                logger.error(f"Failed to search emails: {status}")
-                return []
+                if status != "OK":
+                    logger.error(f"Failed to search emails: {status}")
+                    return []
 
-            email_ids = data[0].split()
-            if limit > 0:
-                email_ids = email_ids[-limit:]
+                uids = [int(uid) for uid in data[0].split()]
+                if limit > 0:
+                    uids = uids[-limit:]
+                if not uids:
+                    return []
 
-            emails = []
-            for email_id in email_ids:
-                status, data = mail.fetch(email_id, "(RFC822)")
+                summaries = EmailReceiver._fetch_summaries(mail, uid_set(uids))
+                EmailReceiver._fetch_bodies(mail, summaries)
+                return EmailReceiver._build_emails(summaries, folder)
+
+        except Exception as e:
+            logger.error(f"Error getting emails via IMAP: {str(e)}")
+            return []
+
+    @staticmethod
+    def _highest_uid(mail: imaplib.IMAP4) -> int:
+        """Highest UID currently in the selected folder (0 if empty)."""
+        uidnext = mail.response("UIDNEXT")[1]
+        if uidnext and uidnext[0]:
+            return int(uidnext[0]) - 1
+        status, data = mail.uid("FETCH", "*", "(UID)")
+        summaries = parse_fetch_response(data) if status == "OK" else {}
+        return max(summaries, default=0)
+
+    @staticmethod
+    def sync_mailbox(folder: str = "INBOX", limit: int = 0) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Fetch messages that arrived since the last sync of ``folder``.
+
+        Only UIDs above the stored position are requested: one FETCH for
+        headers/flags/size/structure of every new message, then batched body
+        FETCHes for messages below ``EMAIL_IMAP_MAX_INLINE_SIZE``. The first
+        sync (or a UIDVALIDITY change) picks up the current unread messages.
+        With ``limit`` the oldest new messages are returned and the rest wait
+        for the next sync.
+
+        Returns ``(emails, position)``. Nothing is recorded yet: once the
+        emails are saved, pass ``position`` to ``commit_sync`` to advance the
+        stored position (and mark the messages read). Until then the same
+        messages are returned again. ``position`` is None on error.
+        """
+        try:
+            with imap_session.session() as mail:
+                status, _ = mail.select(folder, readonly=True)
                 if status != "OK":
-                    logger.error(f"Failed to fetch email {email_id}: {status}")
-                    continue
+                    logger.error(f"Failed to select folder {folder}: {status}")
+                    return [], None
+
+                uidvalidity = int(mail.response("UIDVALIDITY")[1][0])
+                state = get_mailbox_state().get(folder)
+
+                if state is None or state[0] != uidvalidity:
+                    if state is not None:
+                        logger.warning(f"UIDVALIDITY of {folder} changed, resyncing unread messages")
+                    # First sync: start just before the oldest unread message
+                    status, data = mail.uid("SEARCH", None, "UNSEEN")
+                    unseen = [int(uid) for uid in data[0].split()] if status == "OK" else []
+                    last_uid = min(unseen) - 1 if unseen else EmailReceiver._highest_uid(mail)
+                    first_sync = True
+                else:
+                    last_uid = state[1]
+                    first_sync = False
+
+                # "n:*" always matches the highest UID, so filter out what we already have
+                summaries = {
+                    uid: summary
+                    for uid, summary in EmailReceiver._fetch_summaries(mail, f"{last_uid + 1}:*").items()
+                    if uid > last_uid
+                }
+                new_uids = sorted(summaries)
+                if limit > 0 and len(new_uids) > limit:
+                    new_uids = new_uids[:limit]
+                new_last_uid = new_uids[-1] if new_uids else last_uid
+
+                selected = {
+                    uid: summaries[uid] for uid in new_uids
+                    # Messages already read elsewhere before the first sync are not ingested
+                    if not (first_sync and "\\Seen" in summaries[uid]["flags"])
+                }
+                EmailReceiver._fetch_bodies(mail, selected)
+                emails = EmailReceiver._build_emails(selected, folder)
+
+                position = {
+                    "folder": folder,
+                    "uidvalidity": uidvalidity,
+                    "last_uid": new_last_uid,
+                    "uids": sorted(selected),
+                }
+                return emails, position
+
+        except Exception as e:
+            logger.error(f"Error syncing mailbox {folder} via IMAP: {str(e)}")
+            return [], None
 
-                raw_email = data[0][1]
-                email_message = email.message_from_bytes(raw_email)
+    @staticmethod
+    def commit_sync(position: Dict[str, Any], mark_seen: bool = False) -> bool:
+        """Record a ``sync_mailbox`` position after its emails were saved.
+
+        With ``mark_seen`` the synced messages are marked read in one STORE
+        first. A failed STORE keeps the old position, so the messages come
+        again with the next sync.
+        """
+        folder = position["folder"]
+        try:
+            if mark_seen and position["uids"]:
+                with imap_session.session() as mail:
+                    status, _ = mail.select(folder)
+                    if status != "OK":
+                        logger.error(f"Failed to select folder {folder}: {status}")
+                        return False
+                    mail.uid("STORE", uid_set(position["uids"]), "+FLAGS.SILENT", "(\\Seen)")
+
+            get_mailbox_state().update(folder, position["uidvalidity"], position["last_uid"])
+            return True
 
-                # Parse email
-                parsed_email = EmailReceiver.parse_email(email_message)
-                parsed_email["id"] = email_id.decode("utf-8")
-                emails.append(parsed_email)
+        except Exception as e:
+            logger.error(f"Error committing sync of mailbox {folder}: {str(e)}")
+            return False
 
-            mail.close()
-            mail.logout()
+    @staticmethod
+    def search_uids(folder: str = "INBOX", criteria: str = "ALL") -> List[int]:
+        """Return the UIDs in ``folder`` matching an IMAP SEARCH ``criteria`` (oldest first)."""
+        try:
+            with imap_session.session() as mail:
+                mail.select(folder, readonly=True)
+                status, data = mail.uid("SEARCH", None, criteria)
+                if status != "OK":
+                    logger.error(f"Failed to search emails: {status}")
+                    return []
+                return sorted(int(uid) for uid in data[0].split())
 
-            return emails
+        except Exception as e:
+            logger.error(f"Error searching emails via IMAP: {str(e)}")
+            return []
+
+    @staticmethod
+    def fetch_messages(uids: List[int], folder: str = "INBOX") -> List[Dict[str, Any]]:
+        """Fetch messages by UID without touching flags or sync state (e.g. for backfills)."""
+        if not uids:
+            return []
+        try:
+            with imap_session.session() as mail:
+                mail.select(folder, readonly=True)
+                wanted = set(uids)
+                summaries = {
+                    uid: summary for uid, summary in EmailReceiver._fetch_summaries(mail, uid_set(uids)).items()
+                    if uid in wanted
+                }
+                EmailReceiver._fetch_bodies(mail, summaries)
+                return EmailReceiver._build_emails(summaries, folder)
 
         except Exception as e:
-            logger.error(f"Error getting emails via IMAP: {str(e)}")
+            logger.error(f"Error fetching emails via IMAP: {str(e)}")
             return []
 
+    @staticmethod
+    def fetch_message(uid: Union[int, str], folder: str = "INBOX") -> Optional[Dict[str, Any]]:
+        """Fetch a complete message by UID (e.g. one synced header-only because of its size)."""
+        try:
+            with imap_session.session() as mail:
+                mail.select(folder, readonly=True)
+
+                status, data = mail.uid("FETCH", str(uid), "(UID FLAGS RFC822.SIZE BODYSTRUCTURE BODY.PEEK[])")
+                if status != "OK":
+                    logger.error(f"Failed to fetch email {uid}: {status}")
+                    return None
+
+                summaries = {
+                    fetched_uid: summary for fetched_uid, summary in parse_fetch_response(data).items()
+                    if fetched_uid == int(uid)
+                }
+                emails = EmailReceiver._build_emails(summaries, folder)
+                return emails[0] if emails else None
+
+        except Exception as e:
+            logger.error(f"Error fetching email {uid} via IMAP: {str(e)}")
+            return None
+
     @staticmethod
     def get_emails_pop3(
         limit: int = 10
@@ -384,12 +1137,8 @@ class EmailReceiver:
                     # Get email by index
                     response, lines, octets = mail.retr(i)
 
-                    # Join lines and parse email
-                    raw_email = b'\r\n'.join(lines)
-                    email_message = email.message_from_bytes(raw_email)
-
-                    # Parse email
-                    parsed_email = EmailReceiver.parse_email(email_message)
+                    # Parse email line by line
+                    parsed_email = EmailReceiver.parse_email_bytes(line + b"\r\n" for line in lines)
                     parsed_email["id"] = str(i)  # Use POP3 message number as ID
                     emails.append(parsed_email)
 
@@ -426,6 +1175,41 @@ class EmailReceiver:
                 since_date=since_date
             )
 
+    @staticmethod
+    def parse_email_bytes(source: Union[bytes, Iterable[bytes]]) -> Dict[str, Any]:
+        """Parse a raw message fed incrementally, spooling large attachments to disk."""
+        parser = BytesFeedParser()
+        if isinstance(source, (bytes, bytearray)):
+            view = memoryview(source)
+            for start in range(0, len(view), PARSER_CHUNK_SIZE):
+                parser.feed(bytes(view[start:start + PARSER_CHUNK_SIZE]))
+        else:
+            for chunk in source:
+                parser.feed(chunk)
+        return EmailReceiver.parse_email(parser.close())
+
+    @staticmethod
+    def parse_attachment(part: email.message.Message, filename: str, content_type: str) -> Dict[str, Any]:
+        """Build an attachment entry: bytes in ``content``, or a spool handle above the threshold."""
+        payload = part.get_payload()
+        encoding = str(part.get("Content-Transfer-Encoding", "")).strip().lower()
+        estimated_size = len(payload) * 3 // 4 if encoding == "base64" else len(payload)
+
+        if isinstance(payload, str) and estimated_size > EMAIL_SPOOL_THRESHOLD:
+            # Large attachment: carry a handle (path, size, sha256) instead of the bytes
+            attachment = {"filename": filename, "content_type": content_type}
+            attachment.update(spool_part(part))
+            return attachment
+
+        content = part.get_payload(decode=True) or b""
+        return {
+            "filename": filename,
+            "content": content,
+            "content_type": content_type,
+            "size": len(content),
+            "sha256": hashlib.sha256(content).hexdigest()
+        }
+
     @staticmethod
     def parse_email(email_message: email.message.Message) -> Dict[str, Any]:
         """Parse an email message."""
@@ -453,11 +1237,7 @@ class EmailReceiver:
                 if "attachment" in content_disposition:
                     filename = part.get_filename()
                     if filename:
-                        attachment = {
-                            "filename": filename,
-                            "content": part.get_payload(decode=True),
-                            "content_type": content_type
-                        }
+                        attachment = EmailReceiver.parse_attachment(part, filename, content_type)
                         parsed_email["attachments"].append(attachment)
                 else:
                     # Handle email body
@@ -476,8 +1256,8 @@ class EmailReceiver:
         return parsed_email
 
     @staticmethod
-    def mark_as_read(email_id: str, folder: str = "INBOX") -> bool:
-        """Mark an email as read."""
+    def mark_as_read(email_id: Union[str, List[str]], folder: str = "INBOX") -> bool:
+        """Mark an email (or several, by UID) as read."""
         # For POP3, we don't need to mark emails as read since they're automatically
         # marked as read when retrieved, unless the server supports UIDL
         if EMAIL_RETRIEVAL_METHOD == "POP3":
@@ -485,17 +1265,21 @@ class EmailReceiver:
             return True
 
         # For IMAP
-        try:
-            mail = EmailReceiver.connect_to_imap()
-            mail.select(folder)
+        uids = [email_id] if isinstance(email_id, str) else list(email_id)
+        if not uids:
+            return True
 
-            mail.store(email_id.encode(), "+FLAGS", "\\Seen")
+        try:
+            with imap_session.session() as mail:
+                mail.select(folder)
 
-            mail.close()
-            mail.logout()
+                status, _ = mail.uid("STORE", uid_set([int(uid) for uid in uids]), "+FLAGS.SILENT", "(\\Seen)")
+                if status != "OK":
+                    logger.error(f"Failed to mark emails {uids} as read: {status}")
+                    return False
 
-            logger.info(f"Email {email_id} marked as read")
-            return True
+                logger.info(f"Email {', '.join(map(str, uids))} marked as read")
+                return True
 
         except Exception as e:
             logger.error(f"Error marking email as read: {str(e)}")
@@ -511,128 +1295,158 @@ class EmailReceiver:
 
         # For IMAP
         try:
-            mail = EmailReceiver.connect_to_imap()
-            mail.select(source_folder)
-
-            # Copy the email to the destination folder
-            result, _ = mail.copy(email_id.encode(), destination_folder)
-            if result == "OK":
-                # Mark the original email for deletion
-                mail.store(email_id.encode(), "+FLAGS", "\\Deleted")
-                mail.expunge()
+            with imap_session.session() as mail:
+                mail.select(source_folder)
 
-                logger.info(f"Email {email_id} moved to {destination_folder}")
-                return True
-            else:
-                logger.error(f"Failed to copy email {email_id} to {destination_folder}: {result}")
-                return False
+                if "MOVE" in mail.capabilities:
+                    result, _ = mail.uid("MOVE", email_id, destination_folder)
+                else:
+                    # Copy the email to the destination folder
+                    result, _ = mail.uid("COPY", email_id, destination_folder)
+                    if result == "OK":
+                        # Mark the original email for deletion
+                        mail.uid("STORE", email_id, "+FLAGS.SILENT", "(\\Deleted)")
+                        if "UIDPLUS" in mail.capabilities:
+                            # Only expunge this message, not others flagged by other clients
+                            mail.uid("EXPUNGE", email_id)
+                        else:
+                            mail.expunge()
+
+                if result == "OK":
+                    logger.info(f"Email {email_id} moved to {destination_folder}")
+                    return True
+                else:
+                    logger.error(f"Failed to move email {email_id} to {destination_folder}: {result}")
+                    return False
 
         except Exception as e:
             logger.error(f"Error moving email: {str(e)}")
             return False
 
-        finally:
-            mail.close()
-            mail.logout()
-
 
 def process_email_queue():
-    """Process the email queue for retries."""
+    """Send queued emails and retries; several of these run as sender workers."""
+    email_queue = get_email_queue()
     while True:
         try:
-            # Check if there are any emails in the queue
-            if email_queue.empty():
-                time.sleep(60)  # Sleep for 1 minute if queue is empty
+            # Block until the most urgent message is due
+            job = email_queue.claim_next()
+            if job is None:
                 continue
 
-            # Get the next email from the queue
-            email_data = email_queue.get()
+            email_data = job["email_data"]
 
-            # Check if it's time to retry
-            if email_data["next_retry"] > datetime.now():
-                # Put it back in the queue and sleep
-                email_queue.put(email_data)
-                time.sleep(10)
-                continue
-
-            # Retry sending the email
-            logger.info(f"Retrying email to {email_data['to_emails']}, attempt {email_data['retries'] + 1}")
+            if job["retries"]:
+                logger.info(f"Retrying email to {email_data['to_emails']}, attempt {job['retries'] + 1}")
 
             try:
-                # Create the email message
-                msg = EmailSender.create_message(
-                    subject=email_data["subject"],
-                    from_email=email_data["from_email"] or EMAIL_HOST_USER,
-                    to_emails=email_data["to_emails"],
-                    text_content=email_data["text_content"],
-                    html_content=email_data["html_content"],
-                    cc_emails=email_data["cc_emails"],
-                    bcc_emails=email_data["bcc_emails"],
-                    attachments=email_data["attachments"],
-                    reply_to=email_data["reply_to"]
-                )
-
-                # Connect to the SMTP server
-                if EMAIL_USE_SSL:
-                    smtp = smtplib.SMTP_SSL(EMAIL_HOST, EMAIL_PORT)
-                else:
-                    smtp = smtplib.SMTP(EMAIL_HOST, EMAIL_PORT)
-                    if EMAIL_USE_TLS:
-                        smtp.starttls()
-
-                # Login to the SMTP server
-                smtp.login(EMAIL_HOST_USER, EMAIL_HOST_PASSWORD)
-
-                # Send the email
-                recipients = []
-                if isinstance(email_data["to_emails"], str):
-                    recipients.append(email_data["to_emails"])
-                else:
-                    recipients.extend(email_data["to_emails"])
-
-                if email_data["cc_emails"]:
-                    if isinstance(email_data["cc_emails"], str):
-                        recipients.append(email_data["cc_emails"])
-                    else:
-                        recipients.extend(email_data["cc_emails"])
-
-                if email_data["bcc_emails"]:
-                    if isinstance(email_data["bcc_emails"], str):
-                        recipients.append(email_data["bcc_emails"])
-                    else:
-                        recipients.extend(email_data["bcc_emails"])
-
-                smtp.send_message(msg)
-                smtp.quit()
-
-                logger.info(f"Email retry successful to {', '.join(recipients)}")
+                recipients = EmailSender.deliver(email_data)
+                email_queue.complete(job["id"])
+                logger.info(f"Queued email sent to {', '.join(recipients)}")
+                _notify_queue_result(email_data, True)
 
             except Exception as e:
-                logger.error(f"Email retry failed: {str(e)}")
+                logger.error(f"Sending queued email failed: {str(e)}")
 
                 # Increment retry count
-                email_data["retries"] += 1
+                retries = job["retries"] + 1
 
                 # If we haven't reached the maximum number of retries, put it back in the queue
-                if email_data["retries"] < MAX_RETRIES:
+                if retries < MAX_RETRIES:
                     # Exponential backoff for retries
-                    delay = RETRY_DELAY * (2 ** email_data["retries"])
-                    email_data["next_retry"] = datetime.now() + timedelta(seconds=delay)
-                    email_queue.put(email_data)
+                    delay = RETRY_DELAY * (2 ** retries)
+                    email_queue.retry(job["id"], retries, delay, error=str(e))
                 else:
+                    email_queue.fail(job["id"], error=str(e))
                     logger.error(f"Maximum retries reached for email to {email_data['to_emails']}")
+                    _notify_queue_result(email_data, False, str(e))
 
         except Exception as e:
             logger.error(f"Error in email queue processor: {str(e)}")
             time.sleep(60)  # Sleep for 1 minute on error
 
 
-# Start the email queue processor in a background thread
-def start_email_queue_processor():
-    """Start the email queue processor in a background thread."""
-    thread = threading.Thread(target=process_email_queue, daemon=True)
-    thread.start()
-    logger.info("Email queue processor started")
+def on_queued_email_result(callback: Callable[[Dict[str, Any], bool, Optional[str]], None]):
+    """Register ``callback(email_data, sent, error)``, run by the sender workers
+    after a queued email was sent or failed for good."""
+    _queue_result_hooks.append(callback)
+
+
+def _notify_queue_result(email_data: Dict[str, Any], sent: bool, error: str = None):
+    for hook in _queue_result_hooks:
+        try:
+            hook(email_data, sent, error)
+        except Exception as e:
+            logger.error(f"Error in queued email result hook: {str(e)}")
+
+
+# Start the email queue processor in background threads
+def start_email_queue_processor(workers: int = None) -> bool:
+    """Start the sender workers that drain the email queue, once per process.
+
+    Called by the application entry point, not on import, so scripts and
+    servers that only enqueue mail don't send it. Returns False if the
+    workers were already running.
+    """
+    with _sender_lock:
+        if _sender_threads:
+            return False
+
+        # Messages claimed by a process that died mid-send (expired lease) are retried
+        recovered = get_email_queue().recover()
+        if recovered:
+            logger.info(f"Recovered {recovered} interrupted emails from the queue")
+
+        workers = max(1, workers or EMAIL_SENDER_WORKERS)
+        for i in range(workers):
+            thread = threading.Thread(target=process_email_queue, name=f"email-sender-{i + 1}", daemon=True)
+            thread.start()
+            _sender_threads.append(thread)
+    logger.info(f"Email queue processor started with {workers} sender workers")
+    return True
+
+
+def start_idle_listener(on_new_mail, folder: str = "INBOX") -> Optional[IdleListener]:
+    """Push new-mail events for ``folder`` to ``on_new_mail`` using IMAP IDLE."""
+    if EMAIL_RETRIEVAL_METHOD == "POP3":
+        logger.warning("POP3 doesn't support IDLE; poll process_incoming_emails instead")
+        return None
+
+    listener = _idle_listeners.get(folder)
+    if listener is None:
+        listener = IdleListener(
+            EmailReceiver.connect_to_imap,
+            on_new_mail,
+            folder=folder,
+            idle_timeout=EMAIL_IMAP_IDLE_TIMEOUT,
+            poll_interval=EMAIL_IMAP_POLL_INTERVAL
+        )
+        _idle_listeners[folder] = listener
+    listener.start()
+    return listener
+
+
+def stop_idle_listeners():
+    """Stop all IDLE listeners and log out of the shared IMAP connection."""
+    for listener in _idle_listeners.values():
+        listener.stop()
+    _idle_listeners.clear()
+    imap_session.close()
+
+
+def get_imap_stats() -> Dict[str, Any]:
+    """Get shared IMAP session and IDLE listener counters."""
+    return {
+        "session": imap_session.stats(),
+        "listeners": {folder: listener.stats() for folder, listener in _idle_listeners.items()}
+    }
+
+
+def get_email_queue_stats() -> Dict[str, Any]:
+    """Get depth and age metrics of the outbound email queue and SMTP session usage."""
+    stats = get_email_queue().stats()
+    stats["smtp"] = smtp_pool.stats()
+    return stats
 
 
 # Common email functions for the application
@@ -681,9 +1495,13 @@ def send_invoice(
     invoice_number: str,
     invoice_date: str,
     invoice_amount: float,
-    invoice_pdf: bytes
+    invoice_pdf: bytes,
+    queue: bool = False
 ) -> bool:
-    """Send an invoice email with PDF attachment."""
+    """Send an invoice email with PDF attachment.
+
+    Pass ``queue=True`` for bulk runs so the sender workers deliver it.
+    """
     context = {
         "client_name": client_name,
         "invoice_number": invoice_number,
@@ -703,7 +1521,8 @@ def send_invoice(
         context=context,
         subject=f"Faktura nr {invoice_number}",
         to_emails=client_email,
-        attachments=attachments
+        attachments=attachments,
+        queue=queue
     )
 
 
@@ -713,9 +1532,13 @@ def send_offer(
     offer_number: str,
     offer_date: str,
     offer_expiry_date: str,
-    offer_pdf: bytes
+    offer_pdf: bytes,
+    queue: bool = False
 ) -> bool:
-    """Send an offer email with PDF attachment."""
+    """Send an offer email with PDF attachment.
+
+    Pass ``queue=True`` for bulk runs so the sender workers deliver it.
+    """
     context = {
         "client_name": client_name,
         "offer_number": offer_number,
@@ -735,19 +1558,30 @@ def send_offer(
         context=context,
         subject=f"Oferta nr {offer_number}",
         to_emails=client_email,
-        attachments=attachments
+        attachments=attachments,
+        queue=queue
     )
 
 
-def process_incoming_emails(limit: int = 10) -> List[Dict[str, Any]]:
-    """Process incoming emails and return parsed data."""
-    emails = EmailReceiver.get_emails(limit=limit, unread_only=True)
+def process_incoming_emails(
+    limit: int = 10,
+    folder: str = "INBOX"
+) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Fetch incoming emails and return ``(parsed data, sync position)``.
+
+    Pass the position to ``commit_incoming_emails`` once the emails are
+    saved; until then the next call returns them again. The position is
+    None when there is nothing to commit (POP3, errors).
+    """
+    if EMAIL_RETRIEVAL_METHOD == "POP3":
+        emails = EmailReceiver.get_emails(limit=limit, unread_only=True)
+        position = None
+    else:
+        # Only messages that arrived since the last committed poll
+        emails, position = EmailReceiver.sync_mailbox(folder=folder, limit=limit)
     processed_emails = []
 
     for email_data in emails:
-        # Mark as read
-        EmailReceiver.mark_as_read(email_data["id"])
-
         # Process the email (e.g., categorize, extract information)
         processed_email = {
             "id": email_data["id"],
@@ -755,24 +1589,30 @@ def process_incoming_emails(limit: int = 10) -> List[Dict[str, Any]]:
             "from": email_data["from"],
             "date": email_data["date"],
             "body": email_data["body_text"] or email_data["body_html"],
-            "has_attachments": len(email_data["attachments"]) > 0,
+            "has_attachments": email_data.get("has_attachments", len(email_data["attachments"]) > 0),
+            "truncated": email_data.get("truncated", False),
             "processed_date": datetime.now().isoformat()
         }
 
         processed_emails.append(processed_email)
 
-    return processed_emails
+    return processed_emails, position
+
+
+def commit_incoming_emails(position: Optional[Dict[str, Any]]) -> bool:
+    """Advance the sync position of ``process_incoming_emails`` and mark its messages read."""
+    if position is None:
+        return True
+    return EmailReceiver.commit_sync(position, mark_seen=True)
 
 
 # Initialize the module
 def init():
     """Initialize the email service module."""
     # Create templates directory if it doesn't exist
+    # (the sender workers are started by the application, see start_email_queue_processor)
     os.makedirs(TEMPLATE_DIR, exist_ok=True)
 
-    # Start the email queue processor
-    start_email_queue_processor()
-
     # Check if email configuration is valid
     if not EMAIL_HOST or not EMAIL_HOST_USER or not EMAIL_HOST_PASSWORD:
         logger.warning("Email configuration is incomplete. Email functionality will be limited.")
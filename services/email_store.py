@@ -0,0 +1,345 @@
+"""
+On-disk state for the email service.
+
+Persists the outbound email queue in a local SQLite database so pending and
+retrying messages survive restarts, and hands out due messages ordered by
+priority and due time. The same database remembers how far each IMAP folder
+has been synced.
+"""
+
+import base64
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Message states in the outbound queue
+STATUS_PENDING = "pending"
+STATUS_SENDING = "sending"
+STATUS_FAILED = "failed"
+
+
+def _encode(value: Any) -> Any:
+    """Make email data JSON-serializable (attachment bytes become base64)."""
+    if isinstance(value, (bytes, bytearray)):
+        return {"__bytes__": base64.b64encode(bytes(value)).decode("ascii")}
+    if isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    return value
+
+
+def _decode(value: Any) -> Any:
+    """Reverse of _encode."""
+    if isinstance(value, dict):
+        if set(value) == {"__bytes__"}:
+            return base64.b64decode(value["__bytes__"])
+        return {key: _decode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+
+class OutboundEmailQueue:
+    """Persistent, priority-aware queue of outbound emails.
+
+    Due messages are claimed by lowest priority number first (1 = high) and
+    then by due time. Consumers block in ``claim_next`` until the next
+    message is due or a new message is enqueued in this process.
+
+    Several processes may share the database. A claim is a lease held by this
+    queue object (``owner``): only the owner completes, retries or fails the
+    message, and a message whose lease is older than ``lease`` seconds
+    (its sender died mid-send) can be claimed again by anyone.
+    """
+
+    def __init__(self, path: str, poll_interval: float = 30.0, lease: float = 900.0):
+        self.path = str(path)
+        # Upper bound on sleeping, so messages enqueued by other processes are noticed
+        self.poll_interval = poll_interval
+        # Longer than any single delivery may take, or a slow send is sent twice
+        self.lease = lease
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+        CREATE TABLE IF NOT EXISTS outbound_queue (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            priority INTEGER NOT NULL DEFAULT 3,
+            status TEXT NOT NULL DEFAULT 'pending',
+            retries INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            last_error TEXT,
+            payload TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_outbound_due
+            ON outbound_queue (status, priority, next_attempt_at);
+        CREATE INDEX IF NOT EXISTS idx_outbound_next
+            ON outbound_queue (status, next_attempt_at);
+        """)
+        # Claim owner and lease start, added after the first release
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(outbound_queue)")}
+        if "claimed_by" not in columns:
+            self._conn.execute("ALTER TABLE outbound_queue ADD COLUMN claimed_by TEXT")
+        if "claimed_at" not in columns:
+            self._conn.execute("ALTER TABLE outbound_queue ADD COLUMN claimed_at REAL")
+
+        self._counters = {"enqueued": 0, "sent": 0, "retried": 0, "failed": 0}
+
+    @contextmanager
+    def _transaction(self):
+        """Run statements in an immediate (write-locked) transaction."""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self._conn
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        else:
+            self._conn.execute("COMMIT")
+
+    def enqueue(self, email_data: Dict[str, Any], priority: int = 3, delay: float = 0, retries: int = 0) -> int:
+        """Persist a message to be sent after ``delay`` seconds. Returns its queue id."""
+        now = time.time()
+        payload = json.dumps(_encode(email_data))
+        with self._wakeup:
+            cursor = self._conn.execute(
+                """
+                INSERT INTO outbound_queue (priority, status, retries, next_attempt_at, created_at, updated_at, payload)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (int(priority or 3), STATUS_PENDING, retries, now + delay, now, now, payload)
+            )
+            self._counters["enqueued"] += 1
+            self._wakeup.notify()
+            return cursor.lastrowid
+
+    def claim_next(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Claim the most urgent due message, waiting until one is due.
+
+        Messages whose claim lease expired count as due. Returns a job dict
+        (``id``, ``priority``, ``retries``, ``email_data``) or None if nothing
+        became due within ``timeout`` seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._wakeup:
+            while True:
+                now = time.time()
+                with self._transaction() as conn:
+                    row = conn.execute(
+                        """
+                        SELECT id, priority, retries, payload FROM outbound_queue
+                        WHERE (status = ? AND next_attempt_at <= ?)
+                           OR (status = ? AND COALESCE(claimed_at, updated_at) < ?)
+                        ORDER BY priority, next_attempt_at
+                        LIMIT 1
+                        """,
+                        (STATUS_PENDING, now, STATUS_SENDING, now - self.lease)
+                    ).fetchone()
+                    if row is not None:
+                        conn.execute(
+                            """
+                            UPDATE outbound_queue
+                            SET status = ?, claimed_by = ?, claimed_at = ?, updated_at = ?
+                            WHERE id = ?
+                            """,
+                            (STATUS_SENDING, self.owner, now, now, row["id"])
+                        )
+                if row is not None:
+                    return {
+                        "id": row["id"],
+                        "priority": row["priority"],
+                        "retries": row["retries"],
+                        "email_data": _decode(json.loads(row["payload"])),
+                    }
+
+                # Sleep until the next message is due (or we are woken by enqueue)
+                next_due = self._conn.execute(
+                    """
+                    SELECT MIN(CASE WHEN status = ? THEN next_attempt_at
+                                    ELSE COALESCE(claimed_at, updated_at) + ? END)
+                    FROM outbound_queue WHERE status IN (?, ?)
+                    """,
+                    (STATUS_PENDING, self.lease, STATUS_PENDING, STATUS_SENDING)
+                ).fetchone()[0]
+                wait = self.poll_interval if next_due is None else min(self.poll_interval, max(0.0, next_due - now))
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                    wait = min(wait, remaining)
+                self._wakeup.wait(wait)
+
+    def complete(self, job_id: int):
+        """Remove a successfully sent message."""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM outbound_queue WHERE id = ? AND claimed_by = ?", (job_id, self.owner)
+            )
+            self._counters["sent"] += 1
+
+    def retry(self, job_id: int, retries: int, delay: float, error: str = None):
+        """Put a claimed message back to be retried after ``delay`` seconds."""
+        now = time.time()
+        with self._wakeup:
+            self._conn.execute(
+                """
+                UPDATE outbound_queue
+                SET status = ?, retries = ?, next_attempt_at = ?, updated_at = ?, last_error = ?,
+                    claimed_by = NULL, claimed_at = NULL
+                WHERE id = ? AND claimed_by = ?
+                """,
+                (STATUS_PENDING, retries, now + delay, now, error, job_id, self.owner)
+            )
+            self._counters["retried"] += 1
+            self._wakeup.notify()
+
+    def fail(self, job_id: int, error: str = None):
+        """Mark a message as permanently failed (kept for inspection)."""
+        with self._lock:
+            self._conn.execute(
+                """
+                UPDATE outbound_queue SET status = ?, updated_at = ?, last_error = ?
+                WHERE id = ? AND claimed_by = ?
+                """,
+                (STATUS_FAILED, time.time(), error, job_id, self.owner)
+            )
+            self._counters["failed"] += 1
+
+    def recover(self) -> int:
+        """Return messages whose claim lease expired (their sender died mid-send) to the pending state.
+
+        Messages being sent by a live process, this one or another, keep their claim.
+        """
+        now = time.time()
+        with self._wakeup:
+            cursor = self._conn.execute(
+                """
+                UPDATE outbound_queue
+                SET status = ?, claimed_by = NULL, claimed_at = NULL, updated_at = ?
+                WHERE status = ? AND COALESCE(claimed_at, updated_at) < ?
+                """,
+                (STATUS_PENDING, now, STATUS_SENDING, now - self.lease)
+            )
+            self._wakeup.notify_all()
+            return cursor.rowcount
+
+    def spooled_attachments(self) -> Set[str]:
+        """SHA-256 names of the spool files referenced by messages still in the queue."""
+        with self._lock:
+            payloads = [row["payload"] for row in self._conn.execute("SELECT payload FROM outbound_queue")]
+        referenced = set()
+        for payload in payloads:
+            for attachment in json.loads(payload).get("attachments") or []:
+                if isinstance(attachment, dict) and attachment.get("path") and attachment.get("sha256"):
+                    referenced.add(attachment["sha256"])
+        return referenced
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth and age metrics."""
+        now = time.time()
+        with self._lock:
+            by_status = {
+                row["status"]: row["count"]
+                for row in self._conn.execute(
+                    "SELECT status, COUNT(*) as count FROM outbound_queue GROUP BY status"
+                )
+            }
+            by_priority = {
+                row["priority"]: row["count"]
+                for row in self._conn.execute(
+                    "SELECT priority, COUNT(*) as count FROM outbound_queue WHERE status = ? GROUP BY priority",
+                    (STATUS_PENDING,)
+                )
+            }
+            oldest, next_due, overdue = self._conn.execute(
+                """
+                SELECT MIN(created_at), MIN(next_attempt_at), SUM(next_attempt_at <= ?)
+                FROM outbound_queue WHERE status = ?
+                """,
+                (now, STATUS_PENDING)
+            ).fetchone()
+            counters = dict(self._counters)
+
+        return {
+            "pending": by_status.get(STATUS_PENDING, 0),
+            "sending": by_status.get(STATUS_SENDING, 0),
+            "failed": by_status.get(STATUS_FAILED, 0),
+            "due": overdue or 0,
+            "pending_by_priority": by_priority,
+            "oldest_pending_age": now - oldest if oldest is not None else 0.0,
+            "next_due_in": max(0.0, next_due - now) if next_due is not None else None,
+            **counters,
+        }
+
+
+class MailboxSyncState:
+    """Per-folder IMAP sync position (UIDVALIDITY and the last ingested UID)."""
+
+    def __init__(self, path: str):
+        self.path = str(path)
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+        CREATE TABLE IF NOT EXISTS mailbox_state (
+            folder TEXT PRIMARY KEY,
+            uidvalidity INTEGER NOT NULL,
+            last_uid INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL
+        )
+        """)
+
+    def get(self, folder: str) -> Optional[Tuple[int, int]]:
+        """Return ``(uidvalidity, last_uid)`` for a folder, or None if it was never synced."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT uidvalidity, last_uid FROM mailbox_state WHERE folder = ?", (folder,)
+            ).fetchone()
+        return (row["uidvalidity"], row["last_uid"]) if row else None
+
+    def update(self, folder: str, uidvalidity: int, last_uid: int):
+        """Record that all messages up to ``last_uid`` have been synced."""
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO mailbox_state (folder, uidvalidity, last_uid, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (folder) DO UPDATE SET
+                    uidvalidity = excluded.uidvalidity,
+                    last_uid = excluded.last_uid,
+                    updated_at = excluded.updated_at
+                """,
+                (folder, uidvalidity, last_uid, time.time())
+            )
+
+    def reset(self, folder: str):
+        """Forget a folder's position so the next sync starts over."""
+        with self._lock:
+            self._conn.execute("DELETE FROM mailbox_state WHERE folder = ?", (folder,))
@@ -0,0 +1,292 @@
+"""
+Long-lived IMAP connections for the email service.
+
+``IMAPSession`` keeps one authenticated connection open and shares it between
+callers (sync, flag and move operations) instead of logging in per call.
+``IdleListener`` holds a separate connection in IMAP IDLE (RFC 2177) and calls
+back as soon as the server reports new messages, reconnecting with backoff
+when the connection drops.
+"""
+
+import imaplib
+import logging
+import random
+import re
+import select
+import socket
+import ssl
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Errors after which an IMAP connection is considered dead
+CONNECTION_ERRORS = (imaplib.IMAP4.abort, socket.error, EOFError)
+
+# Untagged responses that mean new mail arrived in the selected folder
+NEW_MAIL_PATTERN = re.compile(rb"^\* \d+ (EXISTS|RECENT)\b")
+
+
+class IMAPSession:
+    """A shared, persistent IMAP connection (one command sequence at a time)."""
+
+    def __init__(self, connect: Callable[[], imaplib.IMAP4], noop_interval: float = 60.0):
+        self._connect = connect
+        # Connections idle longer than this are checked with NOOP before use
+        self.noop_interval = noop_interval
+        self._lock = threading.RLock()
+        self._mail: Optional[imaplib.IMAP4] = None
+        self._last_used = 0.0
+        self._stats = {"logins": 0, "reuses": 0, "reconnects": 0}
+
+    def _ensure(self) -> imaplib.IMAP4:
+        if self._mail is not None and time.monotonic() - self._last_used > self.noop_interval:
+            try:
+                self._mail.noop()
+            except Exception:
+                self._drop()
+                self._stats["reconnects"] += 1
+        if self._mail is None:
+            self._mail = self._connect()
+            self._stats["logins"] += 1
+        else:
+            self._stats["reuses"] += 1
+        return self._mail
+
+    def _drop(self):
+        if self._mail is not None:
+            try:
+                self._mail.logout()
+            except Exception:
+                pass
+            self._mail = None
+
+    @contextmanager
+    def session(self):
+        """Use the shared connection exclusively; it is replaced if it fails."""
+        with self._lock:
+            mail = self._ensure()
+            try:
+                yield mail
+            except CONNECTION_ERRORS:
+                self._drop()
+                raise
+            finally:
+                self._last_used = time.monotonic()
+
+    def close(self):
+        """Log out of the shared connection."""
+        with self._lock:
+            self._drop()
+
+    def stats(self):
+        """Return login/reuse counters."""
+        with self._lock:
+            return dict(self._stats, connected=self._mail is not None)
+
+
+def _buffered_bytes(mail: imaplib.IMAP4) -> bytes:
+    """Take the bytes imaplib has read from the socket but not consumed yet.
+
+    imaplib reads through a buffered file, so lines the server sent right
+    after a response may already sit there rather than in the socket.
+    """
+    sock = mail.socket()
+    timeout = sock.gettimeout()
+    sock.setblocking(False)
+    data = b""
+    try:
+        while True:
+            chunk = mail.file.read1(65536)
+            if not chunk:
+                break
+            data += chunk
+    except (BlockingIOError, ssl.SSLWantReadError):
+        pass
+    finally:
+        sock.settimeout(timeout)
+    return data
+
+
+class _LineReader:
+    """Reads CRLF-terminated lines straight from the socket with a timeout."""
+
+    def __init__(self, sock, buffered: bytes = b""):
+        self.sock = sock
+        self.buffer = buffered
+
+    def readline(self, timeout: float) -> Optional[bytes]:
+        deadline = time.monotonic() + timeout
+        while b"\r\n" not in self.buffer:
+            remaining = deadline - time.monotonic()
+            # SSL sockets may hold decrypted bytes that select() can't see
+            pending = getattr(self.sock, "pending", lambda: 0)()
+            if not pending:
+                if remaining <= 0:
+                    return None
+                readable, _, _ = select.select([self.sock], [], [], remaining)
+                if not readable:
+                    return None
+            data = self.sock.recv(65536)
+            if not data:
+                raise EOFError("IMAP connection closed by server")
+            self.buffer += data
+        line, self.buffer = self.buffer.split(b"\r\n", 1)
+        return line
+
+
+class IdleListener:
+    """Waits for new mail with IMAP IDLE and invokes ``on_new_mail`` in its own thread.
+
+    ``on_new_mail`` is also called after every (re)connect so nothing that
+    arrived while disconnected is missed. Servers without IDLE are polled.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], imaplib.IMAP4],
+        on_new_mail: Callable[[], None],
+        folder: str = "INBOX",
+        idle_timeout: float = 29 * 60,
+        poll_interval: float = 60.0,
+        max_backoff: float = 300.0
+    ):
+        self._connect = connect
+        self.on_new_mail = on_new_mail
+        self.folder = folder
+        # RFC 2177: re-issue IDLE before the server's 30 minute inactivity timeout
+        self.idle_timeout = idle_timeout
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {"connects": 0, "failures": 0, "notifications": 0, "last_event": None}
+        self._idle_count = 0
+
+    def start(self):
+        """Start listening in a daemon thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"imap-idle-{self.folder}", daemon=True)
+        self._thread.start()
+        logger.info(f"IMAP IDLE listener started for {self.folder}")
+
+    def stop(self, timeout: float = 10.0):
+        """Stop listening (the current IDLE is ended within a few seconds)."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def stats(self):
+        """Return connection and notification counters."""
+        return dict(self._stats, running=bool(self._thread and self._thread.is_alive()))
+
+    def _notify(self):
+        self._stats["notifications"] += 1
+        self._stats["last_event"] = time.time()
+        try:
+            self.on_new_mail()
+        except Exception as e:
+            logger.error(f"Error handling new mail in {self.folder}: {str(e)}")
+
+    def _run(self):
+        failures = 0
+        while not self._stop.is_set():
+            mail = None
+            try:
+                mail = self._connect()
+                status, _ = mail.select(self.folder, readonly=True)
+                if status != "OK":
+                    raise imaplib.IMAP4.error(f"Failed to select {self.folder}: {status}")
+                self._stats["connects"] += 1
+                failures = 0
+
+                # Catch up on anything that arrived while we were not listening
+                self._notify()
+
+                supports_idle = "IDLE" in mail.capabilities
+                if supports_idle:
+                    # From here on the connection is only read through this reader
+                    reader = _LineReader(mail.socket(), _buffered_bytes(mail))
+                else:
+                    logger.warning("IMAP server does not support IDLE, polling instead")
+
+                while not self._stop.is_set():
+                    if supports_idle:
+                        new_mail = self._idle(mail, reader)
+                    else:
+                        self._stop.wait(self.poll_interval)
+                        mail.noop()
+                        new_mail = True
+                    if new_mail and not self._stop.is_set():
+                        self._notify()
+
+            except Exception as e:
+                failures += 1
+                self._stats["failures"] += 1
+                # Exponential backoff with jitter so many workers don't reconnect in lockstep
+                delay = min(self.max_backoff, 2 ** min(failures, 10)) * random.uniform(0.5, 1.5)
+                logger.warning(f"IMAP IDLE connection lost ({str(e)}), reconnecting in {delay:.0f}s")
+                self._stop.wait(delay)
+
+            finally:
+                if mail is not None:
+                    try:
+                        mail.logout()
+                    except Exception:
+                        pass
+
+    def _idle(self, mail: imaplib.IMAP4, reader: _LineReader) -> bool:
+        """Run one IDLE command. Returns True if new mail was reported."""
+        # Own tag prefix, so it can't collide with imaplib's tags on this connection
+        self._idle_count += 1
+        tag = b"IDLE%d" % self._idle_count
+        mail.send(tag + b" IDLE\r\n")
+
+        new_mail = False
+        while True:
+            line = reader.readline(timeout=30)
+            if line is None:
+                raise imaplib.IMAP4.abort("IDLE not acknowledged")
+            if line.startswith(b"+"):
+                break
+            if NEW_MAIL_PATTERN.match(line):
+                # Reported before the IDLE started (e.g. buffered by imaplib)
+                new_mail = True
+            elif not line.startswith(b"*"):
+                raise imaplib.IMAP4.abort(f"IDLE rejected: {line!r}")
+
+        if not new_mail:
+            new_mail = self._wait_for_mail(reader)
+
+        mail.send(b"DONE\r\n")
+        while True:
+            line = reader.readline(timeout=30)
+            if line is None:
+                raise imaplib.IMAP4.abort("No response to IDLE DONE")
+            if line.startswith(b"* BYE"):
+                raise imaplib.IMAP4.abort(line.decode(errors="replace"))
+            # Mail arriving between DONE and the tagged reply is reported here
+            if NEW_MAIL_PATTERN.match(line):
+                new_mail = True
+            if line.startswith(tag + b" "):
+                if not line[len(tag):].strip().startswith(b"OK"):
+                    raise imaplib.IMAP4.abort(line.decode(errors="replace"))
+                return new_mail
+
+    def _wait_for_mail(self, reader: _LineReader) -> bool:
+        """Read IDLE updates until new mail is reported, the IDLE times out or stop() is called."""
+        deadline = time.monotonic() + self.idle_timeout
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            # Short waits so stop() is noticed promptly
+            line = reader.readline(timeout=min(5.0, max(0.0, deadline - time.monotonic())))
+            if line is None:
+                continue
+            if line.startswith(b"* BYE"):
+                raise imaplib.IMAP4.abort(line.decode(errors="replace"))
+            if NEW_MAIL_PATTERN.match(line):
+                return True
+        return False
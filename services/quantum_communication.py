@@ -7,8 +7,7 @@ quantum-inspired algorithms to optimize client interactions.
 
 import os
 import logging
-import random
-import math
+import numpy as np
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional, Tuple
 
@@ -27,62 +26,89 @@ class QuantumPrioritizer:
     """Class for prioritizing communications using quantum-inspired algorithms."""
     
     @staticmethod
-    def calculate_entanglement_score(client_id: int, urgency_factor: float = 1.0) -> float:
+    def calculate_entanglement_scores(
+        client_ids: List[int],
+        urgency_factors: Optional[Dict[int, float]] = None
+    ) -> Dict[int, float]:
         """
-        Calculate an entanglement score for a client based on their history and importance.
+        Calculate entanglement scores for a batch of clients with a single lookup.
         
-        Higher scores indicate higher priority for communications.
+        Only the recency decay depends on the current time; every other factor
+        comes from the incrementally maintained client features.
+        
+        Returns a dict mapping client id to score. Clients that do not exist are omitted.
         """
+        client_ids = sorted({int(client_id) for client_id in client_ids if client_id})
+        if not client_ids:
+            return {}
+        
         try:
-            # Get client data
-            query = """
-            SELECT c.*, 
-                   COUNT(DISTINCT k.id) as communication_count,
-                   COUNT(DISTINCT u.id) as device_count,
-                   MAX(k.data_czas) as last_communication,
-                   AVG(u.wartość) as avg_device_value
-            FROM klienci c
-            LEFT JOIN komunikacja k ON c.id = k.id_klienta
-            LEFT JOIN urządzenia_hvac u ON u.id_klienta = c.id
-            WHERE c.id = %s
-            GROUP BY c.id
-            """
-            
-            result = db.execute_query(query, [client_id])
-            if not result:
-                return 0.0
-            
-            client_data = result[0]
-            
-            # Base factors
-            recency_factor = 1.0
-            if client_data.get('last_communication'):
-                days_since_last = (datetime.now() - client_data['last_communication']).days
-                recency_factor = math.exp(-0.05 * days_since_last)  # Exponential decay
-            
-            communication_factor = min(1.0, client_data.get('communication_count', 0) / 20.0)
-            device_factor = min(1.0, client_data.get('device_count', 0) / 5.0)
-            value_factor = min(1.0, client_data.get('avg_device_value', 0) / 10000.0)
-            wealth_factor = min(1.0, client_data.get('ocena_zamożności', 0) / 10.0)
-            
-            # Apply quantum uncertainty principle (small random variation)
-            quantum_uncertainty = random.uniform(0.9, 1.1) * QUANTUM_CHANNEL_STABILITY
-            
-            # Calculate final score with weighted factors
-            entanglement_score = (
-                0.3 * recency_factor +
-                0.2 * communication_factor +
-                0.2 * device_factor +
-                0.15 * value_factor +
-                0.15 * wealth_factor
-            ) * urgency_factor * quantum_uncertainty
+            # Features are maintained incrementally in klienci_cechy, so this is
+            # a primary-key lookup rather than an aggregate over komunikacja
+            rows = db.get_client_features(client_ids)
+            if not rows:
+                return {}
             
-            logger.info(f"Entanglement score for client {client_id}: {entanglement_score:.4f}")
-            return entanglement_score
+            return QuantumPrioritizer._score_rows(rows, urgency_factors)
         
         except Exception as e:
-            logger.error(f"Error calculating entanglement score: {str(e)}")
-            return 0.5  # Default middle priority
+            logger.error(f"Error calculating entanglement scores: {str(e)}")
+            return {client_id: 0.5 for client_id in client_ids}  # Default middle priority
+    
+    @staticmethod
+    def _score_rows(
+        rows: List[Dict[str, Any]],
+        urgency_factors: Optional[Dict[int, float]] = None
+    ) -> Dict[int, float]:
+        """Apply the weighted entanglement formula to a batch of client feature rows."""
+        now = datetime.now()
+        ids = np.array([row['id'] for row in rows])
+        
+        days_since_last = np.array([
+            (now - row['last_communication']).days if row.get('last_communication') else np.nan
+            for row in rows
+        ], dtype=float)
+        communication_count = np.array([row.get('communication_count') or 0 for row in rows], dtype=float)
+        device_count = np.array([row.get('device_count') or 0 for row in rows], dtype=float)
+        avg_device_value = np.array([row.get('avg_device_value') or 0 for row in rows], dtype=float)
+        wealth = np.array([row.get('ocena_zamożności') or 0 for row in rows], dtype=float)
+        
+        # Exponential decay of recency; clients without history get full weight
+        recency_factor = np.where(np.isnan(days_since_last), 1.0, np.exp(-0.05 * np.nan_to_num(days_since_last)))
+        communication_factor = np.minimum(1.0, communication_count / 20.0)
+        device_factor = np.minimum(1.0, device_count / 5.0)
+        value_factor = np.minimum(1.0, avg_device_value / 10000.0)
+        wealth_factor = np.minimum(1.0, wealth / 10.0)
+        
+        # Apply quantum uncertainty principle (small random variation)
+        quantum_uncertainty = np.random.uniform(0.9, 1.1, size=len(rows)) * QUANTUM_CHANNEL_STABILITY
+        
+        urgency = np.ones(len(rows))
+        if urgency_factors:
+            urgency = np.array([urgency_factors.get(client_id, 1.0) for client_id in ids.tolist()], dtype=float)
+        
+        # Calculate final scores with weighted factors
+        scores = (
+            0.3 * recency_factor +
+            0.2 * communication_factor +
+            0.2 * device_factor +
+            0.15 * value_factor +
+            0.15 * wealth_factor
+        ) * urgency * quantum_uncertainty
+        
+        return dict(zip(ids.tolist(), scores.tolist()))
+    
+    @staticmethod
+    def calculate_entanglement_score(client_id: int, urgency_factor: float = 1.0) -> float:
+        """
+        Calculate an entanglement score for a client based on their history and importance.
+        
+        Higher scores indicate higher priority for communications.
+        """
+        scores = QuantumPrioritizer.calculate_entanglement_scores([client_id], {client_id: urgency_factor})
+        entanglement_score = scores.get(client_id, 0.0)
+        logger.info(f"Entanglement score for client {client_id}: {entanglement_score:.4f}")
+        return entanglement_score
     
     @staticmethod
     def prioritize_communications(communications: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -95,6 +121,11 @@ class QuantumPrioritizer:
             return []
         
         try:
+            # Score every distinct client in one batch
+            entanglement_scores = QuantumPrioritizer.calculate_entanglement_scores(
+                [comm.get('id_klienta') for comm in communications]
+            )
+            
             # Calculate priority scores for each communication
             for comm in communications:
                 client_id = comm.get('id_klienta')
@@ -103,7 +134,7 @@ class QuantumPrioritizer:
                     continue
                 
                 # Base entanglement score
-                entanglement_score = QuantumPrioritizer.calculate_entanglement_score(client_id)
+                entanglement_score = entanglement_scores.get(client_id, 0.0)
                 
                 # Adjust based on communication properties
                 urgency_multiplier = 1.0
@@ -146,60 +177,125 @@ class QuantumPrioritizer:
 class QuantumResponseGenerator:
     """Class for generating optimized responses using quantum-inspired algorithms."""
     
+    @staticmethod
+    def _response_time_from_hours(hours: List[int], comm_type: str) -> datetime:
+        """Calculate the suggested response time from the hours of a client's recent messages."""
+        if not hours:
+            return datetime.now() + timedelta(hours=1)  # Default: respond within an hour
+        
+        # Find most common hour for client communications
+        hour_counts = {}
+        for hour in hours:
+            hour_counts[hour] = hour_counts.get(hour, 0) + 1
+        
+        preferred_hour = max(hour_counts.items(), key=lambda x: x[1])[0]
+        
+        # Calculate response time based on communication type and preferred hour
+        now = datetime.now()
+        if comm_type == 'telefon':
+            # For phone calls, respond within 1 hour
+            return now + timedelta(hours=1)
+        elif comm_type == 'SMS':
+            # For SMS, respond within 2 hours
+            return now + timedelta(hours=2)
+        else:  # email
+            # For email, respond same day if before 3pm, otherwise next day at preferred hour
+            if now.hour < 15:  # Before 3pm
+                target = now.replace(hour=preferred_hour, minute=0, second=0)
+                if target < now:  # If preferred hour has passed today
+                    target = now + timedelta(hours=3)  # Respond within 3 hours
+            else:
+                # Next day at preferred hour
+                target = (now + timedelta(days=1)).replace(hour=preferred_hour, minute=0, second=0)
+            
+            return target
+    
+    @staticmethod
+    def _get_recent_hours(client_ids: List[int]) -> Dict[int, List[int]]:
+        """Get the hours of the last 20 incoming messages for each client in one query."""
+        query = """
+        SELECT id_klienta, EXTRACT(HOUR FROM data_czas)::int as hour
+        FROM (
+            SELECT id_klienta, data_czas,
+                   ROW_NUMBER() OVER (PARTITION BY id_klienta ORDER BY data_czas DESC) as rn
+            FROM komunikacja
+            WHERE id_klienta = ANY(%s) AND kierunek = 'przychodzący'
+        ) recent
+        WHERE rn <= 20
+        """
+        
+        result = db.execute_query(query, [sorted(set(client_ids))])
+        hours = {}
+        for row in result or []:
+            hours.setdefault(row['id_klienta'], []).append(row['hour'])
+        return hours
+    
     @staticmethod
     def suggest_response_time(client_id: int, comm_type: str) -> datetime:
         """
         Suggest the optimal time to respond to a client based on their history and preferences.
         """
         try:
-            # Get client communication history
-            query = """
-            SELECT data_czas 
-            FROM komunikacja 
-            WHERE id_klienta = %s AND kierunek = 'przychodzący'
-            ORDER BY data_czas DESC
-            LIMIT 20
-            """
-            
-            result = db.execute_query(query, [client_id])
-            if not result:
-                return datetime.now() + timedelta(hours=1)  # Default: respond within an hour
-            
-            # Analyze communication patterns
-            timestamps = [row['data_czas'] for row in result]
-            hours = [ts.hour for ts in timestamps]
-            
-            # Find most common hour for client communications
-            hour_counts = {}
-            for hour in hours:
-                hour_counts[hour] = hour_counts.get(hour, 0) + 1
-            
-            preferred_hour = max(hour_counts.items(), key=lambda x: x[1])[0]
-            
-            # Calculate response time based on communication type and preferred hour
-            now = datetime.now()
-            if comm_type == 'telefon':
-                # For phone calls, respond within 1 hour
-                return now + timedelta(hours=1)
-            elif comm_type == 'SMS':
-                # For SMS, respond within 2 hours
-                return now + timedelta(hours=2)
-            else:  # email
-                # For email, respond same day if before 3pm, otherwise next day at preferred hour
-                if now.hour < 15:  # Before 3pm
-                    target = now.replace(hour=preferred_hour, minute=0, second=0)
-                    if target < now:  # If preferred hour has passed today
-                        target = now + timedelta(hours=3)  # Respond within 3 hours
-                else:
-                    # Next day at preferred hour
-                    target = (now + timedelta(days=1)).replace(hour=preferred_hour, minute=0, second=0)
-                
-                return target
+            hours = QuantumResponseGenerator._get_recent_hours([client_id])
+            return QuantumResponseGenerator._response_time_from_hours(hours.get(client_id, []), comm_type)
         
         except Exception as e:
             logger.error(f"Error suggesting response time: {str(e)}")
             return datetime.now() + timedelta(hours=2)  # Default fallback
     
+    @staticmethod
+    def suggest_response_times(communications: List[Dict[str, Any]]) -> Dict[int, datetime]:
+        """
+        Suggest response times for a batch of communications with a single history query.
+        
+        Returns a dict mapping communication id to the suggested response time.
+        """
+        try:
+            hours = QuantumResponseGenerator._get_recent_hours(
+                [comm['id_klienta'] for comm in communications if comm.get('id_klienta')]
+            )
+            return {
+                comm['id']: QuantumResponseGenerator._response_time_from_hours(
+                    hours.get(comm.get('id_klienta'), []), comm.get('typ')
+                )
+                for comm in communications
+            }
+        
+        except Exception as e:
+            logger.error(f"Error suggesting response times: {str(e)}")
+            fallback = datetime.now() + timedelta(hours=2)  # Default fallback
+            return {comm['id']: fallback for comm in communications}
+    
+    @staticmethod
+    def suggestions_for_classification(classification: Optional[str]) -> List[str]:
+        """Get response templates for a communication classification."""
+        classification = (classification or '').lower()
+        
+        if 'reklamacja' in classification:
+            return [
+                "Przepraszamy za problemy. Rozumiemy Państwa frustrację i natychmiast zajmiemy się tą sprawą.",
+                "Dziękujemy za zgłoszenie problemu. Traktujemy tę sprawę priorytetowo i skontaktujemy się wkrótce z rozwiązaniem.",
+                "Przykro nam z powodu tej sytuacji. Nasz zespół techniczny już analizuje zgłoszenie i wkrótce się z Państwem skontaktuje."
+            ]
+        elif 'zapytanie' in classification:
+            return [
+                "Dziękujemy za zainteresowanie naszymi usługami. Z przyjemnością odpowiemy na wszystkie pytania.",
+                "Doceniamy Państwa zapytanie. Przygotujemy szczegółową odpowiedź w ciągu 24 godzin.",
+                "Dziękujemy za kontakt. Chętnie udzielimy więcej informacji na temat naszych usług."
+            ]
+        elif 'podziękowanie' in classification:
+            return [
+                "Cieszymy się, że mogliśmy pomóc. Państwa zadowolenie jest dla nas najważniejsze.",
+                "Dziękujemy za miłe słowa. Zawsze staramy się zapewnić najwyższą jakość usług.",
+                "Doceniamy Państwa opinię. To dla nas motywacja do dalszej pracy."
+            ]
+        else:
+            return [
+                "Dziękujemy za wiadomość. Odpowiemy najszybciej jak to możliwe.",
+                "Potwierdzamy otrzymanie Państwa wiadomości. Wkrótce się skontaktujemy.",
+                "Dziękujemy za kontakt z HVAC Solutions. Odpowiemy na Państwa wiadomość w ciągu 24 godzin."
+            ]
+    
     @staticmethod
     def generate_response_suggestions(communication_id: int) -> List[str]:
         """
@@ -212,32 +308,7 @@ class QuantumResponseGenerator:
                 return []
             
             # Basic response templates based on classification
-            classification = comm.get('klasyfikacja', '').lower()
-            
-            if 'reklamacja' in classification:
-                return [
-                    "Przepraszamy za problemy. Rozumiemy Państwa frustrację i natychmiast zajmiemy się tą sprawą.",
-                    "Dziękujemy za zgłoszenie problemu. Traktujemy tę sprawę priorytetowo i skontaktujemy się wkrótce z rozwiązaniem.",
-                    "Przykro nam z powodu tej sytuacji. Nasz zespół techniczny już analizuje zgłoszenie i wkrótce się z Państwem skontaktuje."
-                ]
-            elif 'zapytanie' in classification:
-                return [
-                    "Dziękujemy za zainteresowanie naszymi usługami. Z przyjemnością odpowiemy na wszystkie pytania.",
-                    "Doceniamy Państwa zapytanie. Przygotujemy szczegółową odpowiedź w ciągu 24 godzin.",
-                    "Dziękujemy za kontakt. Chętnie udzielimy więcej informacji na temat naszych usług."
-                ]
-            elif 'podziękowanie' in classification:
-                return [
-                    "Cieszymy się, że mogliśmy pomóc. Państwa zadowolenie jest dla nas najważniejsze.",
-                    "Dziękujemy za miłe słowa. Zawsze staramy się zapewnić najwyższą jakość usług.",
-                    "Doceniamy Państwa opinię. To dla nas motywacja do dalszej pracy."
-                ]
-            else:
-                return [
-                    "Dziękujemy za wiadomość. Odpowiemy najszybciej jak to możliwe.",
-                    "Potwierdzamy otrzymanie Państwa wiadomości. Wkrótce się skontaktujemy.",
-                    "Dziękujemy za kontakt z HVAC Solutions. Odpowiemy na Państwa wiadomość w ciągu 24 godzin."
-                ]
+            return QuantumResponseGenerator.suggestions_for_classification(comm.get('klasyfikacja'))
         
         except Exception as e:
             logger.error(f"Error generating response suggestions: {str(e)}")
@@ -270,14 +341,13 @@ def prioritize_inbox(limit: int = 20) -> List[Dict[str, Any]]:
         # Prioritize communications
         prioritized = QuantumPrioritizer.prioritize_communications(communications)
         
-        # Add suggested response times
+        # Add suggested response times and response suggestions from the rows we already have
+        response_times = QuantumResponseGenerator.suggest_response_times(prioritized)
         for comm in prioritized:
-            comm['suggested_response_time'] = QuantumResponseGenerator.suggest_response_time(
-                comm['id_klienta'], comm['typ']
+            comm['suggested_response_time'] = response_times.get(comm['id'])
+            comm['response_suggestions'] = QuantumResponseGenerator.suggestions_for_classification(
+                comm.get('klasyfikacja')
             )
-            
-            # Add response suggestions
-            comm['response_suggestions'] = QuantumResponseGenerator.generate_response_suggestions(comm['id'])
         
         return prioritized
     
@@ -286,26 +356,35 @@ def prioritize_inbox(limit: int = 20) -> List[Dict[str, Any]]:
         return []
 
 
-def get_client_entanglement_scores(limit: int = 10) -> List[Dict[str, Any]]:
+def get_client_entanglement_scores(limit: int = 10, client_ids: List[int] = None) -> List[Dict[str, Any]]:
     """
-    Get entanglement scores for top clients.
+    Get entanglement scores for top clients, or for the given clients.
     """
     try:
-        # Get active clients
-        query = """
-        SELECT id, nazwa, email
-        FROM klienci
-        ORDER BY data_rejestracji DESC
-        LIMIT %s
-        """
+        if client_ids:
+            query = """
+            SELECT id, nazwa, email
+            FROM klienci
+            WHERE id = ANY(%s)
+            """
+            clients = db.execute_query(query, [list(client_ids)])
+        else:
+            # Get active clients
+            query = """
+            SELECT id, nazwa, email
+            FROM klienci
+            ORDER BY data_rejestracji DESC
+            LIMIT %s
+            """
+            clients = db.execute_query(query, [limit])
         
-        clients = db.execute_query(query, [limit])
         if not clients:
             return []
         
-        # Calculate entanglement scores
+        # Calculate entanglement scores in one batch
+        scores = QuantumPrioritizer.calculate_entanglement_scores([client['id'] for client in clients])
         for client in clients:
-            client['entanglement_score'] = QuantumPrioritizer.calculate_entanglement_score(client['id'])
+            client['entanglement_score'] = scores.get(client['id'], 0.0)
         
         # Sort by entanglement score
         return sorted(clients, key=lambda x: x.get('entanglement_score', 0), reverse=True)
@@ -315,6 +394,43 @@ def get_client_entanglement_scores(limit: int = 10) -> List[Dict[str, Any]]:
         return []
 
 
+# The weighted formula of QuantumPrioritizer._score_rows without the random
+# uncertainty, so the database ranks and limits the clients
+ENTANGLEMENT_RANKING_QUERY = db.CLIENT_FEATURES_QUERY + """
+    ORDER BY (
+        0.3 * CASE WHEN f.ostatnia_komunikacja IS NULL THEN 1.0
+                   ELSE exp(-0.05 * EXTRACT(DAY FROM LOCALTIMESTAMP - f.ostatnia_komunikacja)) END
+        + 0.2 * LEAST(1.0, COALESCE(f.liczba_komunikacji, 0) / 20.0)
+        + 0.2 * LEAST(1.0, COALESCE(f.liczba_urządzeń, 0) / 5.0)
+        + 0.15 * LEAST(1.0, COALESCE(CASE WHEN f.liczba_wycenionych_urządzeń > 0
+                                          THEN f.suma_wartości_urządzeń / f.liczba_wycenionych_urządzeń
+                                     END, 0) / 10000.0)
+        + 0.15 * LEAST(1.0, COALESCE(f.ocena_zamożności, c.ocena_zamożności, 0) / 10.0)
+    ) DESC, c.id
+    LIMIT %s
+    """
+
+
+def rank_clients_by_entanglement(limit: int = 10) -> List[Dict[str, Any]]:
+    """
+    Rank all clients by entanglement score and return the top ones.
+    """
+    try:
+        clients = db.execute_query(ENTANGLEMENT_RANKING_QUERY, [limit])
+        if not clients:
+            return []
+        
+        scores = QuantumPrioritizer._score_rows(clients)
+        for client in clients:
+            client['entanglement_score'] = scores.get(client['id'], 0.0)
+        
+        return sorted(clients, key=lambda x: x.get('entanglement_score', 0), reverse=True)[:limit]
+    
+    except Exception as e:
+        logger.error(f"Error ranking clients by entanglement: {str(e)}")
+        return []
+
+
 # Initialize the module
 def init():
     """Initialize the quantum communication module."""
@@ -0,0 +1,202 @@
+"""
+Pooled SMTP transport for the email service.
+
+Keeps a small number of authenticated SMTP sessions open and reuses them for
+consecutive messages instead of connecting, running STARTTLS and logging in
+for every email. Idle sessions are checked with NOOP before reuse, and
+sessions dropped by the server (421, disconnects, timeouts) are replaced
+transparently.
+"""
+
+import logging
+import smtplib
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Errors after which a session is considered dead and the send can be retried on a fresh one
+TRANSIENT_ERRORS = (smtplib.SMTPServerDisconnected, socket.timeout, ConnectionError, OSError)
+
+
+class SMTPPoolTimeout(TimeoutError):
+    """No pooled SMTP session became available in time."""
+
+
+def is_transient(error: Exception) -> bool:
+    """Check whether an SMTP error means the session should be replaced and the send retried."""
+    if isinstance(error, smtplib.SMTPResponseException):
+        # 421: service not available, closing transmission channel
+        return error.smtp_code == 421
+    if isinstance(error, smtplib.SMTPException) and not isinstance(error, smtplib.SMTPServerDisconnected):
+        return False
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+class SMTPConnectionPool:
+    """A bounded pool of authenticated SMTP sessions shared by sender threads."""
+
+    def __init__(
+        self,
+        connect: Callable[[], smtplib.SMTP],
+        size: int = 3,
+        max_idle: float = 120.0,
+        noop_interval: float = 15.0,
+        max_messages: int = 100,
+        timeout: float = 60.0
+    ):
+        self._connect = connect
+        self.size = max(1, size)
+        # Sessions idle longer than this are closed rather than reused
+        self.max_idle = max_idle
+        # Sessions idle longer than this are checked with NOOP before reuse
+        self.noop_interval = noop_interval
+        # Many servers cap messages per session, so sessions are recycled
+        self.max_messages = max_messages
+        self.timeout = timeout
+
+        self._lock = threading.Condition(threading.Lock())
+        self._idle: List[Tuple[smtplib.SMTP, float, int]] = []  # (session, returned_at, messages sent)
+        self._open = 0
+
+        self._stats = {"connects": 0, "reuses": 0, "noop_failures": 0, "reconnects": 0, "messages": 0}
+
+    def _checkout(self, verify: bool = False) -> Tuple[smtplib.SMTP, int]:
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._lock:
+                while self._idle:
+                    smtp, returned_at, sent = self._idle.pop()
+                    idle_for = time.monotonic() - returned_at
+                    if idle_for > self.max_idle:
+                        self._close(smtp)
+                        self._open -= 1
+                        continue
+                    break
+                else:
+                    smtp = None
+
+                if smtp is None:
+                    if self._open < self.size:
+                        self._open += 1
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise SMTPPoolTimeout(f"No SMTP session available after {self.timeout:.0f}s")
+                        self._lock.wait(remaining)
+                        continue
+
+            if smtp is not None:
+                if (idle_for <= self.noop_interval and not verify) or self._alive(smtp):
+                    with self._lock:
+                        self._stats["reuses"] += 1
+                    return smtp, sent
+                self._close(smtp)
+                with self._lock:
+                    self._stats["noop_failures"] += 1
+            # Open a new session in place of the slot we reserved (or the dead one)
+            try:
+                smtp = self._connect()
+            except Exception:
+                with self._lock:
+                    self._open -= 1
+                    self._lock.notify()
+                raise
+            with self._lock:
+                self._stats["connects"] += 1
+            return smtp, 0
+
+    def _checkin(self, smtp: smtplib.SMTP, sent: int, broken: bool = False):
+        with self._lock:
+            if broken or sent >= self.max_messages:
+                self._close(smtp)
+                self._open -= 1
+            else:
+                self._idle.append((smtp, time.monotonic(), sent))
+            self._lock.notify()
+
+    @staticmethod
+    def _alive(smtp: smtplib.SMTP) -> bool:
+        try:
+            return smtp.noop()[0] == 250
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close(smtp: smtplib.SMTP):
+        try:
+            smtp.quit()
+        except Exception:
+            try:
+                smtp.close()
+            except Exception:
+                pass
+
+    @contextmanager
+    def session(self, verify: bool = False):
+        """Check out an SMTP session for exclusive use (``verify`` forces a NOOP check)."""
+        smtp, sent = self._checkout(verify=verify)
+        broken = False
+        try:
+            yield smtp
+        except Exception as e:
+            broken = is_transient(e)
+            raise
+        finally:
+            self._checkin(smtp, sent + 1, broken=broken)
+
+    def send_message(self, msg, retries: int = 1) -> Dict[str, Any]:
+        """Send a message over a pooled session, reconnecting on transient failures.
+
+        Only failures before the DATA command are retried: once it was sent
+        the server may have accepted the message, and a retry could deliver
+        it twice. ``SMTPPoolTimeout`` is raised without a retry.
+        """
+        attempt = 0
+        while True:
+            data_sent = False
+            try:
+                with self.session(verify=attempt > 0) as smtp:
+                    send_data = smtp.data
+
+                    def data(content):
+                        nonlocal data_sent
+                        data_sent = True
+                        return send_data(content)
+
+                    smtp.data = data
+                    try:
+                        refused = smtp.send_message(msg)
+                    finally:
+                        del smtp.data
+                with self._lock:
+                    self._stats["messages"] += 1
+                return refused
+            except SMTPPoolTimeout:
+                raise
+            except Exception as e:
+                if data_sent or attempt >= retries or not is_transient(e):
+                    raise
+                attempt += 1
+                with self._lock:
+                    self._stats["reconnects"] += 1
+                logger.warning(f"SMTP session dropped ({e}); retrying on a new session")
+
+    def close(self):
+        """Close all idle sessions."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            self._lock.notify_all()
+        for smtp, _, _ in idle:
+            self._close(smtp)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return session usage counters."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({"size": self.size, "open": self._open, "idle": len(self._idle)})
+        return stats
@@ -1,3 +1,4 @@
 # Import utilities
 from . import db
 from . import supabase_client
+from . import backend
@@ -0,0 +1,249 @@
+"""
+Asynchronous data access for the HVAC CRM/ERP data layer.
+
+The same helpers as ``utils.db``, as coroutines over a psycopg 3
+``AsyncConnectionPool``, so an asyncio gRPC server or a background worker can
+run many lookups concurrently on one event loop instead of tying up a thread
+per in-flight query. The SQL is shared with ``utils.db`` (listing builders,
+keysets, write statements), and so are the result cache, the query metrics
+and the invalidation hooks, so both APIs can be mixed in one process.
+
+Requires the optional ``psycopg[binary,pool]`` package. The pool belongs to
+the event loop that first used it; call ``close_pool()`` before that loop
+ends.
+
+Usage::
+
+    clients, next_cursor = await adb.get_clients_page(search="kowalski")
+    devices = await asyncio.gather(*(adb.get_device_by_id(i) for i in device_ids))
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from config import DB_HOST, DB_NAME, DB_USER, DB_PASSWORD, DB_PORT
+from config import DB_POOL_TIMEOUT, DB_POOL_MAX_IDLE, ADB_POOL_MIN_SIZE, ADB_POOL_MAX_SIZE
+from utils import db
+from utils import cache
+
+try:
+    from psycopg.conninfo import make_conninfo
+    from psycopg.rows import dict_row
+    from psycopg_pool import AsyncConnectionPool
+except ImportError:
+    make_conninfo = None
+    dict_row = None
+    AsyncConnectionPool = None
+
+_pool = None
+# Created inside the running loop: before Python 3.10 an asyncio.Lock binds to
+# the loop current at construction, not the one asyncio.run() starts later
+_pool_lock = None
+
+
+def _get_pool_lock():
+    global _pool_lock
+    if _pool_lock is None:
+        _pool_lock = asyncio.Lock()
+    return _pool_lock
+
+
+async def get_pool():
+    """Get the async connection pool, opening it on first use."""
+    global _pool
+    if _pool is None:
+        if AsyncConnectionPool is None:
+            raise RuntimeError("utils.adb requires psycopg 3 (pip install \"psycopg[binary,pool]\")")
+        async with _get_pool_lock():
+            if _pool is None:
+                pool = AsyncConnectionPool(
+                    make_conninfo(
+                        host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD, port=DB_PORT
+                    ),
+                    min_size=ADB_POOL_MIN_SIZE,
+                    max_size=ADB_POOL_MAX_SIZE,
+                    timeout=DB_POOL_TIMEOUT,
+                    max_idle=DB_POOL_MAX_IDLE,
+                    kwargs={"row_factory": dict_row},
+                    open=False
+                )
+                await pool.open()
+                _pool = pool
+    return _pool
+
+
+async def close_pool():
+    """Close the async pool (e.g. on shutdown)."""
+    global _pool
+    async with _get_pool_lock():
+        if _pool is not None:
+            await _pool.close()
+            _pool = None
+
+
+def get_pool_stats():
+    """Get the async pool's counters (psycopg_pool's ``get_stats()``), or None before first use."""
+    return _pool.get_stats() if _pool is not None else None
+
+
+@asynccontextmanager
+async def connection():
+    """Check out a pooled connection, recording how long the checkout took.
+
+    The transaction is committed when the block exits normally and rolled
+    back on an exception.
+    """
+    pool = await get_pool()
+    started = time.perf_counter()
+    async with pool.connection() as conn:
+        db.query_metrics.observe_acquire(time.perf_counter() - started)
+        yield conn
+
+
+async def execute_query(query, params=None, fetch=True, name=None):
+    """Execute a query and return the results (None on error, like ``db.execute_query``)."""
+    name = name or db._caller_name()
+    try:
+        async with connection() as conn:
+            async with conn.cursor() as cursor:
+                started = time.perf_counter()
+                try:
+                    await cursor.execute(query, params or ())
+                    result = await cursor.fetchall() if fetch else True
+                except Exception:
+                    db.query_metrics.observe_query(name, time.perf_counter() - started, error=True)
+                    raise
+                seconds = time.perf_counter() - started
+                db.query_metrics.observe_query(name, seconds, cursor.rowcount)
+                if db.query_metrics.is_slow(seconds):
+                    db.query_metrics.record_slow(name, query, params, seconds, cursor.rowcount)
+                return result
+    except Exception as e:
+        print(f"Error executing query: {e}")
+        return None
+
+
+async def cached_query(query, params=None, ttl=None, name=None):
+    """Execute a read-only query through the shared result cache (see ``db.cached_query``)."""
+    name = name or db._caller_name()
+    return await cache.result_cache.aget_or_load(
+        (query, cache.freeze(params)),
+        lambda: execute_query(query, params, name=name),
+        cache.query_tables(query),
+        ttl
+    )
+
+
+async def fetch_page(keyset, listing, params, cursor, limit):
+    """Fetch the page of the ``listing`` SELECT after ``cursor``; returns ``(rows, next_cursor)``.
+
+    Raises ``db.QueryError`` when the query fails, like ``db.fetch_page``.
+    """
+    query, params = db._page_query(keyset, listing, params, cursor, limit)
+    rows = await cached_query(query, params, name=db._caller_name())
+    if rows is None:
+        raise db.QueryError("Failed to fetch page")
+    return keyset.page(rows, limit)
+
+
+async def ping():
+    """Return True if the database answers (for health checks)."""
+    result = await execute_query("SELECT 1 AS ok")
+    return bool(result)
+
+
+# Clients
+async def get_clients(search=None, limit=100, offset=0):
+    """Get clients with optional search filter (ranked by relevance, see utils.search)."""
+    return await cached_query(*db._clients_query(search, limit, offset))
+
+
+async def get_clients_page(search=None, client_type=None, cursor=None, limit=50):
+    """Get the page of clients after ``cursor``; returns ``(clients, next_cursor)``."""
+    query, params = db._client_listing(search, client_type)
+    return await fetch_page(db._clients_keyset(search), query, params, cursor, limit)
+
+
+async def get_client_by_id(client_id):
+    """Get a client by ID."""
+    result = await cached_query(db.CLIENT_BY_ID_QUERY, (client_id,))
+    return result[0] if result else None
+
+
+async def create_client(client_data):
+    """Create a new client."""
+    result = await execute_query(db.CREATE_CLIENT_QUERY, db.client_params(client_data))
+    if result:
+        cache.invalidate("klienci")
+        db.invalidate_dashboard_snapshot()
+        db.notify_client_change(result[0]['id'])
+    return result[0]['id'] if result else None
+
+
+async def update_client(client_id, client_data):
+    """Update an existing client."""
+    params = db.client_params(client_data) + (client_id,)
+    result = await execute_query(db.UPDATE_CLIENT_QUERY, params, fetch=False)
+    if result:
+        cache.invalidate("klienci")
+        db.invalidate_dashboard_snapshot()
+        db.notify_client_change(client_id)
+    return result
+
+
+# Devices
+async def get_devices(client_id=None, building_id=None, search=None, limit=100, offset=0):
+    """Get devices with optional filters (ranked by relevance when searching)."""
+    return await cached_query(*db._devices_query(client_id, building_id, search, limit, offset))
+
+
+async def get_devices_page(client_id=None, building_id=None, search=None, cursor=None, limit=50):
+    """Get the page of devices after ``cursor``; returns ``(devices, next_cursor)``."""
+    query, params = db._device_listing(client_id, building_id, search)
+    return await fetch_page(db._devices_keyset(search), query, params, cursor, limit)
+
+
+async def get_device_by_id(device_id):
+    """Get a device by ID."""
+    result = await cached_query(db.DEVICE_BY_ID_QUERY, (device_id,))
+    return result[0] if result else None
+
+
+async def create_device(device_data):
+    """Create a new device and add it to its client's score features."""
+    result = await execute_query(db.CREATE_DEVICE_QUERY, db.device_params(device_data))
+    if result:
+        cache.invalidate("urządzenia_hvac")
+        db.invalidate_dashboard_snapshot()
+    return result[0]['id'] if result else None
+
+
+# Buildings
+async def get_buildings(client_id=None, search=None, limit=100, offset=0):
+    """Get buildings with optional filters (ranked by relevance when searching)."""
+    return await cached_query(*db._buildings_query(client_id, search, limit, offset))
+
+
+async def get_buildings_page(client_id=None, search=None, cursor=None, limit=50):
+    """Get the page of buildings after ``cursor``; returns ``(buildings, next_cursor)``."""
+    query, params = db._building_listing(client_id, search)
+    return await fetch_page(db._buildings_keyset(search), query, params, cursor, limit)
+
+
+# Service orders
+async def get_service_orders(status=None, client_id=None, device_id=None, limit=100, offset=0):
+    """Get service orders with optional filters."""
+    return await cached_query(*db._service_orders_query(status, client_id, device_id, limit, offset))
+
+
+async def get_service_orders_page(status=None, client_id=None, device_id=None, cursor=None, limit=50):
+    """Get the page of service orders after ``cursor``; returns ``(orders, next_cursor)``."""
+    query, params = db._service_order_listing(status, client_id, device_id)
+    return await fetch_page(db.SERVICE_ORDERS_KEYSET, query, params, cursor, limit)
+
+
+# Client score features
+async def get_client_features(client_ids=None):
+    """Get the score features of the given clients (all clients if None)."""
+    return await execute_query(*db._client_features_query(client_ids))
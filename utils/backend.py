@@ -0,0 +1,127 @@
+"""
+Storage backends for the pages.
+
+Pages read and write clients, devices, buildings and service orders through
+``get_backend()`` instead of a data module, so the same page runs against
+PostgreSQL directly (``DATA_BACKEND=postgres``, ``utils.db`` over the
+connection pool) or against Supabase's REST API (``DATA_BACKEND=supabase``,
+``utils.supabase_client``). Both return the same rows, joined names
+(``nazwa_budynku``, ``nazwa_klienta``, ``model_urządzenia``) included, and
+the ``*_page`` methods return ``(rows, next_cursor)``. A cursor only fits the
+backend that produced it.
+
+Usage::
+
+    backend = get_backend()
+    clients, next_cursor = backend.get_clients_page(search="kowalski")
+
+Reports and ad-hoc SQL (``db.cached_query``, ``db.query_to_dataframe``)
+remain PostgreSQL-only.
+"""
+
+import threading
+
+from config import DATA_BACKEND
+from utils import db
+from utils import supabase_client
+
+
+class StorageBackend:
+    """Data helpers shared by the backends, delegating to the module implementing them."""
+
+    name = None
+    module = None
+
+    def is_connected(self):
+        return self.module.is_connected()
+
+    # Clients
+    def get_clients(self, search=None, limit=100, offset=0):
+        return self.module.get_clients(search=search, limit=limit, offset=offset)
+
+    def get_clients_page(self, search=None, client_type=None, cursor=None, limit=50):
+        return self.module.get_clients_page(search=search, client_type=client_type, cursor=cursor, limit=limit)
+
+    def get_client_by_id(self, client_id):
+        return self.module.get_client_by_id(client_id)
+
+    def get_clients_by_ids(self, client_ids):
+        return self.module.get_clients_by_ids(client_ids)
+
+    def create_client(self, client_data):
+        return self.module.create_client(client_data)
+
+    def update_client(self, client_id, client_data):
+        return self.module.update_client(client_id, client_data)
+
+    # Devices
+    def get_devices(self, client_id=None, building_id=None, search=None, limit=100, offset=0):
+        return self.module.get_devices(
+            client_id=client_id, building_id=building_id, search=search, limit=limit, offset=offset
+        )
+
+    def get_devices_page(self, client_id=None, building_id=None, search=None, cursor=None, limit=50):
+        return self.module.get_devices_page(
+            client_id=client_id, building_id=building_id, search=search, cursor=cursor, limit=limit
+        )
+
+    def get_device_by_id(self, device_id):
+        return self.module.get_device_by_id(device_id)
+
+    def get_devices_by_ids(self, device_ids):
+        return self.module.get_devices_by_ids(device_ids)
+
+    def create_device(self, device_data):
+        return self.module.create_device(device_data)
+
+    # Buildings
+    def get_buildings(self, client_id=None, search=None, limit=100, offset=0):
+        return self.module.get_buildings(client_id=client_id, search=search, limit=limit, offset=offset)
+
+    def get_buildings_page(self, client_id=None, search=None, cursor=None, limit=50):
+        return self.module.get_buildings_page(client_id=client_id, search=search, cursor=cursor, limit=limit)
+
+    # Service orders
+    def get_service_orders(self, status=None, client_id=None, device_id=None, limit=100, offset=0):
+        return self.module.get_service_orders(
+            status=status, client_id=client_id, device_id=device_id, limit=limit, offset=offset
+        )
+
+    def get_service_orders_page(self, status=None, client_id=None, device_id=None, cursor=None, limit=50):
+        return self.module.get_service_orders_page(
+            status=status, client_id=client_id, device_id=device_id, cursor=cursor, limit=limit
+        )
+
+
+class PostgresBackend(StorageBackend):
+    """Direct PostgreSQL access through ``utils.db``."""
+
+    name = "postgres"
+    module = db
+
+    def is_connected(self):
+        return bool(db.execute_query("SELECT 1 AS ok"))
+
+
+class SupabaseBackend(StorageBackend):
+    """Supabase's PostgREST API through ``utils.supabase_client``."""
+
+    name = "supabase"
+    module = supabase_client
+
+
+BACKENDS = {backend.name: backend for backend in (PostgresBackend, SupabaseBackend)}
+
+_backends = {}
+_lock = threading.Lock()
+
+
+def get_backend(name=None):
+    """Get the backend ``name`` (default ``DATA_BACKEND``)."""
+    name = (name or DATA_BACKEND).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown data backend {name!r} (expected one of: {', '.join(BACKENDS)})")
+    with _lock:
+        if name not in _backends:
+            _backends[name] = BACKENDS[name]()
+        return _backends[name]
@@ -0,0 +1,453 @@
+"""
+Bulk import of clients, buildings, devices and service orders.
+
+Input rows (CSV or XLSX) are validated in Python and streamed in batches with
+``COPY ... FROM STDIN`` into a temporary staging table; a few set-based
+statements then merge the staging table into the target table:
+
+- rows with an ``id`` update that record (an unknown id is an error),
+- rows without an ``id`` are matched on the table's natural key (client
+  email, building client + address, device serial number) and update the
+  match, or are inserted; they are rejected when the input lacks one of the
+  table's required columns,
+- only the columns present in the input are updated,
+- when several rows target the same record the last one wins,
+- rows referencing missing clients/buildings/devices are rejected.
+
+Everything runs in one transaction, so an import is applied completely or
+not at all (``dry_run=True`` always rolls back). Afterwards the affected
+clients' score features are rebuilt and the dashboard snapshot and client
+lookup index are invalidated.
+"""
+
+import csv
+import io
+import logging
+import os
+import time
+from datetime import date, datetime
+
+from utils import cache
+from utils import db
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+logger = logging.getLogger(__name__)
+
+# Validated rows sent to the server per COPY
+COPY_BATCH_SIZE = 10000
+
+# At most this many per-row errors are kept in a report (all are counted)
+MAX_REPORTED_ERRORS = 1000
+
+# NULL marker in the staged CSV, so NULL and '' stay distinct
+COPY_NULL = "\\N"
+
+
+class ImportSpec:
+    """Importable table: its columns, natural key and references."""
+
+    def __init__(self, table, columns, natural_key=(), references=None, client_column=None):
+        self.table = table
+        # {column: (SQL type, converter, required)}
+        self.columns = columns
+        # [(column, SQL template applied to both sides)], e.g. ("email", "lower({})")
+        self.natural_key = list(natural_key)
+        # {column: referenced table}
+        self.references = references or {}
+        # Column holding the client id, for rebuilding score features
+        self.client_column = client_column
+
+
+def _text(max_length=None):
+    def convert(value):
+        value = str(value).strip()
+        if max_length and len(value) > max_length:
+            raise ValueError(f"dłuższe niż {max_length} znaków")
+        return value
+    return convert
+
+
+def _integer(value):
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        raise ValueError(f"niepoprawna liczba całkowita: {value!r}") from None
+
+
+def _number(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).strip().replace(" ", "").replace(",", "."))
+    except ValueError:
+        raise ValueError(f"niepoprawna liczba: {value!r}") from None
+
+
+def _date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value).strip()
+    for fmt in ("%Y-%m-%d", "%d.%m.%Y", "%d-%m-%Y", "%Y/%m/%d"):
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"niepoprawna data: {value!r} (oczekiwano RRRR-MM-DD lub DD.MM.RRRR)")
+
+
+IMPORT_SPECS = {
+    "klienci": ImportSpec(
+        "klienci",
+        {
+            "nazwa": ("VARCHAR(255)", _text(255), True),
+            "email": ("VARCHAR(255)", _text(255), False),
+            "telefon": ("VARCHAR(20)", _text(20), False),
+            "adres": ("TEXT", _text(), False),
+            "typ_klienta": ("VARCHAR(50)", _text(50), False),
+            "ocena_zamożności": ("DOUBLE PRECISION", _number, False),
+            "notatki": ("TEXT", _text(), False),
+        },
+        natural_key=[("email", "lower({})")],
+        client_column="id",
+    ),
+    "budynki": ImportSpec(
+        "budynki",
+        {
+            "id_klienta": ("INTEGER", _integer, False),
+            "nazwa": ("VARCHAR(255)", _text(255), True),
+            "adres": ("TEXT", _text(), True),
+            "typ_budynku": ("VARCHAR(50)", _text(50), False),
+            "powierzchnia": ("DOUBLE PRECISION", _number, False),
+            "liczba_pięter": ("INTEGER", _integer, False),
+            "rok_budowy": ("INTEGER", _integer, False),
+            "notatki": ("TEXT", _text(), False),
+        },
+        natural_key=[("id_klienta", "{}"), ("adres", "lower({})")],
+        references={"id_klienta": "klienci"},
+        client_column="id_klienta",
+    ),
+    "urządzenia_hvac": ImportSpec(
+        "urządzenia_hvac",
+        {
+            "id_budynku": ("INTEGER", _integer, False),
+            "id_klienta": ("INTEGER", _integer, False),
+            "model": ("VARCHAR(255)", _text(255), True),
+            "numer_seryjny": ("VARCHAR(100)", _text(100), False),
+            "data_instalacji": ("DATE", _date, False),
+            "data_ostatniego_serwisu": ("DATE", _date, False),
+            "status": ("VARCHAR(50)", _text(50), False),
+            "lokalizacja_w_budynku": ("TEXT", _text(), False),
+            "wartość": ("DOUBLE PRECISION", _number, False),
+        },
+        natural_key=[("numer_seryjny", "{}")],
+        references={"id_budynku": "budynki", "id_klienta": "klienci"},
+        client_column="id_klienta",
+    ),
+    "zlecenia_serwisowe": ImportSpec(
+        "zlecenia_serwisowe",
+        {
+            "id_urządzenia": ("INTEGER", _integer, False),
+            "id_klienta": ("INTEGER", _integer, False),
+            "typ_zlecenia": ("VARCHAR(50)", _text(50), True),
+            "priorytet": ("INTEGER", _integer, False),
+            "status": ("VARCHAR(50)", _text(50), True),
+            "data_planowana": ("DATE", _date, False),
+            "data_realizacji": ("DATE", _date, False),
+            "opis_problemu": ("TEXT", _text(), False),
+            "rozwiązanie": ("TEXT", _text(), False),
+            "koszt": ("NUMERIC(10,2)", _number, False),
+            "czas_realizacji": ("INTEGER", _integer, False),
+            "notatki": ("TEXT", _text(), False),
+        },
+        references={"id_urządzenia": "urządzenia_hvac", "id_klienta": "klienci"},
+    ),
+}
+
+
+def read_rows(source, fmt=None):
+    """Yield the rows of a CSV or XLSX file as dicts keyed by the header row.
+
+    ``source`` is a path or a binary file object (e.g. a Streamlit upload);
+    ``fmt`` ("csv"/"xlsx") defaults to the file extension. CSV may use ``,``
+    or ``;`` as the delimiter. XLSX needs the optional openpyxl package.
+    """
+    name = source if isinstance(source, (str, os.PathLike)) else getattr(source, "name", "")
+    fmt = fmt or os.path.splitext(str(name))[1].lstrip(".").lower() or "csv"
+
+    if fmt == "xlsx":
+        if openpyxl is None:
+            raise RuntimeError("XLSX import requires openpyxl (pip install openpyxl)")
+        workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [str(cell).strip() if cell is not None else "" for cell in next(rows, ())]
+            for values in rows:
+                if any(value not in (None, "") for value in values):
+                    yield dict(zip(header, values))
+        finally:
+            workbook.close()
+        return
+
+    if fmt != "csv":
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+    binary = open(source, "rb") if isinstance(source, (str, os.PathLike)) else source
+    try:
+        text = io.TextIOWrapper(binary, encoding="utf-8-sig", newline="")
+        sample = text.read(4096)
+        text.seek(0)
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;") if sample else csv.excel
+        for row in csv.DictReader(text, dialect=dialect):
+            yield {(key or "").strip(): value for key, value in row.items()}
+        text.detach()
+    finally:
+        if binary is not source:
+            binary.close()
+
+
+def validate_row(spec, row):
+    """Convert one input row to ``(id, {column: value})``; raises ValueError listing the problems."""
+    values = {}
+    problems = []
+
+    record_id = row.get("id")
+    if record_id not in (None, ""):
+        try:
+            record_id = _integer(record_id)
+        except ValueError as e:
+            problems.append(f"id: {e}")
+    else:
+        record_id = None
+
+    for column, (_, convert, required) in spec.columns.items():
+        if column not in row:
+            continue
+        value = row[column]
+        if value is None or (isinstance(value, str) and not value.strip()):
+            if required:
+                problems.append(f"{column}: wartość wymagana")
+            values[column] = None
+            continue
+        try:
+            values[column] = convert(value)
+        except ValueError as e:
+            problems.append(f"{column}: {e}")
+
+    if problems:
+        raise ValueError("; ".join(problems))
+    return record_id, values
+
+
+class _Report:
+    def __init__(self, table):
+        self.table = table
+        self.started = time.monotonic()
+        self.rows = 0
+        self.staged = 0
+        self.error_count = 0
+        self.errors = []
+
+    def error(self, row_number, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row_number, "error": message})
+
+    def as_dict(self, **extra):
+        elapsed = time.monotonic() - self.started
+        result = {
+            "table": self.table,
+            "rows": self.rows,
+            "staged": self.staged,
+            "rejected": self.error_count,
+            "errors": sorted(self.errors, key=lambda e: e["row"]),
+            "seconds": elapsed,
+            "rows_per_second": self.rows / elapsed if elapsed > 0 else 0.0,
+        }
+        result.update(extra)
+        return result
+
+
+def _copy_batch(cursor, staging, columns, batch):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in batch:
+        writer.writerow(COPY_NULL if value is None else value for value in row)
+    buffer.seek(0)
+    column_list = ", ".join(columns)
+    cursor.copy_expert(
+        f"COPY {staging} ({column_list}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')", buffer
+    )
+
+
+def _reject(cursor, staging, condition, message, report):
+    """Remove staged rows matching ``condition`` and report them as errors."""
+    cursor.execute(f"DELETE FROM {staging} s WHERE {condition} RETURNING s.nr_wiersza")
+    for (row_number,) in cursor.fetchall():
+        report.error(row_number, message)
+
+
+def _drop_duplicates(cursor, staging, match, report):
+    """Keep only the last staged row among rows matching each other on ``match``."""
+    cursor.execute(
+        f"DELETE FROM {staging} a USING {staging} b "
+        f"WHERE a.nr_wiersza < b.nr_wiersza AND {match} "
+        f"RETURNING a.nr_wiersza, b.nr_wiersza"
+    )
+    replaced = {}
+    for row_number, later in cursor.fetchall():
+        replaced[row_number] = max(later, replaced.get(row_number, later))
+    for row_number, later in replaced.items():
+        report.error(row_number, f"zastąpiony przez wiersz {later}")
+
+
+def import_rows(table, rows, dry_run=False):
+    """Validate, stage and merge ``rows`` (dicts keyed by column name) into ``table``.
+
+    Returns a report dict: input rows, inserted/updated counts, rejected rows
+    with per-row errors (row numbers count the header as row 1), elapsed
+    seconds and rows per second.
+    """
+    spec = IMPORT_SPECS.get(table)
+    if spec is None:
+        raise ValueError(f"Table {table!r} cannot be imported; choose one of {', '.join(IMPORT_SPECS)}")
+
+    report = _Report(table)
+    staging = "import_" + {"urządzenia_hvac": "urzadzenia"}.get(table, table)
+    columns = list(spec.columns)
+    present = set()
+    missing_required = []
+    client_ids = set()
+
+    with db.connection() as conn:
+        try:
+            with conn.cursor() as cursor:
+                column_defs = ", ".join(f"{column} {sql_type}" for column, (sql_type, _, _) in spec.columns.items())
+                cursor.execute(
+                    f"CREATE TEMP TABLE {staging} (nr_wiersza INTEGER PRIMARY KEY, id INTEGER, {column_defs}) "
+                    f"ON COMMIT DROP"
+                )
+
+                # Validate and stream into the staging table
+                batch = []
+                for row_number, row in enumerate(rows, start=2):
+                    report.rows += 1
+                    if not present:
+                        present = set(row) & set(columns)
+                        missing_required = [
+                            column for column, (_, _, required) in spec.columns.items()
+                            if required and column not in present
+                        ]
+                    try:
+                        record_id, values = validate_row(spec, row)
+                    except ValueError as e:
+                        report.error(row_number, str(e))
+                        continue
+                    # Without an id the row may become a new record, which needs every required column
+                    if record_id is None and missing_required:
+                        report.error(row_number, "; ".join(
+                            f"{column}: brak wymaganej kolumny (wiersz bez id)" for column in missing_required
+                        ))
+                        continue
+                    batch.append([row_number, record_id] + [values.get(column) for column in columns])
+                    if len(batch) >= COPY_BATCH_SIZE:
+                        _copy_batch(cursor, staging, ["nr_wiersza", "id"] + columns, batch)
+                        report.staged += len(batch)
+                        batch = []
+                if batch:
+                    _copy_batch(cursor, staging, ["nr_wiersza", "id"] + columns, batch)
+                    report.staged += len(batch)
+                cursor.execute(f"ANALYZE {staging}")
+
+                # Rows referring to records that don't exist
+                for column, referenced in spec.references.items():
+                    if column in present:
+                        _reject(
+                            cursor, staging,
+                            f"s.{column} IS NOT NULL AND NOT EXISTS (SELECT 1 FROM {referenced} r WHERE r.id = s.{column})",
+                            f"{column}: brak rekordu w tabeli {referenced}",
+                            report
+                        )
+                _reject(
+                    cursor, staging,
+                    f"s.id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM {table} t WHERE t.id = s.id)",
+                    f"id: brak rekordu w tabeli {table}",
+                    report
+                )
+
+                # Match rows without an id on the natural key
+                key = [(column, template) for column, template in spec.natural_key if column in present]
+                if key and len(key) == len(spec.natural_key):
+                    def match(left, right):
+                        return " AND ".join(
+                            f"{template.format(f'{left}.{column}')} = {template.format(f'{right}.{column}')}"
+                            for column, template in key
+                        )
+                    cursor.execute(
+                        f"UPDATE {staging} s SET id = t.id FROM {table} t WHERE s.id IS NULL AND {match('t', 's')}"
+                    )
+                    _drop_duplicates(cursor, staging, f"a.id IS NULL AND b.id IS NULL AND {match('a', 'b')}", report)
+                _drop_duplicates(cursor, staging, "a.id = b.id", report)
+
+                # Merge: update matched records, insert the rest (columns missing
+                # from the input keep their current values or defaults)
+                updated = inserted = 0
+                merged_columns = [column for column in columns if column in present]
+                client_column = spec.client_column or "id"
+                if merged_columns:
+                    assignments = ", ".join(f"{column} = s.{column}" for column in merged_columns)
+                    cursor.execute(
+                        f"UPDATE {table} t SET {assignments} FROM {staging} s WHERE t.id = s.id "
+                        f"RETURNING t.{client_column}"
+                    )
+                    merged = cursor.fetchall()
+                    updated = len(merged)
+                    client_ids.update(row[0] for row in merged)
+
+                    column_list = ", ".join(merged_columns)
+                    cursor.execute(
+                        f"INSERT INTO {table} ({column_list}) "
+                        f"SELECT {column_list} FROM {staging} WHERE id IS NULL ORDER BY nr_wiersza "
+                        f"RETURNING {client_column}"
+                    )
+                    merged = cursor.fetchall()
+                    inserted = len(merged)
+                    client_ids.update(row[0] for row in merged)
+                if not spec.client_column:
+                    client_ids.clear()
+                client_ids.discard(None)
+
+            if dry_run:
+                conn.rollback()
+            else:
+                conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    if not dry_run and (inserted or updated):
+        cache.invalidate(table)
+        if client_ids:
+            db.rebuild_client_features(client_ids)
+        db.invalidate_dashboard_snapshot()
+        if table == "klienci":
+            db.notify_client_change(None)
+
+    result = report.as_dict(inserted=inserted, updated=updated, dry_run=dry_run)
+    logger.info(
+        f"Imported {table}: {inserted} inserted, {updated} updated, {report.error_count} rejected "
+        f"of {report.rows} rows in {result['seconds']:.1f}s ({result['rows_per_second']:.0f} rows/s)"
+    )
+    return result
+
+
+def import_file(table, source, fmt=None, dry_run=False):
+    """Import a CSV or XLSX file into ``table``; see ``import_rows`` for the report."""
+    return import_rows(table, read_rows(source, fmt), dry_run=dry_run)
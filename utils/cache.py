@@ -0,0 +1,193 @@
+"""
+In-process read-through cache for query results.
+
+Streamlit reruns a page's whole script on every widget interaction, so the
+same list and detail queries repeat many times per minute. ``utils.db``
+serves its read helpers through ``result_cache``: entries are keyed by query
+text and parameters, tagged with the tables the query reads (taken from its
+FROM/JOIN clauses), expire after the shortest TTL of those tables and are
+evicted least recently used beyond ``CACHE_MAX_ENTRIES``. Write helpers call
+``invalidate(table)``, which drops every entry tagged with that table and
+bumps the table's version, so caches keyed on ``table_versions()`` (the
+Streamlit caches of ``components.ui_cache``) are refreshed too.
+
+The cache is per process; writes made by another process (e.g. the gRPC
+server) become visible after the TTL at the latest.
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from config import (
+    CACHE_ENABLED, CACHE_MAX_ENTRIES, CACHE_DEFAULT_TTL,
+    CACHE_TTL_CLIENTS, CACHE_TTL_DEVICES, CACHE_TTL_ORDERS, CACHE_TTL_COMMUNICATION
+)
+
+# Seconds a result stays cached, by table it reads; a query reading several
+# tables uses the shortest TTL among them
+TABLE_TTLS = {
+    "klienci": CACHE_TTL_CLIENTS,
+    "budynki": CACHE_TTL_CLIENTS,
+    "urządzenia_hvac": CACHE_TTL_DEVICES,
+    "zlecenia_serwisowe": CACHE_TTL_ORDERS,
+    "komunikacja": CACHE_TTL_COMMUNICATION,
+}
+
+_TABLE_PATTERN = re.compile(r"\b(?:FROM|JOIN)\s+([^\s(),;]+)", re.IGNORECASE)
+
+
+def query_tables(query):
+    """Tables named in the FROM/JOIN clauses of ``query``."""
+    return frozenset(name.lower() for name in _TABLE_PATTERN.findall(query))
+
+
+def freeze(value):
+    """Turn query parameters into a hashable cache key part."""
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def copy_result(value):
+    """Copy a cached result deep enough that callers can modify rows freely."""
+    if isinstance(value, list):
+        return [copy_result(item) for item in value]
+    if isinstance(value, tuple):
+        return tuple(copy_result(item) for item in value)
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, pd.DataFrame):
+        return value.copy()
+    return value
+
+
+class ResultCache:
+    """Thread-safe TTL + LRU cache whose entries are tagged for invalidation."""
+
+    def __init__(self, max_entries=1000, default_ttl=30.0, enabled=True):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, tags, value), least recently used first
+        # Bumped on invalidation, so a load that overlapped a write is not stored
+        self._versions = {}
+        self._generation = 0  # bumped by clear()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "invalidations": 0}
+
+    def ttl_for(self, tags):
+        ttls = [TABLE_TTLS[tag] for tag in tags if tag in TABLE_TTLS]
+        return min(ttls) if ttls else self.default_ttl
+
+    def get_or_load(self, key, load, tags, ttl=None):
+        """Return the cached value for ``key``, or call ``load()`` and cache its result.
+
+        ``None`` results (failed queries) are not cached.
+        """
+        if not self.enabled:
+            return load()
+        hit, value, versions = self._lookup(key, tags)
+        if hit:
+            return value
+        return self._store(key, load(), tags, ttl, versions)
+
+    async def aget_or_load(self, key, load, tags, ttl=None):
+        """Like ``get_or_load`` for a coroutine function ``load`` (used by utils.adb)."""
+        if not self.enabled:
+            return await load()
+        hit, value, versions = self._lookup(key, tags)
+        if hit:
+            return value
+        return self._store(key, await load(), tags, ttl, versions)
+
+    def _lookup(self, key, tags):
+        """Return ``(hit, value copy, tag versions)`` for ``key``."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return True, copy_result(entry[2]), None
+                del self._entries[key]
+                self._stats["expired"] += 1
+            self._stats["misses"] += 1
+            return False, None, self._tag_versions(tags)
+
+    def _store(self, key, value, tags, ttl, versions):
+        """Cache a loaded value unless its tables were invalidated while it loaded; return a copy."""
+        if value is None:
+            return None
+        ttl = self.ttl_for(tags) if ttl is None else ttl
+        with self._lock:
+            if versions == self._tag_versions(tags):
+                self._entries[key] = (time.monotonic() + ttl, tags, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self._stats["evictions"] += 1
+        return copy_result(value)
+
+    def _tag_versions(self, tags):
+        return self._generation, [self._versions.get(tag, 0) for tag in tags]
+
+    def invalidate(self, *tags):
+        """Drop every entry reading any of the tables ``tags``."""
+        tags = set(tags)
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+            stale = [key for key, (_, entry_tags, _) in self._entries.items() if entry_tags & tags]
+            for key in stale:
+                del self._entries[key]
+            self._stats["invalidations"] += len(stale)
+
+    def versions(self, tags):
+        """Return a token that changes whenever any of ``tags`` is invalidated (or the cache is cleared)."""
+        with self._lock:
+            return self._generation, tuple(self._versions.get(tag, 0) for tag in sorted(tags))
+
+    def clear(self):
+        """Drop all entries."""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        """Return the entry count and hit/miss/eviction counters."""
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries), max_entries=self.max_entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+# Process-wide cache used by utils.db
+result_cache = ResultCache(CACHE_MAX_ENTRIES, CACHE_DEFAULT_TTL, CACHE_ENABLED)
+
+
+def invalidate(*tables):
+    """Drop cached results reading any of ``tables`` (call after writing to them)."""
+    result_cache.invalidate(*tables)
+
+
+def table_versions(*tables):
+    """Token of the writes to ``tables`` so far, for caches keyed on it (see components.ui_cache)."""
+    return result_cache.versions(tables)
+
+
+def clear():
+    """Drop all cached results."""
+    result_cache.clear()
+
+
+def stats():
+    """Return cache counters."""
+    return result_cache.stats()
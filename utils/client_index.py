@@ -0,0 +1,203 @@
+"""
+In-memory lookup of client ids by email address or phone number.
+
+Resolving the sender of inbound emails, SMS and calls is a dictionary lookup
+instead of a database query. The index is loaded once and then refreshed
+incrementally from ``klienci.data_modyfikacji`` (maintained by a trigger, see
+migration 002). Clients created or updated in this process are picked up on
+the next lookup, and a periodic full reload drops deleted clients.
+"""
+
+import re
+import threading
+import time
+from datetime import timedelta
+from email.utils import parseaddr
+
+from config import (
+    CLIENT_INDEX_REFRESH_INTERVAL, CLIENT_INDEX_FULL_REFRESH_INTERVAL, DEFAULT_PHONE_COUNTRY_CODE
+)
+from utils import db
+
+# Rows committed by transactions that started before the last refresh carry
+# older timestamps, so every incremental refresh re-reads this window
+WATERMARK_OVERLAP = timedelta(minutes=1)
+
+NON_DIGITS = re.compile(r"\D")
+
+
+def normalize_email(value):
+    """Normalize an address or a raw From header ("Jan <JAN@x.pl>") to 'jan@x.pl'."""
+    if not value:
+        return None
+    address = parseaddr(str(value))[1].strip().casefold()
+    return address if "@" in address else None
+
+
+def normalize_phone(value, country_code=DEFAULT_PHONE_COUNTRY_CODE):
+    """Normalize a phone number to E.164 (e.g. '600 100 200' -> '+48600100200')."""
+    if not value:
+        return None
+    value = str(value).strip()
+    digits = NON_DIGITS.sub("", value)
+    if value.startswith("+"):
+        pass
+    elif digits.startswith("00"):
+        digits = digits[2:]
+    elif digits.startswith("0"):
+        # Trunk prefix
+        digits = country_code + digits.lstrip("0")
+    elif len(digits) <= 9:
+        digits = country_code + digits
+    # E.164 allows at most 15 digits; anything this short is not a full number
+    if not 8 <= len(digits) <= 15:
+        return None
+    return "+" + digits
+
+
+class ClientIndex:
+    """Email and phone maps to client ids, refreshed from an updated-at watermark."""
+
+    def __init__(self, refresh_interval=CLIENT_INDEX_REFRESH_INTERVAL,
+                 full_refresh_interval=CLIENT_INDEX_FULL_REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self.full_refresh_interval = full_refresh_interval
+        self._lock = threading.Lock()
+        self._by_email = {}
+        self._by_phone = {}
+        self._keys = {}  # client id -> (email, phone) currently indexed
+        self._watermark = None
+        self._refreshed_at = float('-inf')
+        self._full_refreshed_at = float('-inf')
+        self._stats = {"lookups": 0, "hits": 0, "refreshes": 0, "full_refreshes": 0}
+
+    @staticmethod
+    def _index_row(row, by_email, by_phone, keys):
+        client_id = row["id"]
+        old_email, old_phone = keys.pop(client_id, (None, None))
+        if old_email and by_email.get(old_email) == client_id:
+            del by_email[old_email]
+        if old_phone and by_phone.get(old_phone) == client_id:
+            del by_phone[old_phone]
+
+        email = normalize_email(row.get("email"))
+        phone = normalize_phone(row.get("telefon"))
+        # With duplicates the oldest client keeps the address
+        if email and by_email.setdefault(email, client_id) != client_id:
+            email = None
+        if phone and by_phone.setdefault(phone, client_id) != client_id:
+            phone = None
+        keys[client_id] = (email, phone)
+
+    def _load(self, full):
+        query = "SELECT id, email, telefon, data_modyfikacji FROM klienci"
+        params = []
+        if not full:
+            query += " WHERE data_modyfikacji > %s"
+            params.append(self._watermark - WATERMARK_OVERLAP)
+        query += " ORDER BY id"
+        rows = db.execute_query(query, params)
+        if rows is None and not full:
+            # e.g. the migration adding data_modyfikacji has not run
+            return self._load(full=True)
+        return rows, full
+
+    def refresh(self, full=False):
+        """Load clients changed since the last refresh (or all clients)."""
+        with self._lock:
+            full = full or self._watermark is None
+            rows, full = self._load(full)
+            if rows is None:
+                # Keep serving the current index; retry at the next interval
+                self._refreshed_at = time.monotonic()
+                return
+
+            if full:
+                # Lookups keep using the current dicts until the new ones are complete
+                by_email, by_phone, keys = {}, {}, {}
+            else:
+                by_email, by_phone, keys = self._by_email, self._by_phone, self._keys
+            for row in rows:
+                self._index_row(row, by_email, by_phone, keys)
+                modified = row.get("data_modyfikacji")
+                if modified is not None and (self._watermark is None or modified > self._watermark):
+                    self._watermark = modified
+            if full:
+                self._by_email, self._by_phone, self._keys = by_email, by_phone, keys
+                self._full_refreshed_at = time.monotonic()
+                self._stats["full_refreshes"] += 1
+            self._refreshed_at = time.monotonic()
+            self._stats["refreshes"] += 1
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        if now - self._full_refreshed_at > self.full_refresh_interval:
+            self.refresh(full=True)
+        elif now - self._refreshed_at > self.refresh_interval:
+            self.refresh()
+
+    def mark_stale(self, client_id=None):
+        """Refresh before the next lookup (called after clients change)."""
+        self._refreshed_at = float('-inf')
+
+    def lookup_email(self, value):
+        """Return the client id for an address or From header, or None."""
+        self._ensure_fresh()
+        email = normalize_email(value)
+        client_id = self._by_email.get(email) if email else None
+        self._record(client_id)
+        return client_id
+
+    def lookup_emails(self, values):
+        """Map each given address/header (normalized) to a client id, skipping unknown ones."""
+        self._ensure_fresh()
+        result = {}
+        for value in values:
+            email = normalize_email(value)
+            client_id = self._by_email.get(email) if email else None
+            self._record(client_id)
+            if client_id is not None:
+                result[email] = client_id
+        return result
+
+    def lookup_phone(self, value):
+        """Return the client id for a phone number in any common format, or None."""
+        self._ensure_fresh()
+        phone = normalize_phone(value)
+        client_id = self._by_phone.get(phone) if phone else None
+        self._record(client_id)
+        return client_id
+
+    def _record(self, client_id):
+        self._stats["lookups"] += 1
+        if client_id is not None:
+            self._stats["hits"] += 1
+
+    def stats(self):
+        """Return index size and lookup counters."""
+        return dict(
+            self._stats,
+            emails=len(self._by_email),
+            phones=len(self._by_phone),
+            watermark=self._watermark
+        )
+
+
+# Process-wide index, refreshed as soon as clients change through utils.db
+client_index = ClientIndex()
+db.on_client_change(client_index.mark_stale)
+
+
+def lookup_email(value):
+    """Return the client id for an email address or raw From header."""
+    return client_index.lookup_email(value)
+
+
+def lookup_emails(values):
+    """Resolve many addresses at once; returns {normalized address: client id}."""
+    return client_index.lookup_emails(values)
+
+
+def lookup_phone(value):
+    """Return the client id for a phone number."""
+    return client_index.lookup_phone(value)
@@ -1,7 +1,52 @@
+import io
+import itertools
+import logging
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2 import extensions
+from psycopg2.extras import RealDictCursor, execute_values
 import pandas as pd
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+    pa_csv = None
 from config import DB_HOST, DB_NAME, DB_USER, DB_PASSWORD, DB_PORT
+from config import (
+    DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT,
+    DB_POOL_MAX_IDLE, DB_POOL_HEALTH_CHECK_INTERVAL, DB_AUTO_MIGRATE, DASHBOARD_SNAPSHOT_TTL,
+    DB_STREAM_BATCH_SIZE, DB_SLOW_QUERY_MS, DB_SLOW_QUERY_LOG_SIZE, DB_EXPLAIN_SLOW_QUERIES, DB_METRICS_PORT
+)
+from utils.pool import ConnectionPool
+from utils import migrations
+from utils import metrics
+from utils import cache
+from utils import prepared
+from utils.pagination import Keyset, MIN_DATE, MIN_TIMESTAMP
+from utils.search import search_clauses
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Unique names for server-side cursors
+_cursor_names = itertools.count(1)
+
+# Latency, row and error counters of the queries run through this module
+query_metrics = metrics.QueryMetrics(DB_SLOW_QUERY_MS / 1000, DB_SLOW_QUERY_LOG_SIZE)
+
+# Callbacks run with the client id after a client is created or updated in this process
+_client_change_hooks = []
+
+class QueryError(RuntimeError):
+    """A query failed where an empty result would be mistaken for a real one (details are logged)."""
 
 def get_connection():
     """Create a connection to the PostgreSQL database."""
@@ -18,62 +63,479 @@ def get_connection():
         print(f"Error connecting to database: {e}")
         return None
 
-def execute_query(query, params=None, fetch=True):
-    """Execute a query and return the results."""
-    conn = get_connection()
-    if not conn:
+def _connect():
+    """Open a new connection for the pool, raising on failure."""
+    return psycopg2.connect(
+        host=DB_HOST,
+        database=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        port=DB_PORT
+    )
+
+def get_pool():
+    """Get the process-wide connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = ConnectionPool(
+                    _connect,
+                    min_size=DB_POOL_MIN_SIZE,
+                    max_size=DB_POOL_MAX_SIZE,
+                    timeout=DB_POOL_TIMEOUT,
+                    max_idle=DB_POOL_MAX_IDLE,
+                    health_check_interval=DB_POOL_HEALTH_CHECK_INTERVAL
+                )
+                if DB_AUTO_MIGRATE:
+                    _apply_migrations(pool)
+                _pool = pool
+                if DB_METRICS_PORT:
+                    _start_metrics_server()
+    return _pool
+
+@contextmanager
+def connection():
+    """Check out a pooled connection, recording how long the checkout took."""
+    pool = get_pool()
+    started = time.perf_counter()
+    with pool.connection() as conn:
+        query_metrics.observe_acquire(time.perf_counter() - started)
+        yield conn
+
+def _apply_migrations(pool):
+    """Bring the schema up to date before the pool is handed out."""
+    try:
+        with pool.connection() as conn:
+            applied = migrations.apply_migrations(conn)
+            if applied:
+                logger.info(f"Applied database migrations: {', '.join(applied)}")
+    except Exception as e:
+        logger.error(f"Error applying database migrations: {e}")
+
+def get_pool_stats():
+    """Get occupancy and saturation metrics of the connection pool."""
+    return get_pool().stats()
+
+def get_query_metrics():
+    """Get query latency/row/error metrics, the slow-query log and pool stats as a dict."""
+    return dict(
+        query_metrics.snapshot(),
+        pool=_pool.stats() if _pool is not None else None,
+        cache=cache.stats(),
+        prepared=prepared.stats()
+    )
+
+def get_query_metrics_prometheus():
+    """Get the query and pool metrics in the Prometheus text format."""
+    return metrics.to_prometheus(query_metrics.snapshot(), _gauges())
+
+def _gauges():
+    gauges = {}
+    if _pool is not None:
+        gauges.update((f"pool_{name}", value) for name, value in _pool.stats().items())
+    statements = prepared.stats()
+    for name in ("executions", "hits", "hit_rate"):
+        gauges[f"prepared_{name}"] = statements[name]
+    return gauges
+
+def _start_metrics_server():
+    try:
+        metrics.start_http_server(DB_METRICS_PORT, lambda: (query_metrics.snapshot(), _gauges()))
+    except Exception as e:
+        print(f"Error starting database metrics server: {e}")
+
+def _caller_name(depth=2):
+    """Name of the function ``depth`` frames up, used as the default query name."""
+    try:
+        return sys._getframe(depth).f_code.co_name
+    except ValueError:
+        return "query"
+
+@contextmanager
+def _measure(name, query, params=None, conn=None):
+    """Record the duration and row count (set ``observed["rows"]``) of the enclosed query.
+    
+    Slow queries go to the slow-query log; with ``DB_EXPLAIN_SLOW_QUERIES`` and
+    ``conn`` given, their plan is captured first.
+    """
+    observed = {"rows": None}
+    started = time.perf_counter()
+    try:
+        yield observed
+    except Exception:
+        query_metrics.observe_query(name, time.perf_counter() - started, error=True)
+        raise
+    seconds = time.perf_counter() - started
+    query_metrics.observe_query(name, seconds, observed["rows"])
+    if query_metrics.is_slow(seconds):
+        plan = _explain(conn, query, params) if conn is not None and DB_EXPLAIN_SLOW_QUERIES else None
+        query_metrics.record_slow(name, query, params, seconds, observed["rows"], plan)
+
+def _explain(conn, query, params):
+    """Capture the ``EXPLAIN (ANALYZE, BUFFERS)`` plan of a query that was just run.
+    
+    ANALYZE executes the statement again, so it runs inside a savepoint that is
+    rolled back: writes are undone and the enclosing transaction is unaffected.
+    """
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SAVEPOINT wyjasnij_zapytanie")
+            try:
+                cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {query}", params or ())
+                return "\n".join(row[0] for row in cursor.fetchall())
+            finally:
+                cursor.execute("ROLLBACK TO SAVEPOINT wyjasnij_zapytanie")
+    except Exception as e:
+        print(f"Error capturing query plan: {e}")
         return None
+
+def close_pool():
+    """Close all pooled connections (e.g. on shutdown)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+def execute_query(query, params=None, fetch=True, name=None):
+    """Execute a query and return the results.
     
+    ``query`` is SQL text or a statement registered with ``utils.prepared``.
+    The query is instrumented under ``name``, by default the calling function's name.
+    """
+    name = name or _caller_name()
+    sql = _sql_text(query)
     try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            cursor.execute(query, params or ())
-            if fetch:
-                result = cursor.fetchall()
+        with connection() as conn:
+            try:
+                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                    with _measure(name, sql, params, conn) as observed:
+                        if isinstance(query, prepared.PreparedStatement):
+                            prepared.registry.execute(cursor, query, params)
+                        else:
+                            cursor.execute(query, params or ())
+                        result = cursor.fetchall() if fetch else True
+                        observed["rows"] = cursor.rowcount
+                conn.commit()
                 return result
-            else:
+            except Exception as e:
+                conn.rollback()
+                print(f"Error executing query: {e}")
+                return None
+    except Exception as e:
+        print(f"Error connecting to database: {e}")
+        return None
+
+def cached_query(query, params=None, ttl=None, name=None):
+    """Execute a read-only query through the result cache (see utils.cache).
+    
+    Results are keyed by query and params and dropped when a write helper
+    invalidates one of the tables the query reads, or after ``ttl`` seconds
+    (by default the shortest TTL of those tables).
+    """
+    name = name or _caller_name()
+    sql = _sql_text(query)
+    return cache.result_cache.get_or_load(
+        (sql, cache.freeze(params)),
+        lambda: execute_query(query, params, name=name),
+        cache.query_tables(sql),
+        ttl
+    )
+
+def _sql_text(query):
+    """SQL text of a query given as text or as a prepared statement."""
+    return query.query if isinstance(query, prepared.PreparedStatement) else query
+
+def execute_values_query(query, rows, template=None, page_size=500, fetch=True, name=None):
+    """Execute a multi-row statement (``VALUES %s``) for many rows in one round trip per page."""
+    name = name or _caller_name()
+    try:
+        with connection() as conn:
+            try:
+                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                    with _measure(name, query) as observed:
+                        result = execute_values(
+                            cursor, query, rows, template=template, page_size=page_size, fetch=fetch
+                        )
+                        observed["rows"] = len(result) if fetch else len(rows)
                 conn.commit()
-                return True
+                return result if fetch else True
+            except Exception as e:
+                conn.rollback()
+                print(f"Error executing query: {e}")
+                return None
     except Exception as e:
-        print(f"Error executing query: {e}")
+        print(f"Error connecting to database: {e}")
         return None
-    finally:
-        conn.close()
 
-def query_to_dataframe(query, params=None):
-    """Execute a query and return the results as a pandas DataFrame."""
-    result = execute_query(query, params)
+def query_to_dataframe(query, params=None, columnar=False, name=None, empty_on_error=True):
+    """Execute a query and return the results as a pandas DataFrame.
+    
+    With ``columnar=True`` the rows are transferred with ``COPY ... TO STDOUT``
+    and parsed column by column, without building a dict per row; use it for
+    analytics over many rows. JSON and array columns then come back as text.
+    A failed query returns an empty DataFrame, or None with
+    ``empty_on_error=False`` (e.g. so the result isn't cached).
+    """
+    name = name or _caller_name()
+    failed = pd.DataFrame() if empty_on_error else None
+    if columnar:
+        try:
+            description, buffer = _copy_csv(query, params, name)
+            return _frame_from_csv(description, buffer)
+        except Exception as e:
+            print(f"Error executing columnar query: {e}")
+            return failed
+    
+    result = execute_query(query, params, name=name)
+    if result is None:
+        return failed
     if result:
         return pd.DataFrame(result)
     return pd.DataFrame()
 
-# Client-related queries
-def get_clients(search=None, limit=100, offset=0):
-    """Get clients with optional search filter."""
-    query = """
-    SELECT * FROM klienci
-    WHERE 1=1
+# PostgreSQL type OIDs decoded by the columnar (COPY) path; other types stay text
+_COPY_INTEGER_TYPES = {20, 21, 23}          # int8, int2, int4
+_COPY_FLOAT_TYPES = {700, 701, 1700}        # float4, float8, numeric
+_COPY_BOOLEAN_TYPES = {16}
+_COPY_DATE_TYPES = {1082, 1114}             # date, timestamp
+_COPY_TIMESTAMPTZ_TYPES = {1184}
+
+# NULL marker in the COPY output, so NULL and '' stay distinct
+_COPY_NULL = "\\N"
+
+def _copy_csv(query, params=None, name=None):
+    """Run ``query`` through COPY ... TO STDOUT as CSV.
+    
+    Returns ``([(column, type_oid), ...], buffer)`` with the CSV (header included) in ``buffer``.
     """
+    name = name or _caller_name()
+    with connection() as conn:
+        with conn.cursor() as cursor:
+            # COPY takes no bind parameters, so they are interpolated client-side
+            sql = cursor.mogrify(query, params).decode(extensions.encodings[conn.encoding])
+            cursor.execute(f"SELECT * FROM ({sql}) kolumny LIMIT 0")
+            description = [(column.name, column.type_code) for column in cursor.description]
+            cursor.execute("SET LOCAL datestyle = 'ISO, YMD'")
+            buffer = io.BytesIO()
+            with _measure(name, query, params) as observed:
+                cursor.copy_expert(
+                    f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER true, NULL '{_COPY_NULL}')", buffer
+                )
+                observed["rows"] = cursor.rowcount
+        conn.rollback()
+    buffer.seek(0)
+    return description, buffer
+
+def query_to_arrow(query, params=None):
+    """Execute a query and return the results as a pyarrow Table (columnar, via COPY).
+    
+    Requires the optional pyarrow package. Errors are raised.
+    """
+    if pa_csv is None:
+        raise RuntimeError("query_to_arrow requires pyarrow (pip install pyarrow)")
+    
+    description, buffer = _copy_csv(query, params, _caller_name())
+    column_types = {}
+    for name, oid in description:
+        if oid in _COPY_INTEGER_TYPES:
+            column_types[name] = pa.int64()
+        elif oid in _COPY_FLOAT_TYPES:
+            column_types[name] = pa.float64()
+        elif oid in _COPY_BOOLEAN_TYPES:
+            column_types[name] = pa.bool_()
+        elif oid == 1082:
+            column_types[name] = pa.date32()
+        elif oid not in _COPY_DATE_TYPES and oid not in _COPY_TIMESTAMPTZ_TYPES:
+            column_types[name] = pa.string()
+    
+    return pa_csv.read_csv(
+        buffer,
+        convert_options=pa_csv.ConvertOptions(
+            column_types=column_types,
+            null_values=[_COPY_NULL],
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=False,
+            true_values=["t"],
+            false_values=["f"]
+        )
+    )
+
+def _frame_from_csv(description, buffer):
+    """Parse COPY CSV output into a DataFrame typed from the column OIDs."""
+    dtypes = {}
+    for name, oid in description:
+        if oid in _COPY_INTEGER_TYPES:
+            dtypes[name] = "Int64"
+        elif oid in _COPY_FLOAT_TYPES:
+            dtypes[name] = "float64"
+        else:
+            dtypes[name] = "object"
+    
+    df = pd.read_csv(buffer, dtype=dtypes, na_values=[_COPY_NULL], keep_default_na=False)
+    for name, oid in description:
+        if name not in df.columns:
+            continue
+        if oid in _COPY_BOOLEAN_TYPES:
+            df[name] = df[name].map({"t": True, "f": False}).astype("boolean")
+        elif oid in _COPY_DATE_TYPES:
+            df[name] = pd.to_datetime(df[name], format="ISO8601")
+        elif oid in _COPY_TIMESTAMPTZ_TYPES:
+            df[name] = pd.to_datetime(df[name], format="ISO8601", utc=True)
+    return df
+
+def _stream(query, params, batch_size, cursor_factory=None, name=None):
+    """Yield ``(column_names, rows)`` batches from a named (server-side) cursor.
+    
+    Only the time spent in the database counts as query time, not the time
+    the consumer takes between batches.
+    """
+    name = name or _caller_name(3)
+    elapsed = 0.0
+    total = 0
+    try:
+        with connection() as conn:
+            # The pool rolls back the read transaction when the connection is returned
+            with conn.cursor(name=f"strumien_{next(_cursor_names)}", cursor_factory=cursor_factory) as cursor:
+                cursor.itersize = batch_size
+                started = time.perf_counter()
+                cursor.execute(query, params or ())
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    elapsed += time.perf_counter() - started
+                    if not rows:
+                        break
+                    total += len(rows)
+                    yield cursor.description, rows
+                    started = time.perf_counter()
+    except GeneratorExit:
+        query_metrics.observe_query(name, elapsed, total)
+        raise
+    except Exception:
+        query_metrics.observe_query(name, elapsed, total, error=True)
+        raise
+    query_metrics.observe_query(name, elapsed, total)
+    if query_metrics.is_slow(elapsed):
+        query_metrics.record_slow(name, query, params, elapsed, total)
+
+def stream_query(query, params=None, batch_size=DB_STREAM_BATCH_SIZE):
+    """Execute a query and yield its results in lists of at most ``batch_size`` rows.
+    
+    Rows are fetched from a server-side cursor, so only one batch is in memory at a
+    time. The pooled connection stays checked out until the generator is exhausted
+    or closed. Unlike ``execute_query``, errors are raised: a silently truncated
+    stream would look like a complete one.
+    """
+    try:
+        for _, rows in _stream(query, params, batch_size, RealDictCursor):
+            yield rows
+    except Exception as e:
+        print(f"Error streaming query: {e}")
+        raise
+
+def stream_dataframes(query, params=None, chunk_size=DB_STREAM_BATCH_SIZE):
+    """Execute a query and yield its results as pandas DataFrames of at most ``chunk_size`` rows.
+    
+    Rows are read as tuples straight into each chunk, without per-row dicts.
+    """
+    try:
+        for description, rows in _stream(query, params, chunk_size):
+            yield pd.DataFrame.from_records(rows, columns=[column.name for column in description])
+    except Exception as e:
+        print(f"Error streaming query: {e}")
+        raise
+
+def stream_rows(query, params=None, batch_size=DB_STREAM_BATCH_SIZE):
+    """Execute a query and yield ``(description, rows)`` batches of row tuples.
+    
+    ``description`` is the cursor's column description (``name``,
+    ``type_code``, ``precision``, ``scale``...), for consumers that type the
+    columns from the database instead of from the values.
+    """
+    try:
+        yield from _stream(query, params, batch_size)
+    except Exception as e:
+        print(f"Error streaming query: {e}")
+        raise
+
+def fetch_page(keyset, listing, params, cursor, limit):
+    """Fetch the page of the ``listing`` SELECT after ``cursor`` (see utils.pagination).
+    
+    Returns ``(rows, next_cursor)``. Raises QueryError when the query fails,
+    since an empty page would read as the end of the listing.
+    """
+    query, params = _page_query(keyset, listing, params, cursor, limit)
+    rows = cached_query(query, params, name=_caller_name())
+    if rows is None:
+        raise QueryError("Failed to fetch page")
+    return keyset.page(rows, limit)
+
+def _page_query(keyset, listing, params, cursor, limit):
+    condition, cursor_params = keyset.condition(cursor)
+    query = f"SELECT *, {keyset.select} FROM ({listing}) lista WHERE {condition} {keyset.order_by()}"
+    return query, params + cursor_params + [limit + 1]
+
+def on_client_change(callback):
+    """Register a callback invoked with the client id after create_client/update_client.
+    
+    The id is None after bulk changes (e.g. utils.bulk_import).
+    """
+    _client_change_hooks.append(callback)
+
+def notify_client_change(client_id=None):
+    """Run the registered client change callbacks."""
+    for hook in _client_change_hooks:
+        try:
+            hook(client_id)
+        except Exception as e:
+            print(f"Error in client change hook: {e}")
+
+# Client-related queries
+def _client_listing(search=None, client_type=None):
+    """SELECT for the client list (with a relevance column ``wynik`` when searching) and its params."""
+    columns = "*"
+    conditions = ""
     params = []
     
     if search:
-        query += " AND (nazwa ILIKE %s OR email ILIKE %s OR telefon ILIKE %s)"
-        search_param = f"%{search}%"
-        params.extend([search_param, search_param, search_param])
+        score, params, condition, condition_params = search_clauses("klienci", "", search)
+        columns += f", {score} as wynik"
+        conditions += f" AND {condition}"
+        params.extend(condition_params)
     
-    query += " ORDER BY nazwa LIMIT %s OFFSET %s"
-    params.extend([limit, offset])
+    if client_type:
+        conditions += " AND typ_klienta = %s"
+        params.append(client_type)
     
-    return execute_query(query, params)
+    return f"SELECT {columns} FROM klienci WHERE 1=1{conditions}", params
 
-def get_client_by_id(client_id):
-    """Get a client by ID."""
-    query = "SELECT * FROM klienci WHERE id = %s"
-    result = execute_query(query, (client_id,))
-    return result[0] if result else None
+def _clients_query(search=None, limit=100, offset=0):
+    query, params = _client_listing(search)
+    order = "wynik DESC, nazwa" if search else "nazwa"
+    return f"{query} ORDER BY {order} LIMIT %s OFFSET %s", params + [limit, offset]
 
-def create_client(client_data):
-    """Create a new client."""
-    query = """
+def _clients_keyset(search=None):
+    if search:
+        return Keyset("klienci:wynik", "wynik", "id", descending=True)
+    return Keyset("klienci", "nazwa", "id")
+
+def get_clients(search=None, limit=100, offset=0):
+    """Get clients with optional search filter (ranked by relevance, see utils.search)."""
+    return cached_query(*_clients_query(search, limit, offset))
+
+def get_clients_page(search=None, client_type=None, cursor=None, limit=50):
+    """Get the page of clients after ``cursor`` (by name, or by relevance when searching).
+    
+    Returns ``(clients, next_cursor)``; ``next_cursor`` is None on the last page.
+    """
+    query, params = _client_listing(search, client_type)
+    return fetch_page(_clients_keyset(search), query, params, cursor, limit)
+
+CLIENT_BY_ID_QUERY = "SELECT * FROM klienci WHERE id = %s"
+
+# The client's score features row is kept up to date by a trigger (migration 005)
+CREATE_CLIENT_QUERY = """
     INSERT INTO klienci (
         nazwa, email, telefon, adres, typ_klienta, 
         ocena_zamożności, notatki
@@ -81,21 +543,8 @@ def create_client(client_data):
         %s, %s, %s, %s, %s, %s, %s
     ) RETURNING id
     """
-    params = (
-        client_data.get('nazwa'),
-        client_data.get('email'),
-        client_data.get('telefon'),
-        client_data.get('adres'),
-        client_data.get('typ_klienta'),
-        client_data.get('ocena_zamożności'),
-        client_data.get('notatki')
-    )
-    result = execute_query(query, params)
-    return result[0]['id'] if result else None
 
-def update_client(client_id, client_data):
-    """Update an existing client."""
-    query = """
+UPDATE_CLIENT_QUERY = """
     UPDATE klienci SET
         nazwa = %s,
         email = %s,
@@ -106,88 +555,206 @@ def update_client(client_id, client_data):
         notatki = %s
     WHERE id = %s
     """
-    params = (
+
+def client_params(client_data):
+    """Parameters of CREATE_CLIENT_QUERY (and, followed by the id, UPDATE_CLIENT_QUERY)."""
+    return (
         client_data.get('nazwa'),
         client_data.get('email'),
         client_data.get('telefon'),
         client_data.get('adres'),
         client_data.get('typ_klienta'),
         client_data.get('ocena_zamożności'),
-        client_data.get('notatki'),
-        client_id
+        client_data.get('notatki')
     )
-    return execute_query(query, params, fetch=False)
+
+# Hot lookups run as prepared statements (see utils.prepared)
+CLIENT_BY_ID = prepared.register("klient_po_id", CLIENT_BY_ID_QUERY)
+
+def get_client_by_id(client_id):
+    """Get a client by ID."""
+    result = cached_query(CLIENT_BY_ID, (client_id,))
+    return result[0] if result else None
+
+def get_clients_by_ids(client_ids):
+    """Get the clients with the given IDs in one query."""
+    return cached_query("SELECT * FROM klienci WHERE id = ANY(%s)", (list(client_ids),)) or []
+
+def create_client(client_data):
+    """Create a new client."""
+    result = execute_query(CREATE_CLIENT_QUERY, client_params(client_data))
+    if result:
+        cache.invalidate("klienci")
+        invalidate_dashboard_snapshot()
+        notify_client_change(result[0]['id'])
+    return result[0]['id'] if result else None
+
+def update_client(client_id, client_data):
+    """Update an existing client."""
+    result = execute_query(UPDATE_CLIENT_QUERY, client_params(client_data) + (client_id,), fetch=False)
+    if result:
+        cache.invalidate("klienci")
+        invalidate_dashboard_snapshot()
+        notify_client_change(client_id)
+    return result
 
 # Device-related queries
-def get_devices(client_id=None, building_id=None, search=None, limit=100, offset=0):
-    """Get devices with optional filters."""
-    query = """
-    SELECT u.*, b.nazwa as nazwa_budynku, k.nazwa as nazwa_klienta
-    FROM urządzenia_hvac u
-    LEFT JOIN budynki b ON u.id_budynku = b.id
-    LEFT JOIN klienci k ON b.id_klienta = k.id
-    WHERE 1=1
-    """
+def _device_listing(client_id=None, building_id=None, search=None):
+    """SELECT for the device list (with ``wynik`` when searching) and its params."""
+    columns = "u.*, b.nazwa as nazwa_budynku, k.nazwa as nazwa_klienta"
+    conditions = ""
     params = []
     
+    if search:
+        score, params, condition, condition_params = search_clauses("urządzenia", "u.", search)
+        columns += f", {score} as wynik"
+    
     if client_id:
-        query += " AND b.id_klienta = %s"
+        conditions += " AND b.id_klienta = %s"
         params.append(client_id)
     
     if building_id:
-        query += " AND u.id_budynku = %s"
+        conditions += " AND u.id_budynku = %s"
         params.append(building_id)
     
     if search:
-        query += " AND (u.model ILIKE %s OR u.numer_seryjny ILIKE %s)"
-        search_param = f"%{search}%"
-        params.extend([search_param, search_param])
+        conditions += f" AND {condition}"
+        params.extend(condition_params)
     
-    query += " ORDER BY u.data_instalacji DESC LIMIT %s OFFSET %s"
-    params.extend([limit, offset])
+    query = f"""
+    SELECT {columns}
+    FROM urządzenia_hvac u
+    LEFT JOIN budynki b ON u.id_budynku = b.id
+    LEFT JOIN klienci k ON b.id_klienta = k.id
+    WHERE 1=1{conditions}
+    """
+    return query, params
+
+def _devices_query(client_id=None, building_id=None, search=None, limit=100, offset=0):
+    query, params = _device_listing(client_id, building_id, search)
+    order = "wynik DESC, u.data_instalacji DESC" if search else "u.data_instalacji DESC"
+    return f"{query} ORDER BY {order} LIMIT %s OFFSET %s", params + [limit, offset]
+
+def _devices_keyset(search=None):
+    if search:
+        return Keyset("urządzenia:wynik", "wynik", "id", descending=True)
+    return Keyset("urządzenia", f"COALESCE(data_instalacji, {MIN_DATE})", "id", descending=True)
+
+def get_devices(client_id=None, building_id=None, search=None, limit=100, offset=0):
+    """Get devices with optional filters (ranked by relevance when searching, see utils.search)."""
+    return cached_query(*_devices_query(client_id, building_id, search, limit, offset))
+
+def get_devices_page(client_id=None, building_id=None, search=None, cursor=None, limit=50):
+    """Get the page of devices after ``cursor`` (newest installation first, or by relevance).
     
-    return execute_query(query, params)
+    Returns ``(devices, next_cursor)``; ``next_cursor`` is None on the last page.
+    """
+    query, params = _device_listing(client_id, building_id, search)
+    return fetch_page(_devices_keyset(search), query, params, cursor, limit)
 
-def get_device_by_id(device_id):
-    """Get a device by ID."""
-    query = """
+DEVICE_DETAILS_QUERY = """
     SELECT u.*, b.nazwa as nazwa_budynku, k.nazwa as nazwa_klienta
     FROM urządzenia_hvac u
     LEFT JOIN budynki b ON u.id_budynku = b.id
     LEFT JOIN klienci k ON b.id_klienta = k.id
-    WHERE u.id = %s
     """
-    result = execute_query(query, (device_id,))
+
+DEVICE_BY_ID_QUERY = DEVICE_DETAILS_QUERY + "WHERE u.id = %s"
+
+# The device is added to its client's score features by a trigger (migration 005)
+CREATE_DEVICE_QUERY = """
+    INSERT INTO urządzenia_hvac (
+        id_budynku, id_klienta, model, numer_seryjny, data_instalacji,
+        status, lokalizacja_w_budynku, wartość
+    ) VALUES (
+        %s, %s, %s, %s, %s, %s, %s, %s
+    ) RETURNING id
+    """
+
+def device_params(device_data):
+    """Parameters of CREATE_DEVICE_QUERY."""
+    return (
+        device_data.get('id_budynku'),
+        device_data.get('id_klienta'),
+        device_data.get('model'),
+        device_data.get('numer_seryjny'),
+        device_data.get('data_instalacji'),
+        device_data.get('status'),
+        device_data.get('lokalizacja_w_budynku'),
+        device_data.get('wartość')
+    )
+
+DEVICE_BY_ID = prepared.register("urzadzenie_po_id", DEVICE_BY_ID_QUERY)
+
+def get_device_by_id(device_id):
+    """Get a device by ID."""
+    result = cached_query(DEVICE_BY_ID, (device_id,))
     return result[0] if result else None
 
+def get_devices_by_ids(device_ids):
+    """Get the devices with the given IDs in one query."""
+    return cached_query(DEVICE_DETAILS_QUERY + "WHERE u.id = ANY(%s)", (list(device_ids),)) or []
+
+def create_device(device_data):
+    """Create a new device and add it to its client's score features."""
+    result = execute_query(CREATE_DEVICE_QUERY, device_params(device_data))
+    if result:
+        cache.invalidate("urządzenia_hvac")
+        invalidate_dashboard_snapshot()
+    return result[0]['id'] if result else None
+
 # Building-related queries
-def get_buildings(client_id=None, search=None, limit=100, offset=0):
-    """Get buildings with optional filters."""
-    query = """
-    SELECT b.*, k.nazwa as nazwa_klienta
-    FROM budynki b
-    LEFT JOIN klienci k ON b.id_klienta = k.id
-    WHERE 1=1
-    """
+def _building_listing(client_id=None, search=None):
+    """SELECT for the building list (with ``wynik`` when searching) and its params."""
+    columns = "b.*, k.nazwa as nazwa_klienta"
+    conditions = ""
     params = []
     
+    if search:
+        score, params, condition, condition_params = search_clauses("budynki", "b.", search)
+        columns += f", {score} as wynik"
+    
     if client_id:
-        query += " AND b.id_klienta = %s"
+        conditions += " AND b.id_klienta = %s"
         params.append(client_id)
     
     if search:
-        query += " AND (b.nazwa ILIKE %s OR b.adres ILIKE %s)"
-        search_param = f"%{search}%"
-        params.extend([search_param, search_param])
+        conditions += f" AND {condition}"
+        params.extend(condition_params)
     
-    query += " ORDER BY b.nazwa LIMIT %s OFFSET %s"
-    params.extend([limit, offset])
+    query = f"""
+    SELECT {columns}
+    FROM budynki b
+    LEFT JOIN klienci k ON b.id_klienta = k.id
+    WHERE 1=1{conditions}
+    """
+    return query, params
+
+def _buildings_query(client_id=None, search=None, limit=100, offset=0):
+    query, params = _building_listing(client_id, search)
+    order = "wynik DESC, b.nazwa" if search else "b.nazwa"
+    return f"{query} ORDER BY {order} LIMIT %s OFFSET %s", params + [limit, offset]
+
+def _buildings_keyset(search=None):
+    if search:
+        return Keyset("budynki:wynik", "wynik", "id", descending=True)
+    return Keyset("budynki", "nazwa", "id")
+
+def get_buildings(client_id=None, search=None, limit=100, offset=0):
+    """Get buildings with optional filters (ranked by relevance when searching, see utils.search)."""
+    return cached_query(*_buildings_query(client_id, search, limit, offset))
+
+def get_buildings_page(client_id=None, search=None, cursor=None, limit=50):
+    """Get the page of buildings after ``cursor`` (by name, or by relevance when searching).
     
-    return execute_query(query, params)
+    Returns ``(buildings, next_cursor)``; ``next_cursor`` is None on the last page.
+    """
+    query, params = _building_listing(client_id, search)
+    return fetch_page(_buildings_keyset(search), query, params, cursor, limit)
 
 # Service order-related queries
-def get_service_orders(status=None, client_id=None, device_id=None, limit=100, offset=0):
-    """Get service orders with optional filters."""
+def _service_order_listing(status=None, client_id=None, device_id=None):
+    """SELECT for the service order list and its params."""
     query = """
     SELECT z.*, k.nazwa as nazwa_klienta, u.model as model_urządzenia
     FROM zlecenia_serwisowe z
@@ -209,59 +776,200 @@ def get_service_orders(status=None, client_id=None, device_id=None, limit=100, o
         query += " AND z.id_urządzenia = %s"
         params.append(device_id)
     
-    query += " ORDER BY z.data_utworzenia DESC LIMIT %s OFFSET %s"
-    params.extend([limit, offset])
-    
-    return execute_query(query, params)
+    return query, params
 
-# Dashboard queries
-def get_dashboard_metrics():
-    """Get metrics for the dashboard."""
-    metrics = {}
-    
-    # Total clients
-    query = "SELECT COUNT(*) as count FROM klienci"
-    result = execute_query(query)
-    metrics['total_clients'] = result[0]['count'] if result else 0
-    
-    # Total devices
-    query = "SELECT COUNT(*) as count FROM urządzenia_hvac"
-    result = execute_query(query)
-    metrics['total_devices'] = result[0]['count'] if result else 0
-    
-    # Active service orders
-    query = "SELECT COUNT(*) as count FROM zlecenia_serwisowe WHERE status != 'zakończone'"
-    result = execute_query(query)
-    metrics['active_orders'] = result[0]['count'] if result else 0
+def _service_orders_query(status=None, client_id=None, device_id=None, limit=100, offset=0):
+    query, params = _service_order_listing(status, client_id, device_id)
+    return query + " ORDER BY z.data_utworzenia DESC LIMIT %s OFFSET %s", params + [limit, offset]
+
+SERVICE_ORDERS_KEYSET = Keyset("zlecenia", f"COALESCE(data_utworzenia, {MIN_TIMESTAMP})", "id", descending=True)
+
+def get_service_orders(status=None, client_id=None, device_id=None, limit=100, offset=0):
+    """Get service orders with optional filters."""
+    return cached_query(*_service_orders_query(status, client_id, device_id, limit, offset))
+
+def get_service_orders_page(status=None, client_id=None, device_id=None, cursor=None, limit=50):
+    """Get the page of service orders after ``cursor`` (newest first).
     
-    # Orders by status
-    query = """
-    SELECT status, COUNT(*) as count 
-    FROM zlecenia_serwisowe 
-    GROUP BY status
+    Returns ``(orders, next_cursor)``; ``next_cursor`` is None on the last page.
     """
-    result = execute_query(query)
-    metrics['orders_by_status'] = result if result else []
-    
-    # Recent clients
-    query = """
-    SELECT * FROM klienci 
-    ORDER BY data_rejestracji DESC 
-    LIMIT 5
+    query, params = _service_order_listing(status, client_id, device_id)
+    return fetch_page(SERVICE_ORDERS_KEYSET, query, params, cursor, limit)
+
+# Client score features
+# klienci_cechy is maintained by triggers on klienci, urządzenia_hvac and
+# komunikacja (migration 005), so every writer, Supabase included, keeps it
+# in sync and writes still work before the migration has run.
+CLIENT_FEATURES_QUERY = """
+    SELECT c.id, c.nazwa, c.email,
+           COALESCE(f.ocena_zamożności, c.ocena_zamożności) as ocena_zamożności,
+           COALESCE(f.liczba_komunikacji, 0) as communication_count,
+           f.ostatnia_komunikacja as last_communication,
+           COALESCE(f.liczba_urządzeń, 0) as device_count,
+           CASE WHEN f.liczba_wycenionych_urządzeń > 0
+                THEN f.suma_wartości_urządzeń / f.liczba_wycenionych_urządzeń
+           END as avg_device_value
+    FROM klienci c
+    LEFT JOIN klienci_cechy f ON f.id_klienta = c.id
     """
-    result = execute_query(query)
-    metrics['recent_clients'] = result if result else []
-    
-    # Upcoming service orders
-    query = """
-    SELECT z.*, k.nazwa as nazwa_klienta 
-    FROM zlecenia_serwisowe z
-    LEFT JOIN klienci k ON z.id_klienta = k.id
-    WHERE z.status = 'przypisane' AND z.data_planowana >= CURRENT_DATE
-    ORDER BY z.data_planowana
-    LIMIT 5
+
+# Run for every batch of communications being prioritized
+CLIENT_FEATURES_BY_IDS = prepared.register("cechy_klientow", CLIENT_FEATURES_QUERY + " WHERE c.id = ANY(%s)")
+
+def _client_features_query(client_ids=None):
+    if client_ids is None:
+        return CLIENT_FEATURES_QUERY, []
+    return CLIENT_FEATURES_BY_IDS.query, [list(client_ids)]
+
+def get_client_features(client_ids=None):
+    """Get the stored score features for the given clients (or all clients)."""
+    if client_ids is None:
+        return execute_query(CLIENT_FEATURES_QUERY)
+    return execute_query(CLIENT_FEATURES_BY_IDS, [list(client_ids)])
+
+def rebuild_client_features(client_ids=None):
+    """Recompute score features from the raw tables (backfill or after bulk writes)."""
+    where = "WHERE TRUE"
+    params = []
+    if client_ids is not None:
+        where = "WHERE c.id = ANY(%s)"
+        params.append(list(client_ids))
+    return execute_query(migrations.CLIENT_FEATURES_REBUILD.format(where=where), params, fetch=False)
+
+# Dashboard queries
+DASHBOARD_SNAPSHOT_QUERY = """
+SELECT
+    (SELECT COUNT(*) FROM klienci) AS total_clients,
+    (SELECT COUNT(*) FROM urządzenia_hvac) AS total_devices,
+    (SELECT COALESCE(json_agg(s), '[]'::json) FROM (
+        SELECT status, COUNT(*) AS count
+        FROM zlecenia_serwisowe
+        GROUP BY status
+    ) s) AS orders_by_status,
+    (SELECT COALESCE(json_agg(r), '[]'::json) FROM (
+        SELECT * FROM klienci
+        ORDER BY data_rejestracji DESC
+        LIMIT 5
+    ) r) AS recent_clients,
+    (SELECT COALESCE(json_agg(u), '[]'::json) FROM (
+        SELECT z.*, k.nazwa as nazwa_klienta
+        FROM zlecenia_serwisowe z
+        LEFT JOIN klienci k ON z.id_klienta = k.id
+        WHERE z.status = 'przypisane' AND z.data_planowana >= CURRENT_DATE
+        ORDER BY z.data_planowana
+        LIMIT 5
+    ) u) AS upcoming_orders
+"""
+
+# Date columns that come back as ISO strings from json_agg
+_DASHBOARD_DATE_FIELDS = ('data_rejestracji', 'ostatni_kontakt', 'data_utworzenia', 'data_planowana', 'data_realizacji')
+
+_dashboard_snapshot = None
+_dashboard_snapshot_taken_at = float('-inf')
+_dashboard_snapshot_refreshing = False
+# Bumped by every invalidation; a refresh that started before it is discarded
+_dashboard_snapshot_generation = 0
+_dashboard_snapshot_lock = threading.Lock()
+
+# json_agg drops trailing zeros of fractional seconds, which fromisoformat
+# (before Python 3.11) only accepts with 3 or 6 digits
+_FRACTIONAL_SECONDS = re.compile(r'\.(\d{1,6})')
+
+def _parse_snapshot_dates(rows):
+    """Convert ISO date strings in json_agg rows back to date/datetime objects."""
+    for row in rows:
+        for field in _DASHBOARD_DATE_FIELDS:
+            value = row.get(field)
+            if isinstance(value, str):
+                try:
+                    if 'T' in value:
+                        value = _FRACTIONAL_SECONDS.sub(lambda m: '.' + m.group(1).ljust(6, '0'), value, count=1)
+                        row[field] = datetime.fromisoformat(value)
+                    else:
+                        row[field] = datetime.fromisoformat(value).date()
+                except ValueError:
+                    pass
+    return rows
+
+def compute_dashboard_metrics():
+    """Compute all dashboard metrics in a single round trip."""
+    result = execute_query(DASHBOARD_SNAPSHOT_QUERY)
+    if not result:
+        return None
+
+    row = result[0]
+    orders_by_status = row['orders_by_status'] or []
+    return {
+        'total_clients': row['total_clients'] or 0,
+        'total_devices': row['total_devices'] or 0,
+        'active_orders': sum(s['count'] for s in orders_by_status if s['status'] != 'zakończone'),
+        'orders_by_status': orders_by_status,
+        'recent_clients': _parse_snapshot_dates(row['recent_clients'] or []),
+        'upcoming_orders': _parse_snapshot_dates(row['upcoming_orders'] or []),
+    }
+
+def refresh_dashboard_snapshot():
+    """Recompute the dashboard snapshot and store it for subsequent reads.
+
+    The result is not stored if the snapshot was invalidated while it was
+    being computed, since it may predate the write that invalidated it.
     """
-    result = execute_query(query)
-    metrics['upcoming_orders'] = result if result else []
-    
+    global _dashboard_snapshot, _dashboard_snapshot_taken_at
+    with _dashboard_snapshot_lock:
+        generation = _dashboard_snapshot_generation
+    metrics = compute_dashboard_metrics()
+    if metrics is not None:
+        with _dashboard_snapshot_lock:
+            if generation == _dashboard_snapshot_generation:
+                _dashboard_snapshot = metrics
+                _dashboard_snapshot_taken_at = time.monotonic()
     return metrics
+
+def _refresh_dashboard_snapshot_in_background():
+    global _dashboard_snapshot_refreshing
+    try:
+        refresh_dashboard_snapshot()
+    finally:
+        with _dashboard_snapshot_lock:
+            _dashboard_snapshot_refreshing = False
+
+def invalidate_dashboard_snapshot():
+    """Mark the dashboard snapshot as stale so the next read refreshes it.
+
+    The results of refreshes still running are discarded.
+    """
+    global _dashboard_snapshot_taken_at, _dashboard_snapshot_generation
+    with _dashboard_snapshot_lock:
+        _dashboard_snapshot_taken_at = float('-inf')
+        _dashboard_snapshot_generation += 1
+
+def get_dashboard_metrics():
+    """Get metrics for the dashboard.
+
+    Reads the in-process snapshot; a stale snapshot is served while a
+    background thread recomputes it, so only the very first call waits
+    for the database.
+    """
+    global _dashboard_snapshot_refreshing
+    with _dashboard_snapshot_lock:
+        snapshot = _dashboard_snapshot
+        stale = time.monotonic() - _dashboard_snapshot_taken_at > DASHBOARD_SNAPSHOT_TTL
+        start_refresh = stale and snapshot is not None and not _dashboard_snapshot_refreshing
+        if start_refresh:
+            _dashboard_snapshot_refreshing = True
+
+    if snapshot is None:
+        snapshot = refresh_dashboard_snapshot()
+    elif start_refresh:
+        threading.Thread(target=_refresh_dashboard_snapshot_in_background, daemon=True).start()
+
+    if snapshot is None:
+        return {
+            'total_clients': 0,
+            'total_devices': 0,
+            'active_orders': 0,
+            'orders_by_status': [],
+            'recent_clients': [],
+            'upcoming_orders': [],
+        }
+    return snapshot
@@ -0,0 +1,207 @@
+"""
+CSV/Parquet export of query results with bounded memory.
+
+Rows are streamed from a server-side cursor (``db.stream_dataframes``,
+``db.stream_rows``) and written chunk by chunk, so an export never holds more
+than one chunk no matter how large the table is. Parquet export needs the
+optional ``pyarrow`` package; CSV always works.
+"""
+
+import json
+import logging
+import os
+import tempfile
+
+from utils import db
+from config import DB_STREAM_BATCH_SIZE
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+# Export format -> (file extension, MIME type)
+EXPORT_FORMATS = {
+    "csv": (".csv", "text/csv"),
+    "parquet": (".parquet", "application/vnd.apache.parquet"),
+}
+
+# Tables that can be exported in full from the pages
+EXPORT_QUERIES = {
+    "klienci": "SELECT * FROM klienci ORDER BY id",
+    "urządzenia": """
+        SELECT u.*, b.nazwa as nazwa_budynku, k.nazwa as nazwa_klienta
+        FROM urządzenia_hvac u
+        LEFT JOIN budynki b ON u.id_budynku = b.id
+        LEFT JOIN klienci k ON b.id_klienta = k.id
+        ORDER BY u.id
+    """,
+    "budynki": """
+        SELECT b.*, k.nazwa as nazwa_klienta
+        FROM budynki b
+        LEFT JOIN klienci k ON b.id_klienta = k.id
+        ORDER BY b.id
+    """,
+    "zlecenia": """
+        SELECT z.*, k.nazwa as nazwa_klienta, u.model as model_urządzenia
+        FROM zlecenia_serwisowe z
+        LEFT JOIN klienci k ON z.id_klienta = k.id
+        LEFT JOIN urządzenia_hvac u ON z.id_urządzenia = u.id
+        ORDER BY z.id
+    """,
+    "komunikacja": """
+        SELECT k.*, c.nazwa as nazwa_klienta
+        FROM komunikacja k
+        LEFT JOIN klienci c ON k.id_klienta = c.id
+        ORDER BY k.id
+    """,
+}
+
+
+def available_formats():
+    """Export formats usable in this environment."""
+    return [fmt for fmt in EXPORT_FORMATS if fmt != "parquet" or pq is not None]
+
+
+def export_csv(query, destination, params=None, chunk_size=DB_STREAM_BATCH_SIZE):
+    """Write the results of ``query`` as CSV to ``destination`` (path or text file). Returns the row count."""
+    rows = 0
+    close = isinstance(destination, (str, os.PathLike))
+    out = open(destination, "w", encoding="utf-8", newline="") if close else destination
+    try:
+        for chunk in db.stream_dataframes(query, params, chunk_size):
+            chunk.to_csv(out, header=rows == 0, index=False)
+            rows += len(chunk)
+    finally:
+        if close:
+            out.close()
+    return rows
+
+
+# PostgreSQL type OIDs with a dedicated Parquet type; other types are written as text
+_INTEGER_TYPES = {20, 21, 23}       # int8, int2, int4
+_FLOAT_TYPES = {700, 701}           # float4, float8
+_NUMERIC_TYPE = 1700
+_BOOLEAN_TYPE = 16
+_DATE_TYPE = 1082
+_TIMESTAMP_TYPE = 1114
+_TIMESTAMPTZ_TYPE = 1184
+_JSON_TYPES = {114, 3802}           # json, jsonb
+
+# Widest precision of decimal128
+_MAX_DECIMAL_PRECISION = 38
+
+
+def _to_text(value):
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    return str(value)
+
+
+def _to_float(value):
+    return None if value is None else float(value)
+
+
+def _parquet_column(column):
+    """Return ``(arrow type, value converter or None)`` for a cursor description column."""
+    oid = column.type_code
+    if oid in _INTEGER_TYPES:
+        return pa.int64(), None
+    if oid in _FLOAT_TYPES:
+        return pa.float64(), None
+    if oid == _NUMERIC_TYPE:
+        # numeric(p, s) keeps its exact values; unconstrained numeric has no fixed scale
+        if column.scale is not None and column.precision is not None \
+                and column.precision <= _MAX_DECIMAL_PRECISION:
+            return pa.decimal128(_MAX_DECIMAL_PRECISION, column.scale), None
+        return pa.float64(), _to_float
+    if oid == _BOOLEAN_TYPE:
+        return pa.bool_(), None
+    if oid == _DATE_TYPE:
+        return pa.date32(), None
+    if oid == _TIMESTAMP_TYPE:
+        return pa.timestamp("us"), None
+    if oid == _TIMESTAMPTZ_TYPE:
+        return pa.timestamp("us", tz="UTC"), None
+    if oid in _JSON_TYPES:
+        # Decoded by psycopg2 into dicts and lists; stored as JSON text
+        return pa.string(), _to_text
+    return pa.string(), _to_text
+
+
+def _parquet_schema(description):
+    """Build the Parquet schema and value converters from the column type OIDs.
+
+    The types come from the database, not from the values, so a column that
+    is all NULL or all integral in the first chunk gets the same type as in
+    every other chunk.
+    """
+    columns = [_parquet_column(column) for column in description]
+    schema = pa.schema([
+        pa.field(column.name, arrow_type) for column, (arrow_type, _) in zip(description, columns)
+    ])
+    return schema, [convert for _, convert in columns]
+
+
+def _record_batch(schema, converters, rows):
+    arrays = []
+    for index, (field, convert) in enumerate(zip(schema, converters)):
+        values = [row[index] for row in rows]
+        if convert is not None:
+            values = [convert(value) for value in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def export_parquet(query, destination, params=None, chunk_size=DB_STREAM_BATCH_SIZE):
+    """Write the results of ``query`` as Parquet to ``destination``, one row group per chunk.
+
+    Column types follow the PostgreSQL types of the result (see
+    ``_parquet_schema``). Returns the row count. Raises RuntimeError if
+    pyarrow is not installed.
+    """
+    if pq is None:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+
+    rows = 0
+    writer = None
+    try:
+        for description, batch in db.stream_rows(query, params, chunk_size):
+            if writer is None:
+                schema, converters = _parquet_schema(description)
+                writer = pq.ParquetWriter(destination, schema)
+            writer.write_batch(_record_batch(schema, converters, batch))
+            rows += len(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def export_query(query, fmt, destination, params=None, chunk_size=DB_STREAM_BATCH_SIZE):
+    """Export the results of ``query`` in format ``fmt`` ("csv" or "parquet"). Returns the row count."""
+    if fmt == "csv":
+        return export_csv(query, destination, params, chunk_size)
+    if fmt == "parquet":
+        return export_parquet(query, destination, params, chunk_size)
+    raise ValueError(f"Unknown export format: {fmt}")
+
+
+def export_to_tempfile(query, fmt, params=None, chunk_size=DB_STREAM_BATCH_SIZE):
+    """Export to a new temporary file and return ``(path, rows)``; the caller removes the file."""
+    suffix, _ = EXPORT_FORMATS[fmt]
+    handle, path = tempfile.mkstemp(prefix="eksport_", suffix=suffix)
+    os.close(handle)
+    try:
+        rows = export_query(query, fmt, path, params, chunk_size)
+    except Exception:
+        os.remove(path)
+        raise
+    logger.info(f"Exported {rows} rows to {path}")
+    return path, rows
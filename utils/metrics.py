@@ -0,0 +1,279 @@
+"""
+Instrumentation of the database layer.
+
+``utils.db`` reports every query it runs under a query name (by default the
+helper that issued it, e.g. ``get_clients_page``) together with its duration,
+row count and outcome, and the time spent waiting for a pooled connection.
+Queries slower than ``DB_SLOW_QUERY_MS`` are kept in a bounded slow-query log
+with their parameters redacted to type and length, optionally with the
+``EXPLAIN (ANALYZE, BUFFERS)`` plan.
+
+Everything can be read as a dict (``snapshot()``, JSON-serializable) or in
+the Prometheus text format (``to_prometheus()``), and served over HTTP with
+``start_http_server()`` at ``/metrics`` and ``/metrics.json``.
+"""
+
+import http.server
+import json
+import logging
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets, as in the Prometheus clients
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Longest query text kept in the slow-query log
+MAX_QUERY_LENGTH = 2000
+
+# Prefix of the exported Prometheus metric names
+METRIC_PREFIX = "hvac_db"
+
+
+class Histogram:
+    """Cumulative-bucket histogram of durations in seconds."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of the bucket it falls into."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        cumulative = []
+        seen = 0
+        for count in self.counts:
+            seen += count
+            cumulative.append(seen)
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+            "avg": self.sum / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": dict(zip((str(b) for b in self.buckets), cumulative)),
+        }
+
+
+def normalize_sql(query):
+    """Collapse whitespace in ``query`` and cut it to ``MAX_QUERY_LENGTH`` characters."""
+    text = re.sub(r"\s+", " ", str(query)).strip()
+    if len(text) > MAX_QUERY_LENGTH:
+        text = text[:MAX_QUERY_LENGTH] + "..."
+    return text
+
+
+def redact_params(params):
+    """Describe query parameters by type (and length) without their values."""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: _redact(value) for key, value in params.items()}
+    return [_redact(value) for value in params]
+
+
+def _redact(value):
+    if value is None:
+        return None
+    if isinstance(value, (str, bytes)):
+        return f"<{type(value).__name__}:{len(value)}>"
+    if isinstance(value, (list, tuple, set)):
+        return f"<{type(value).__name__}:{len(value)}>"
+    return f"<{type(value).__name__}>"
+
+
+class QueryMetrics:
+    """Per-query-name latency, row and error counters plus the slow-query log."""
+
+    def __init__(self, slow_query_seconds=0.5, slow_log_size=100):
+        self.slow_query_seconds = slow_query_seconds
+        self._lock = threading.Lock()
+        self._slow_log = deque(maxlen=slow_log_size)
+        self.reset()
+
+    def reset(self):
+        """Forget everything recorded so far."""
+        with self._lock:
+            self._queries = {}
+            self._acquire = Histogram()
+            self._slow_log.clear()
+            self._started_at = time.time()
+
+    def observe_query(self, name, seconds, rows=None, error=False):
+        """Record one execution of query ``name``."""
+        with self._lock:
+            stats = self._queries.get(name)
+            if stats is None:
+                stats = self._queries[name] = {"latency": Histogram(), "rows": 0, "errors": 0}
+            stats["latency"].observe(seconds)
+            if rows is not None and rows > 0:
+                stats["rows"] += rows
+            if error:
+                stats["errors"] += 1
+
+    def observe_acquire(self, seconds):
+        """Record the time spent checking out a pooled connection."""
+        with self._lock:
+            self._acquire.observe(seconds)
+
+    def is_slow(self, seconds):
+        return self.slow_query_seconds > 0 and seconds >= self.slow_query_seconds
+
+    def record_slow(self, name, query, params, seconds, rows=None, plan=None):
+        """Add a query to the slow-query log (parameters are redacted here)."""
+        entry = {
+            "name": name,
+            "at": datetime.now(timezone.utc).isoformat(),
+            "seconds": seconds,
+            "rows": rows,
+            "query": normalize_sql(query),
+            "params": redact_params(params),
+        }
+        if plan is not None:
+            entry["plan"] = plan
+        with self._lock:
+            self._slow_log.append(entry)
+        logger.warning(f"Slow query {name}: {seconds * 1000:.0f} ms, {rows} rows")
+
+    def slow_queries(self):
+        """Slow-query log entries, newest first."""
+        with self._lock:
+            return list(reversed(self._slow_log))
+
+    def snapshot(self):
+        """All metrics as a JSON-serializable dict."""
+        with self._lock:
+            queries = {
+                name: dict(stats["latency"].as_dict(), rows=stats["rows"], errors=stats["errors"])
+                for name, stats in sorted(self._queries.items())
+            }
+            return {
+                "since": datetime.fromtimestamp(self._started_at, timezone.utc).isoformat(),
+                "slow_query_threshold_seconds": self.slow_query_seconds,
+                "queries": queries,
+                "connection_acquire": self._acquire.as_dict(),
+                "slow_queries": list(reversed(self._slow_log)),
+            }
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _histogram_lines(name, histogram, labels=""):
+    separator = "," if labels else ""
+    lines = []
+    for bound, count in histogram["buckets"].items():
+        lines.append(f'{name}_bucket{{{labels}{separator}le="{bound}"}} {count}')
+    lines.append(f'{name}_bucket{{{labels}{separator}le="+Inf"}} {histogram["count"]}')
+    suffix = f"{{{labels}}}" if labels else ""
+    lines.append(f"{name}_sum{suffix} {histogram['sum']}")
+    lines.append(f"{name}_count{suffix} {histogram['count']}")
+    return lines
+
+
+def to_prometheus(snapshot, gauges=None):
+    """Render a ``snapshot()`` (and extra ``{name: number}`` gauges) in the Prometheus text format."""
+    p = METRIC_PREFIX
+    lines = [
+        f"# HELP {p}_query_duration_seconds Duration of database queries by query name.",
+        f"# TYPE {p}_query_duration_seconds histogram",
+    ]
+    for name, stats in snapshot["queries"].items():
+        lines.extend(_histogram_lines(f"{p}_query_duration_seconds", stats, f'query="{_label(name)}"'))
+
+    lines += [
+        f"# HELP {p}_query_rows_total Rows returned or affected by query name.",
+        f"# TYPE {p}_query_rows_total counter",
+    ]
+    lines.extend(
+        f'{p}_query_rows_total{{query="{_label(name)}"}} {stats["rows"]}'
+        for name, stats in snapshot["queries"].items()
+    )
+
+    lines += [
+        f"# HELP {p}_query_errors_total Failed queries by query name.",
+        f"# TYPE {p}_query_errors_total counter",
+    ]
+    lines.extend(
+        f'{p}_query_errors_total{{query="{_label(name)}"}} {stats["errors"]}'
+        for name, stats in snapshot["queries"].items()
+    )
+
+    lines += [
+        f"# HELP {p}_connection_acquire_seconds Time spent checking out a pooled connection.",
+        f"# TYPE {p}_connection_acquire_seconds histogram",
+    ]
+    lines.extend(_histogram_lines(f"{p}_connection_acquire_seconds", snapshot["connection_acquire"]))
+
+    for name, value in (gauges or {}).items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        lines.append(f"# TYPE {p}_{name} gauge")
+        lines.append(f"{p}_{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    collect = None
+
+    def do_GET(self):
+        snapshot, gauges = self.collect()
+        if self.path.split("?")[0] == "/metrics":
+            body = to_prometheus(snapshot, gauges).encode()
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path.split("?")[0] == "/metrics.json":
+            body = json.dumps(dict(snapshot, pool=gauges), default=str).encode()
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, collect):
+    """Serve ``/metrics`` (Prometheus) and ``/metrics.json`` on ``port`` from a daemon thread.
+
+    ``collect()`` returns ``(snapshot, gauges)`` for each request.
+    """
+    handler = type("MetricsHandler", (_MetricsHandler,), {"collect": staticmethod(collect)})
+    server = http.server.ThreadingHTTPServer(("", port), handler)
+    thread = threading.Thread(target=server.serve_forever, name="db-metrics", daemon=True)
+    thread.start()
+    logger.info(f"Serving database metrics on port {port} (/metrics, /metrics.json)")
+    return server
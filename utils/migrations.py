@@ -0,0 +1,578 @@
+"""
+Schema migrations for the HVAC CRM/ERP data layer.
+
+Each migration is applied once, in order, in its own transaction, and recorded
+in ``schema_migrations``. A failing migration is rolled back on its own and
+retried on the next start; the migrations after it still run unless they
+depend on it (``MIGRATION_DEPENDENCIES``). E.g. without the rights to create
+the pg_trgm/unaccent extensions only the search migrations are held back.
+Migrations are run automatically when the connection pool is first created
+(see ``utils.db.get_pool``) unless ``DB_AUTO_MIGRATE`` is disabled.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key for pg_advisory_xact_lock so concurrent processes don't race
+MIGRATION_LOCK_ID = 727274
+
+# Aggregates the scoring features for every client; ``where`` must be a WHERE
+# clause so the SELECT is unambiguous before ON CONFLICT
+CLIENT_FEATURES_REBUILD = """
+INSERT INTO klienci_cechy (
+    id_klienta, liczba_komunikacji, ostatnia_komunikacja,
+    liczba_urządzeń, suma_wartości_urządzeń, liczba_wycenionych_urządzeń,
+    ocena_zamożności, data_aktualizacji
+)
+SELECT c.id,
+       COALESCE(k.liczba, 0),
+       k.ostatnia,
+       COALESCE(u.liczba, 0),
+       COALESCE(u.suma, 0),
+       COALESCE(u.wycenione, 0),
+       c.ocena_zamożności,
+       CURRENT_TIMESTAMP
+FROM klienci c
+LEFT JOIN (
+    SELECT id_klienta, COUNT(*) as liczba, MAX(data_czas) as ostatnia
+    FROM komunikacja
+    GROUP BY id_klienta
+) k ON k.id_klienta = c.id
+LEFT JOIN (
+    SELECT id_klienta, COUNT(*) as liczba, SUM(wartość) as suma, COUNT(wartość) as wycenione
+    FROM urządzenia_hvac
+    GROUP BY id_klienta
+) u ON u.id_klienta = c.id
+{where}
+ON CONFLICT (id_klienta) DO UPDATE SET
+    liczba_komunikacji = EXCLUDED.liczba_komunikacji,
+    ostatnia_komunikacja = EXCLUDED.ostatnia_komunikacja,
+    liczba_urządzeń = EXCLUDED.liczba_urządzeń,
+    suma_wartości_urządzeń = EXCLUDED.suma_wartości_urządzeń,
+    liczba_wycenionych_urządzeń = EXCLUDED.liczba_wycenionych_urządzeń,
+    ocena_zamożności = EXCLUDED.ocena_zamożności,
+    data_aktualizacji = EXCLUDED.data_aktualizacji
+"""
+
+MIGRATIONS = [
+    (
+        "001_klienci_cechy",
+        "Per-client entanglement score features",
+        """
+        CREATE TABLE IF NOT EXISTS klienci_cechy (
+            id_klienta INTEGER PRIMARY KEY REFERENCES klienci(id) ON DELETE CASCADE,
+            liczba_komunikacji INTEGER NOT NULL DEFAULT 0,
+            ostatnia_komunikacja TIMESTAMP,
+            liczba_urządzeń INTEGER NOT NULL DEFAULT 0,
+            suma_wartości_urządzeń DOUBLE PRECISION NOT NULL DEFAULT 0,
+            liczba_wycenionych_urządzeń INTEGER NOT NULL DEFAULT 0, -- devices with a value, for AVG
+            ocena_zamożności DOUBLE PRECISION,
+            data_aktualizacji TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+        """ + CLIENT_FEATURES_REBUILD.format(where="WHERE TRUE")
+    ),
+    (
+        "002_klienci_data_modyfikacji",
+        "Client modification timestamp and email lookup index",
+        """
+        ALTER TABLE klienci ADD COLUMN IF NOT EXISTS data_modyfikacji TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP;
+        CREATE INDEX IF NOT EXISTS idx_klienci_data_modyfikacji ON klienci (data_modyfikacji);
+        CREATE INDEX IF NOT EXISTS idx_klienci_email_lower ON klienci (lower(email));
+
+        CREATE OR REPLACE FUNCTION ustaw_data_modyfikacji() RETURNS trigger AS $$
+        BEGIN
+            NEW.data_modyfikacji := clock_timestamp();
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS klienci_data_modyfikacji ON klienci;
+        CREATE TRIGGER klienci_data_modyfikacji
+            BEFORE INSERT OR UPDATE ON klienci
+            FOR EACH ROW EXECUTE FUNCTION ustaw_data_modyfikacji();
+        """
+    ),
+    (
+        "003_wyszukiwanie",
+        "Trigram search over clients, devices and buildings",
+        r"""
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE EXTENSION IF NOT EXISTS unaccent;
+
+        -- unaccent() is only STABLE; pinning the dictionary makes it usable in indexes.
+        -- The extension may live outside public (e.g. Supabase's "extensions" schema).
+        DO $$
+        DECLARE
+            schemat text;
+        BEGIN
+            SELECT n.nspname INTO schemat
+            FROM pg_extension e JOIN pg_namespace n ON n.oid = e.extnamespace
+            WHERE e.extname = 'unaccent';
+            EXECUTE format(
+                $f$CREATE OR REPLACE FUNCTION f_unaccent(tekst text) RETURNS text AS $b$
+                    SELECT %1$I.unaccent(%2$L::regdictionary, tekst)
+                $b$ LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT$f$,
+                schemat, format('%I.unaccent', schemat)
+            );
+        END;
+        $$;
+
+        CREATE OR REPLACE FUNCTION szukaj_normalizuj(tekst text) RETURNS text AS $$
+            SELECT lower(f_unaccent(tekst))
+        $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT;
+
+        -- Substring LIKE pattern with the wildcards in the token escaped
+        CREATE OR REPLACE FUNCTION szukaj_wzorzec(token text) RETURNS text AS $$
+            SELECT '%' || replace(replace(replace(token, '\', '\\'), '%', '\%'), '_', '\_') || '%'
+        $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT;
+
+        -- At most 5 words of a search phrase (utils.search.MAX_TOKENS)
+        CREATE OR REPLACE FUNCTION szukaj_tokeny(fraza text) RETURNS text[] AS $$
+            SELECT (array_remove(regexp_split_to_array(szukaj_normalizuj(btrim(fraza)), '\s+'), ''))[1:5]
+        $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT;
+
+        -- Normalized search documents; the GIN indexes below are built on these
+        CREATE OR REPLACE FUNCTION dokument_klienta(nazwa text, email text, telefon text) RETURNS text AS $$
+            SELECT szukaj_normalizuj(
+                coalesce(nazwa, '') || ' ' || coalesce(email, '') || ' ' || coalesce(telefon, '')
+                || ' ' || coalesce(regexp_replace(telefon, '[^0-9]', '', 'g'), '')
+            )
+        $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+        CREATE OR REPLACE FUNCTION dokument_urzadzenia(model text, numer_seryjny text) RETURNS text AS $$
+            SELECT szukaj_normalizuj(coalesce(model, '') || ' ' || coalesce(numer_seryjny, ''))
+        $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+        CREATE OR REPLACE FUNCTION dokument_budynku(nazwa text, adres text) RETURNS text AS $$
+            SELECT szukaj_normalizuj(coalesce(nazwa, '') || ' ' || coalesce(adres, ''))
+        $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+        CREATE INDEX IF NOT EXISTS idx_klienci_szukaj
+            ON klienci USING gin (dokument_klienta(nazwa, email, telefon) gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS idx_urzadzenia_szukaj
+            ON urządzenia_hvac USING gin (dokument_urzadzenia(model, numer_seryjny) gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS idx_budynki_szukaj
+            ON budynki USING gin (dokument_budynku(nazwa, adres) gin_trgm_ops);
+
+        -- Every word must occur as a substring or, from 3 characters, by trigram word similarity
+        CREATE OR REPLACE FUNCTION szukaj_pasuje(dokument text, tokeny text[]) RETURNS boolean AS $$
+            SELECT NOT EXISTS (
+                SELECT 1 FROM unnest(tokeny) AS t
+                WHERE NOT (dokument LIKE szukaj_wzorzec(t) OR (length(t) >= 3 AND t <% dokument))
+            )
+        $$ LANGUAGE sql STABLE PARALLEL SAFE;
+
+        -- Relevance: mean per-word match (1 for an exact substring, else word similarity),
+        -- plus 0.5 when the document starts with the phrase
+        CREATE OR REPLACE FUNCTION szukaj_wynik(dokument text, fraza text) RETURNS real AS $$
+            SELECT (
+                coalesce(avg(greatest(word_similarity(t, dokument), (dokument LIKE szukaj_wzorzec(t))::int)), 0)
+                + CASE WHEN left(dokument, length(szukaj_normalizuj(btrim(fraza)))) = szukaj_normalizuj(btrim(fraza))
+                       THEN 0.5 ELSE 0 END
+            )::real
+            FROM unnest(szukaj_tokeny(fraza)) AS t
+        $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+        -- Ranked search for PostgREST/Supabase (rpc). The longest word drives the index scan.
+        CREATE OR REPLACE FUNCTION szukaj_klientow(
+            fraza text, limit_wynikow integer DEFAULT 20, przesuniecie integer DEFAULT 0
+        ) RETURNS SETOF klienci AS $$
+        DECLARE
+            tokeny text[] := szukaj_tokeny(fraza);
+            kotwica text;
+        BEGIN
+            SELECT t INTO kotwica FROM unnest(tokeny) AS t ORDER BY length(t) DESC LIMIT 1;
+            IF kotwica IS NULL THEN
+                RETURN;
+            END IF;
+            RETURN QUERY
+            SELECT k.* FROM klienci k
+            WHERE (dokument_klienta(k.nazwa, k.email, k.telefon) LIKE szukaj_wzorzec(kotwica)
+                   OR (length(kotwica) >= 3 AND kotwica <% dokument_klienta(k.nazwa, k.email, k.telefon)))
+              AND szukaj_pasuje(dokument_klienta(k.nazwa, k.email, k.telefon), tokeny)
+            ORDER BY szukaj_wynik(dokument_klienta(k.nazwa, k.email, k.telefon), fraza) DESC, k.nazwa
+            LIMIT limit_wynikow OFFSET przesuniecie;
+        END;
+        $$ LANGUAGE plpgsql STABLE;
+
+        CREATE OR REPLACE FUNCTION szukaj_urzadzen(
+            fraza text, id_klienta_filtr integer DEFAULT NULL, id_budynku_filtr integer DEFAULT NULL,
+            limit_wynikow integer DEFAULT 20, przesuniecie integer DEFAULT 0
+        ) RETURNS SETOF urządzenia_hvac AS $$
+        DECLARE
+            tokeny text[] := szukaj_tokeny(fraza);
+            kotwica text;
+        BEGIN
+            SELECT t INTO kotwica FROM unnest(tokeny) AS t ORDER BY length(t) DESC LIMIT 1;
+            IF kotwica IS NULL THEN
+                RETURN;
+            END IF;
+            RETURN QUERY
+            SELECT u.* FROM urządzenia_hvac u
+            WHERE (dokument_urzadzenia(u.model, u.numer_seryjny) LIKE szukaj_wzorzec(kotwica)
+                   OR (length(kotwica) >= 3 AND kotwica <% dokument_urzadzenia(u.model, u.numer_seryjny)))
+              AND szukaj_pasuje(dokument_urzadzenia(u.model, u.numer_seryjny), tokeny)
+              AND (id_klienta_filtr IS NULL OR u.id_klienta = id_klienta_filtr)
+              AND (id_budynku_filtr IS NULL OR u.id_budynku = id_budynku_filtr)
+            ORDER BY szukaj_wynik(dokument_urzadzenia(u.model, u.numer_seryjny), fraza) DESC,
+                     u.data_instalacji DESC
+            LIMIT limit_wynikow OFFSET przesuniecie;
+        END;
+        $$ LANGUAGE plpgsql STABLE;
+
+        CREATE OR REPLACE FUNCTION szukaj_budynkow(
+            fraza text, id_klienta_filtr integer DEFAULT NULL,
+            limit_wynikow integer DEFAULT 20, przesuniecie integer DEFAULT 0
+        ) RETURNS SETOF budynki AS $$
+        DECLARE
+            tokeny text[] := szukaj_tokeny(fraza);
+            kotwica text;
+        BEGIN
+            SELECT t INTO kotwica FROM unnest(tokeny) AS t ORDER BY length(t) DESC LIMIT 1;
+            IF kotwica IS NULL THEN
+                RETURN;
+            END IF;
+            RETURN QUERY
+            SELECT b.* FROM budynki b
+            WHERE (dokument_budynku(b.nazwa, b.adres) LIKE szukaj_wzorzec(kotwica)
+                   OR (length(kotwica) >= 3 AND kotwica <% dokument_budynku(b.nazwa, b.adres)))
+              AND szukaj_pasuje(dokument_budynku(b.nazwa, b.adres), tokeny)
+              AND (id_klienta_filtr IS NULL OR b.id_klienta = id_klienta_filtr)
+            ORDER BY szukaj_wynik(dokument_budynku(b.nazwa, b.adres), fraza) DESC, b.nazwa
+            LIMIT limit_wynikow OFFSET przesuniecie;
+        END;
+        $$ LANGUAGE plpgsql STABLE;
+        """
+    ),
+    (
+        "004_indeksy_stronicowania",
+        "Composite (sort key, id) indexes for keyset pagination",
+        # Expressions must match the Keyset sort keys in utils/db.py and the
+        # communication service (NULL dates sort as 0001-01-01)
+        """
+        CREATE INDEX IF NOT EXISTS idx_klienci_strony ON klienci (nazwa, id);
+        CREATE INDEX IF NOT EXISTS idx_budynki_strony ON budynki (nazwa, id);
+        CREATE INDEX IF NOT EXISTS idx_budynki_klient_strony ON budynki (id_klienta, nazwa, id);
+        CREATE INDEX IF NOT EXISTS idx_urzadzenia_strony
+            ON urządzenia_hvac ((COALESCE(data_instalacji, DATE '0001-01-01')), id);
+        CREATE INDEX IF NOT EXISTS idx_urzadzenia_budynek_strony
+            ON urządzenia_hvac (id_budynku, (COALESCE(data_instalacji, DATE '0001-01-01')), id);
+        CREATE INDEX IF NOT EXISTS idx_zlecenia_strony
+            ON zlecenia_serwisowe ((COALESCE(data_utworzenia, TIMESTAMP '0001-01-01 00:00:00')), id);
+        CREATE INDEX IF NOT EXISTS idx_zlecenia_klient_strony
+            ON zlecenia_serwisowe (id_klienta, (COALESCE(data_utworzenia, TIMESTAMP '0001-01-01 00:00:00')), id);
+        CREATE INDEX IF NOT EXISTS idx_zlecenia_status_strony
+            ON zlecenia_serwisowe (status, (COALESCE(data_utworzenia, TIMESTAMP '0001-01-01 00:00:00')), id);
+        CREATE INDEX IF NOT EXISTS idx_komunikacja_strony
+            ON komunikacja ((COALESCE(data_czas, TIMESTAMP '0001-01-01 00:00:00')), id);
+        CREATE INDEX IF NOT EXISTS idx_komunikacja_klient_strony
+            ON komunikacja (id_klienta, (COALESCE(data_czas, TIMESTAMP '0001-01-01 00:00:00')), id);
+        """
+    ),
+    (
+        "005_klienci_cechy_wyzwalacze",
+        "Keep client score features in sync with triggers",
+        # Statement-level triggers see a whole multi-row INSERT at once
+        """
+        CREATE OR REPLACE FUNCTION cechy_ocena_klienta() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO klienci_cechy (id_klienta, ocena_zamożności)
+            VALUES (NEW.id, NEW.ocena_zamożności)
+            ON CONFLICT (id_klienta) DO UPDATE SET
+                ocena_zamożności = EXCLUDED.ocena_zamożności,
+                data_aktualizacji = CURRENT_TIMESTAMP;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS klienci_cechy_ocena ON klienci;
+        CREATE TRIGGER klienci_cechy_ocena
+            AFTER INSERT OR UPDATE OF ocena_zamożności ON klienci
+            FOR EACH ROW EXECUTE FUNCTION cechy_ocena_klienta();
+
+        CREATE OR REPLACE FUNCTION cechy_nowe_urzadzenia() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO klienci_cechy (
+                id_klienta, liczba_urządzeń, suma_wartości_urządzeń, liczba_wycenionych_urządzeń
+            )
+            SELECT id_klienta, COUNT(*), COALESCE(SUM(wartość), 0), COUNT(wartość)
+            FROM nowe
+            WHERE id_klienta IS NOT NULL
+            GROUP BY id_klienta
+            ON CONFLICT (id_klienta) DO UPDATE SET
+                liczba_urządzeń = klienci_cechy.liczba_urządzeń + EXCLUDED.liczba_urządzeń,
+                suma_wartości_urządzeń = klienci_cechy.suma_wartości_urządzeń + EXCLUDED.suma_wartości_urządzeń,
+                liczba_wycenionych_urządzeń = klienci_cechy.liczba_wycenionych_urządzeń + EXCLUDED.liczba_wycenionych_urządzeń,
+                data_aktualizacji = CURRENT_TIMESTAMP;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS urzadzenia_cechy ON urządzenia_hvac;
+        CREATE TRIGGER urzadzenia_cechy
+            AFTER INSERT ON urządzenia_hvac
+            REFERENCING NEW TABLE AS nowe
+            FOR EACH STATEMENT EXECUTE FUNCTION cechy_nowe_urzadzenia();
+
+        CREATE OR REPLACE FUNCTION cechy_nowa_komunikacja() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO klienci_cechy (id_klienta, liczba_komunikacji, ostatnia_komunikacja)
+            SELECT id_klienta, COUNT(*), MAX(data_czas)
+            FROM nowa
+            WHERE id_klienta IS NOT NULL
+            GROUP BY id_klienta
+            ON CONFLICT (id_klienta) DO UPDATE SET
+                liczba_komunikacji = klienci_cechy.liczba_komunikacji + EXCLUDED.liczba_komunikacji,
+                ostatnia_komunikacja = GREATEST(klienci_cechy.ostatnia_komunikacja, EXCLUDED.ostatnia_komunikacja),
+                data_aktualizacji = CURRENT_TIMESTAMP;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS komunikacja_cechy ON komunikacja;
+        CREATE TRIGGER komunikacja_cechy
+            AFTER INSERT ON komunikacja
+            REFERENCING NEW TABLE AS nowa
+            FOR EACH STATEMENT EXECUTE FUNCTION cechy_nowa_komunikacja();
+        """ + CLIENT_FEATURES_REBUILD.format(where="WHERE TRUE")
+    ),
+    (
+        "006_szukaj_urzadzen_klient",
+        "Filter device search by the building's client",
+        # Same filter as the device listings of utils.db and utils.supabase_client
+        r"""
+        CREATE OR REPLACE FUNCTION szukaj_urzadzen(
+            fraza text, id_klienta_filtr integer DEFAULT NULL, id_budynku_filtr integer DEFAULT NULL,
+            limit_wynikow integer DEFAULT 20, przesuniecie integer DEFAULT 0
+        ) RETURNS SETOF urządzenia_hvac AS $$
+        DECLARE
+            tokeny text[] := szukaj_tokeny(fraza);
+            kotwica text;
+        BEGIN
+            SELECT t INTO kotwica FROM unnest(tokeny) AS t ORDER BY length(t) DESC LIMIT 1;
+            IF kotwica IS NULL THEN
+                RETURN;
+            END IF;
+            RETURN QUERY
+            SELECT u.* FROM urządzenia_hvac u
+            WHERE (dokument_urzadzenia(u.model, u.numer_seryjny) LIKE szukaj_wzorzec(kotwica)
+                   OR (length(kotwica) >= 3 AND kotwica <% dokument_urzadzenia(u.model, u.numer_seryjny)))
+              AND szukaj_pasuje(dokument_urzadzenia(u.model, u.numer_seryjny), tokeny)
+              AND (id_klienta_filtr IS NULL OR EXISTS (
+                  SELECT 1 FROM budynki b WHERE b.id = u.id_budynku AND b.id_klienta = id_klienta_filtr
+              ))
+              AND (id_budynku_filtr IS NULL OR u.id_budynku = id_budynku_filtr)
+            ORDER BY szukaj_wynik(dokument_urzadzenia(u.model, u.numer_seryjny), fraza) DESC,
+                     u.data_instalacji DESC
+            LIMIT limit_wynikow OFFSET przesuniecie;
+        END;
+        $$ LANGUAGE plpgsql STABLE;
+        """
+    ),
+    (
+        "007_szukaj_klientow_typ",
+        "Client type filter in the client search function",
+        # Dropped first: an overload would make the PostgREST rpc call ambiguous
+        r"""
+        DROP FUNCTION IF EXISTS szukaj_klientow(text, integer, integer);
+
+        CREATE OR REPLACE FUNCTION szukaj_klientow(
+            fraza text, typ_klienta_filtr text DEFAULT NULL,
+            limit_wynikow integer DEFAULT 20, przesuniecie integer DEFAULT 0
+        ) RETURNS SETOF klienci AS $$
+        DECLARE
+            tokeny text[] := szukaj_tokeny(fraza);
+            kotwica text;
+        BEGIN
+            SELECT t INTO kotwica FROM unnest(tokeny) AS t ORDER BY length(t) DESC LIMIT 1;
+            IF kotwica IS NULL THEN
+                RETURN;
+            END IF;
+            RETURN QUERY
+            SELECT k.* FROM klienci k
+            WHERE (dokument_klienta(k.nazwa, k.email, k.telefon) LIKE szukaj_wzorzec(kotwica)
+                   OR (length(kotwica) >= 3 AND kotwica <% dokument_klienta(k.nazwa, k.email, k.telefon)))
+              AND szukaj_pasuje(dokument_klienta(k.nazwa, k.email, k.telefon), tokeny)
+              AND (typ_klienta_filtr IS NULL OR k.typ_klienta = typ_klienta_filtr)
+            ORDER BY szukaj_wynik(dokument_klienta(k.nazwa, k.email, k.telefon), fraza) DESC, k.nazwa
+            LIMIT limit_wynikow OFFSET przesuniecie;
+        END;
+        $$ LANGUAGE plpgsql STABLE;
+        """
+    ),
+    (
+        "008_klienci_cechy_zmiany",
+        "Keep client score features in sync on device and communication updates and deletes",
+        # Only rows whose client, value or date changed contribute; the date of the
+        # latest communication can't be subtracted, so it is recomputed for the
+        # affected clients. Clients deleted in the same statement are skipped.
+        """
+        CREATE OR REPLACE FUNCTION cechy_zmienione_urzadzenia() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO klienci_cechy (
+                id_klienta, liczba_urządzeń, suma_wartości_urządzeń, liczba_wycenionych_urządzeń
+            )
+            SELECT z.id_klienta, SUM(z.liczba), SUM(z.suma), SUM(z.wycenione)
+            FROM (
+                SELECT n.id_klienta, 1 AS liczba, COALESCE(n.wartość, 0) AS suma, (n.wartość IS NOT NULL)::int AS wycenione
+                FROM nowe n JOIN stare s ON s.id = n.id
+                WHERE n.id_klienta IS DISTINCT FROM s.id_klienta OR n.wartość IS DISTINCT FROM s.wartość
+                UNION ALL
+                SELECT s.id_klienta, -1, -COALESCE(s.wartość, 0), -(s.wartość IS NOT NULL)::int
+                FROM nowe n JOIN stare s ON s.id = n.id
+                WHERE n.id_klienta IS DISTINCT FROM s.id_klienta OR n.wartość IS DISTINCT FROM s.wartość
+            ) z
+            JOIN klienci k ON k.id = z.id_klienta
+            GROUP BY z.id_klienta
+            ON CONFLICT (id_klienta) DO UPDATE SET
+                liczba_urządzeń = klienci_cechy.liczba_urządzeń + EXCLUDED.liczba_urządzeń,
+                suma_wartości_urządzeń = klienci_cechy.suma_wartości_urządzeń + EXCLUDED.suma_wartości_urządzeń,
+                liczba_wycenionych_urządzeń = klienci_cechy.liczba_wycenionych_urządzeń + EXCLUDED.liczba_wycenionych_urządzeń,
+                data_aktualizacji = CURRENT_TIMESTAMP;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS urzadzenia_cechy_zmiana ON urządzenia_hvac;
+        CREATE TRIGGER urzadzenia_cechy_zmiana
+            AFTER UPDATE ON urządzenia_hvac
+            REFERENCING OLD TABLE AS stare NEW TABLE AS nowe
+            FOR EACH STATEMENT EXECUTE FUNCTION cechy_zmienione_urzadzenia();
+
+        CREATE OR REPLACE FUNCTION cechy_usuniete_urzadzenia() RETURNS trigger AS $$
+        BEGIN
+            UPDATE klienci_cechy c SET
+                liczba_urządzeń = c.liczba_urządzeń - s.liczba,
+                suma_wartości_urządzeń = c.suma_wartości_urządzeń - s.suma,
+                liczba_wycenionych_urządzeń = c.liczba_wycenionych_urządzeń - s.wycenione,
+                data_aktualizacji = CURRENT_TIMESTAMP
+            FROM (
+                SELECT id_klienta, COUNT(*) AS liczba, COALESCE(SUM(wartość), 0) AS suma, COUNT(wartość) AS wycenione
+                FROM stare
+                GROUP BY id_klienta
+            ) s
+            WHERE c.id_klienta = s.id_klienta;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS urzadzenia_cechy_usuniecie ON urządzenia_hvac;
+        CREATE TRIGGER urzadzenia_cechy_usuniecie
+            AFTER DELETE ON urządzenia_hvac
+            REFERENCING OLD TABLE AS stare
+            FOR EACH STATEMENT EXECUTE FUNCTION cechy_usuniete_urzadzenia();
+
+        CREATE OR REPLACE FUNCTION cechy_zmieniona_komunikacja() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO klienci_cechy (id_klienta, liczba_komunikacji, ostatnia_komunikacja)
+            SELECT z.id_klienta, SUM(z.liczba),
+                   (SELECT MAX(km.data_czas) FROM komunikacja km WHERE km.id_klienta = z.id_klienta)
+            FROM (
+                SELECT n.id_klienta, 1 AS liczba
+                FROM nowa n JOIN stara s ON s.id = n.id
+                WHERE n.id_klienta IS DISTINCT FROM s.id_klienta OR n.data_czas IS DISTINCT FROM s.data_czas
+                UNION ALL
+                SELECT s.id_klienta, -1
+                FROM nowa n JOIN stara s ON s.id = n.id
+                WHERE n.id_klienta IS DISTINCT FROM s.id_klienta OR n.data_czas IS DISTINCT FROM s.data_czas
+            ) z
+            JOIN klienci k ON k.id = z.id_klienta
+            GROUP BY z.id_klienta
+            ON CONFLICT (id_klienta) DO UPDATE SET
+                liczba_komunikacji = klienci_cechy.liczba_komunikacji + EXCLUDED.liczba_komunikacji,
+                ostatnia_komunikacja = EXCLUDED.ostatnia_komunikacja,
+                data_aktualizacji = CURRENT_TIMESTAMP;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS komunikacja_cechy_zmiana ON komunikacja;
+        CREATE TRIGGER komunikacja_cechy_zmiana
+            AFTER UPDATE ON komunikacja
+            REFERENCING OLD TABLE AS stara NEW TABLE AS nowa
+            FOR EACH STATEMENT EXECUTE FUNCTION cechy_zmieniona_komunikacja();
+
+        CREATE OR REPLACE FUNCTION cechy_usunieta_komunikacja() RETURNS trigger AS $$
+        BEGIN
+            UPDATE klienci_cechy c SET
+                liczba_komunikacji = c.liczba_komunikacji - s.liczba,
+                ostatnia_komunikacja = (SELECT MAX(km.data_czas) FROM komunikacja km WHERE km.id_klienta = c.id_klienta),
+                data_aktualizacji = CURRENT_TIMESTAMP
+            FROM (
+                SELECT id_klienta, COUNT(*) AS liczba
+                FROM stara
+                GROUP BY id_klienta
+            ) s
+            WHERE c.id_klienta = s.id_klienta;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS komunikacja_cechy_usuniecie ON komunikacja;
+        CREATE TRIGGER komunikacja_cechy_usuniecie
+            AFTER DELETE ON komunikacja
+            REFERENCING OLD TABLE AS stara
+            FOR EACH STATEMENT EXECUTE FUNCTION cechy_usunieta_komunikacja();
+        """ + CLIENT_FEATURES_REBUILD.format(where="WHERE TRUE")
+    ),
+]
+
+# Migrations that can't run before the listed ones were applied
+MIGRATION_DEPENDENCIES = {
+    "005_klienci_cechy_wyzwalacze": ("001_klienci_cechy",),
+    "006_szukaj_urzadzen_klient": ("003_wyszukiwanie",),
+    "007_szukaj_klientow_typ": ("003_wyszukiwanie",),
+    "008_klienci_cechy_zmiany": ("001_klienci_cechy", "005_klienci_cechy_wyzwalacze"),
+}
+
+
+def apply_migrations(conn):
+    """Apply all pending migrations on the given connection. Returns the applied versions.
+
+    Every migration commits on its own under the advisory lock, so a failure
+    only rolls back that migration. It is logged, the migrations depending
+    on it are skipped and the rest are still applied.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version VARCHAR(100) PRIMARY KEY,
+            opis TEXT,
+            data_zastosowania TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+    conn.commit()
+
+    applied = []
+    pending = set()
+    for version, description, sql in MIGRATIONS:
+        blocked = [dependency for dependency in MIGRATION_DEPENDENCIES.get(version, ()) if dependency in pending]
+        if blocked:
+            logger.error(f"Migration {version} skipped until {', '.join(blocked)} is applied")
+            pending.add(version)
+            continue
+        try:
+            with conn.cursor() as cursor:
+                # Another process may have applied it while we waited for the lock
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+                cursor.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (version,))
+                if cursor.fetchone():
+                    conn.commit()
+                    continue
+                logger.info(f"Applying migration {version}: {description}")
+                cursor.execute(sql)
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, opis) VALUES (%s, %s)",
+                    (version, description)
+                )
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Migration {version} failed, rolled back: {e}")
+            pending.add(version)
+            continue
+        applied.append(version)
+
+    return applied
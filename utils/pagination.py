@@ -0,0 +1,120 @@
+"""
+Keyset (cursor) pagination for list queries.
+
+A page is selected with ``WHERE (sort_key, id) < (last_sort_key, last_id)``
+instead of ``OFFSET``, so every page costs one index range scan regardless
+of depth, and rows inserted meanwhile don't shift later pages. The position
+is handed to callers as an opaque cursor string; a cursor only fits the
+listing it came from.
+
+Usage in a query helper::
+
+    keyset = Keyset("klienci", "nazwa", "id")
+    condition, params = keyset.condition(cursor)
+    query = f"SELECT *, {keyset.select} FROM klienci WHERE {condition} {keyset.order_by()}"
+    rows, next_cursor = keyset.page(execute_query(query, params + [limit + 1]), limit)
+"""
+
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+# Column the sort key is selected as; removed from the returned rows
+KEY_COLUMN = "klucz_strony"
+
+# Stand-ins for NULL sort keys so row comparisons never see NULL
+MIN_DATE = "DATE '0001-01-01'"
+MIN_TIMESTAMP = "TIMESTAMP '0001-01-01 00:00:00'"
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"t": value.isoformat()}
+    if isinstance(value, date):
+        return {"d": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"n": str(value)}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if "t" in value:
+            return datetime.fromisoformat(value["t"])
+        if "d" in value:
+            return date.fromisoformat(value["d"])
+        if "n" in value:
+            return Decimal(value["n"])
+    return value
+
+
+def encode_cursor(listing, values):
+    """Encode the position after a row (its sort key values) as an opaque cursor."""
+    payload = json.dumps({"l": listing, "v": [_encode_value(v) for v in values]}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(listing, cursor):
+    """Decode a cursor produced by ``encode_cursor`` for the same listing.
+
+    Raises ValueError if the cursor is malformed or belongs to another listing.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values = [_decode_value(v) for v in payload["v"]]
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError(f"Invalid page cursor: {e}") from None
+    if payload.get("l") != listing:
+        raise ValueError(f"Page cursor is for {payload.get('l')!r}, not {listing!r}")
+    return values
+
+
+class Keyset:
+    """Ordering of one listing by ``(sort_key, id)``, both in the same direction.
+
+    ``sort_key`` is an SQL expression; it must not be NULL (wrap nullable
+    columns in COALESCE with ``MIN_DATE``/``MIN_TIMESTAMP``) and should match
+    an index on ``(sort_key, id)``.
+    """
+
+    def __init__(self, listing, sort_key, id_column, descending=False):
+        self.listing = listing
+        self.sort_key = sort_key
+        self.id_column = id_column
+        self.descending = descending
+
+    @property
+    def select(self):
+        """Select-list item exposing the sort key for the next cursor."""
+        return f"{self.sort_key} as {KEY_COLUMN}"
+
+    def condition(self, cursor=None):
+        """Return the SQL condition (and params) for rows after ``cursor``."""
+        if not cursor:
+            return "TRUE", []
+        key, last_id = decode_cursor(self.listing, cursor)
+        operator = "<" if self.descending else ">"
+        return f"({self.sort_key}, {self.id_column}) {operator} (%s, %s)", [key, last_id]
+
+    def order_by(self):
+        """ORDER BY/LIMIT clause; pass ``limit + 1`` as its parameter to detect a next page."""
+        direction = "DESC" if self.descending else "ASC"
+        return f"ORDER BY {self.sort_key} {direction}, {self.id_column} {direction} LIMIT %s"
+
+    def page(self, rows, limit, id_field="id"):
+        """Trim ``rows`` (fetched with ``limit + 1``) to a page and return ``(rows, next_cursor)``.
+
+        ``next_cursor`` is None on the last page.
+        """
+        rows = list(rows or [])
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = None
+        if has_more and rows:
+            last = rows[-1]
+            next_cursor = encode_cursor(self.listing, [last[KEY_COLUMN], last[id_field]])
+        for row in rows:
+            row.pop(KEY_COLUMN, None)
+        return rows, next_cursor
@@ -0,0 +1,246 @@
+"""
+Thread-safe PostgreSQL connection pool for the HVAC CRM/ERP data layer.
+
+Connections are created lazily up to ``max_size``, validated on checkout when
+they have been idle longer than the health-check interval, and reaped when
+they stay idle longer than ``max_idle`` (never below ``min_size``).
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(PoolError):
+    """Raised when no connection becomes available within the checkout timeout."""
+
+
+class ConnectionPool:
+    """A bounded pool of psycopg2 connections shared by all threads of the process."""
+
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        min_size: int = 1,
+        max_size: int = 10,
+        timeout: float = 30.0,
+        max_idle: float = 300.0,
+        health_check_interval: float = 30.0
+    ):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+
+        self._connect = connect
+        self.min_size = max(0, min(min_size, max_size))
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.health_check_interval = health_check_interval
+
+        self._lock = threading.Condition(threading.Lock())
+        self._idle: List[Tuple[Any, float]] = []  # (connection, returned_at), most recent last
+        self._in_use = set()
+        self._size = 0
+        self._waiting = 0
+        self._closed = False
+
+        self._stats = {
+            "checkouts": 0,
+            "created": 0,
+            "discarded": 0,
+            "reaped": 0,
+            "failed_health_checks": 0,
+            "waits": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "timeouts": 0,
+            "peak_in_use": 0,
+        }
+
+    # Checkout / checkin
+
+    def getconn(self, timeout: Optional[float] = None):
+        """Check out a healthy connection, waiting up to ``timeout`` seconds if the pool is saturated."""
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        waited_since = None
+
+        while True:
+            conn, idle_since, create = None, None, False
+
+            with self._lock:
+                if self._closed:
+                    raise PoolError("connection pool is closed")
+
+                self._reap_locked()
+
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                elif self._size < self.max_size:
+                    self._size += 1
+                    create = True
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeout(
+                            f"No database connection available after {timeout:.1f}s "
+                            f"(pool size {self.max_size})"
+                        )
+                    if waited_since is None:
+                        waited_since = time.monotonic()
+                        self._stats["waits"] += 1
+                    self._waiting += 1
+                    try:
+                        self._lock.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+                    continue
+
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._size -= 1
+                        self._lock.notify()
+                    raise
+                with self._lock:
+                    self._stats["created"] += 1
+            elif not self._is_healthy(conn, idle_since):
+                self._discard(conn)
+                continue
+
+            with self._lock:
+                self._in_use.add(id(conn))
+                self._stats["checkouts"] += 1
+                self._stats["peak_in_use"] = max(self._stats["peak_in_use"], len(self._in_use))
+                if waited_since is not None:
+                    waited = time.monotonic() - waited_since
+                    self._stats["wait_time_total"] += waited
+                    self._stats["wait_time_max"] = max(self._stats["wait_time_max"], waited)
+            return conn
+
+    def putconn(self, conn, close: bool = False):
+        """Return a connection to the pool, rolling back any open transaction."""
+        with self._lock:
+            self._in_use.discard(id(conn))
+
+        if not close and not conn.closed:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception as e:
+                logger.warning(f"Discarding connection that failed to reset: {e}")
+                close = True
+
+        if close or conn.closed or self._closed:
+            self._discard(conn)
+            return
+
+        with self._lock:
+            self._idle.append((conn, time.monotonic()))
+            self._lock.notify()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        """Context manager that checks out a connection and always returns it."""
+        conn = self.getconn(timeout)
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.putconn(conn, close=broken or conn.closed)
+
+    # Maintenance
+
+    def _is_healthy(self, conn, idle_since: float) -> bool:
+        """Validate a connection that has been idle longer than the health-check interval."""
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception as e:
+            logger.warning(f"Pooled connection failed health check: {e}")
+            with self._lock:
+                self._stats["failed_health_checks"] += 1
+            return False
+
+    def _discard(self, conn):
+        try:
+            if not conn.closed:
+                conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._size -= 1
+            self._stats["discarded"] += 1
+            self._lock.notify()
+
+    def _reap_locked(self):
+        """Close connections idle longer than ``max_idle`` while keeping ``min_size`` open."""
+        if not self._idle or self.max_idle <= 0:
+            return
+        now = time.monotonic()
+        # Idle list is ordered oldest first
+        while self._idle and self._size > self.min_size and now - self._idle[0][1] > self.max_idle:
+            conn, _ = self._idle.pop(0)
+            try:
+                conn.close()
+            except Exception:
+                pass
+            self._size -= 1
+            self._stats["reaped"] += 1
+
+    def reap(self):
+        """Reap idle connections now instead of waiting for the next checkout."""
+        with self._lock:
+            self._reap_locked()
+
+    def closeall(self):
+        """Close every idle connection and refuse further checkouts."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._lock.notify_all()
+        for conn, _ in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    # Metrics
+
+    def stats(self) -> Dict[str, Any]:
+        """Return pool occupancy and saturation metrics."""
+        with self._lock:
+            in_use = len(self._in_use)
+            stats = dict(self._stats)
+            stats.update({
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": in_use,
+                "waiting": self._waiting,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "saturation": in_use / self.max_size,
+            })
+        stats["wait_time_avg"] = stats["wait_time_total"] / stats["waits"] if stats["waits"] else 0.0
+        return stats
@@ -0,0 +1,174 @@
+"""
+Server-side prepared statements for the hot queries of ``utils.db``.
+
+psycopg2 sends the full SQL text with every execution, so PostgreSQL parses
+and plans it each time. A statement registered here is instead prepared once
+per pooled connection (``PREPARE name AS ...``) and run as
+``EXECUTE name (...)``; PostgreSQL then skips parsing and, once it settles on
+a generic plan, planning too.
+
+Usage::
+
+    CLIENT_BY_ID = prepared.register("klient_po_id", "SELECT * FROM klienci WHERE id = %s")
+    db.execute_query(CLIENT_BY_ID, (client_id,))
+
+``utils.db.execute_query``/``cached_query`` accept a registered statement in
+place of the SQL text. Prepared statements live in the database session, so
+they don't work behind a transaction-pooling pgbouncer; set
+``DB_PREPARED_STATEMENTS=false`` there and the plain SQL text is sent instead.
+"""
+
+import re
+import threading
+import weakref
+
+from psycopg2 import errors
+
+from config import DB_PREPARED_STATEMENTS
+
+_PLACEHOLDER = re.compile(r"%%|%s|%\((\w+)\)s")
+
+
+def _to_positional(query):
+    """Convert psycopg2 placeholders to ``$n`` and return ``(sql, param_names)``.
+
+    ``param_names`` lists the names of ``%(name)s`` placeholders by position,
+    or is None for ``%s`` placeholders.
+    """
+    names = []
+    positions = {}
+    count = 0
+
+    def replace(match):
+        nonlocal count
+        if match.group(0) == "%%":
+            return "%"
+        name = match.group(1)
+        if name is None:
+            count += 1
+            return f"${count}"
+        if name not in positions:
+            names.append(name)
+            positions[name] = len(names)
+        return f"${positions[name]}"
+
+    sql = _PLACEHOLDER.sub(replace, query)
+    if count and names:
+        raise ValueError("A statement cannot mix %s and %(name)s placeholders")
+    return sql, names or None
+
+
+class PreparedStatement:
+    """A named statement; ``query`` is its psycopg2 SQL text."""
+
+    def __init__(self, name, query):
+        self.name = name
+        self.query = query
+        self.sql, self.param_names = _to_positional(query)
+
+    def execute_sql(self, params):
+        """Return the ``EXECUTE`` statement and its parameters for ``params``."""
+        if self.param_names is not None:
+            params = [params[name] for name in self.param_names]
+        params = tuple(params or ())
+        if not params:
+            return f"EXECUTE {self.name}", params
+        return f"EXECUTE {self.name} ({', '.join(['%s'] * len(params))})", params
+
+    def __repr__(self):
+        return f"PreparedStatement({self.name!r})"
+
+
+class StatementRegistry:
+    """Registered statements and the pooled connections they are prepared on."""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._statements = {}
+        self._lock = threading.Lock()
+        # connection -> names prepared in its session; entries go with the connection
+        self._prepared = weakref.WeakKeyDictionary()
+        self._stats = {}
+
+    def register(self, name, query):
+        """Register ``query`` under ``name`` (an SQL identifier) and return the statement."""
+        statement = PreparedStatement(name, query)
+        with self._lock:
+            existing = self._statements.get(name)
+            if existing is not None and existing.query != query:
+                raise ValueError(f"Prepared statement {name!r} is already registered with other SQL")
+            self._statements[name] = statement
+            self._stats.setdefault(name, {"executions": 0, "prepares": 0, "reprepares": 0})
+        return statement
+
+    def execute(self, cursor, statement, params=None):
+        """Execute ``statement`` on ``cursor``, preparing it on the connection first if needed."""
+        if not self.enabled:
+            cursor.execute(statement.query, params or ())
+            return
+
+        conn = cursor.connection
+        with self._lock:
+            names = self._prepared.setdefault(conn, set())
+            prepared = statement.name in names
+            stats = self._stats[statement.name]
+            stats["executions"] += 1
+            if not prepared:
+                stats["prepares"] += 1
+
+        if not prepared:
+            self._prepare(cursor, statement, names)
+        sql, values = statement.execute_sql(params)
+        try:
+            cursor.execute(sql, values)
+        except errors.InvalidSqlStatementName:
+            # The session lost the statement (e.g. DISCARD ALL); only safe to
+            # retry as the first statement of execute_query's transaction
+            conn.rollback()
+            with self._lock:
+                names.clear()
+                stats["reprepares"] += 1
+            self._prepare(cursor, statement, names)
+            cursor.execute(sql, values)
+
+    def _prepare(self, cursor, statement, names):
+        cursor.execute(f"PREPARE {statement.name} AS {statement.sql}")
+        with self._lock:
+            names.add(statement.name)
+
+    def stats(self):
+        """Per-statement executions, prepares and plan reuse (hit) rate, plus totals."""
+        with self._lock:
+            statements = {}
+            for name, counters in sorted(self._stats.items()):
+                hits = counters["executions"] - counters["prepares"]
+                statements[name] = dict(
+                    counters,
+                    hits=hits,
+                    hit_rate=hits / counters["executions"] if counters["executions"] else 0.0
+                )
+            connections = len(self._prepared)
+        executions = sum(s["executions"] for s in statements.values())
+        hits = sum(s["hits"] for s in statements.values())
+        return {
+            "enabled": self.enabled,
+            "connections": connections,
+            "executions": executions,
+            "hits": hits,
+            "hit_rate": hits / executions if executions else 0.0,
+            "statements": statements,
+        }
+
+
+# Process-wide registry used by utils.db
+registry = StatementRegistry(DB_PREPARED_STATEMENTS)
+
+
+def register(name, query):
+    """Register a hot statement (see module docstring)."""
+    return registry.register(name, query)
+
+
+def stats():
+    """Return prepared statement usage counters."""
+    return registry.stats()
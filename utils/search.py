@@ -0,0 +1,153 @@
+"""
+Ranked search over clients, devices and buildings.
+
+Matching runs in PostgreSQL on normalized search documents (lower-cased,
+Polish diacritics removed with unaccent) backed by pg_trgm GIN indexes, all
+created by migration ``003_wyszukiwanie``. Every word of a phrase has to
+match, either as a substring (so prefixes like "kowal" work) or, from three
+characters on, by trigram word similarity (so "kowalsky" finds "Kowalski").
+Results carry a relevance score ``wynik``: the mean per-word match plus 0.5
+when the document starts with the whole phrase.
+
+Until the migration has been applied, every word is matched as a plain
+case-insensitive substring (ILIKE) of the raw columns instead, without the
+fuzzy matching and with ``wynik`` 0 for every row.
+"""
+
+import time
+
+from utils import db
+
+# Words of a phrase taken into account (szukaj_tokeny() in the migration uses the same limit)
+MAX_TOKENS = 5
+
+# Shorter words only match as substrings; their trigrams are too unselective for similarity
+MIN_FUZZY_LENGTH = 3
+
+# Search documents as indexed; ``{a}`` is the table alias prefix (e.g. "k.")
+CLIENT_DOCUMENT = "dokument_klienta({a}nazwa, {a}email, {a}telefon)"
+DEVICE_DOCUMENT = "dokument_urzadzenia({a}model, {a}numer_seryjny)"
+BUILDING_DOCUMENT = "dokument_budynku({a}nazwa, {a}adres)"
+
+# Raw columns matched when the search functions are missing
+CLIENT_PLAIN_DOCUMENT = "concat_ws(' ', {a}nazwa, {a}email, {a}telefon)"
+DEVICE_PLAIN_DOCUMENT = "concat_ws(' ', {a}model, {a}numer_seryjny)"
+BUILDING_PLAIN_DOCUMENT = "concat_ws(' ', {a}nazwa, {a}adres)"
+
+DOCUMENTS = {
+    "klienci": (CLIENT_DOCUMENT, CLIENT_PLAIN_DOCUMENT),
+    "urządzenia": (DEVICE_DOCUMENT, DEVICE_PLAIN_DOCUMENT),
+    "budynki": (BUILDING_DOCUMENT, BUILDING_PLAIN_DOCUMENT),
+}
+
+# Seconds before checking again whether the search functions were created
+FUZZY_RECHECK_INTERVAL = 60
+
+_fuzzy = {"available": False, "checked_at": None}
+
+
+def tokenize(term):
+    """Split a search phrase into the words that are matched."""
+    return (term or "").split()[:MAX_TOKENS]
+
+
+def match_clause(document, term):
+    """Return an SQL condition and its params requiring every word of ``term`` to match ``document``.
+
+    Each word is a separate condition on the indexed expression, so PostgreSQL
+    can combine the trigram index scans.
+    """
+    conditions = []
+    params = []
+    for token in tokenize(term):
+        if len(token) >= MIN_FUZZY_LENGTH:
+            conditions.append(
+                f"({document} LIKE szukaj_wzorzec(szukaj_normalizuj(%s)) "
+                f"OR szukaj_normalizuj(%s) <%% {document})"
+            )
+            params.extend([token, token])
+        else:
+            conditions.append(f"{document} LIKE szukaj_wzorzec(szukaj_normalizuj(%s))")
+            params.append(token)
+    return " AND ".join(conditions) or "TRUE", params
+
+
+def score_expression(document, term):
+    """Return the SQL relevance expression for ``term`` against ``document`` and its params."""
+    return f"szukaj_wynik({document}, %s)", [" ".join(tokenize(term))]
+
+
+def plain_match_clause(document, term):
+    """Like ``match_clause``, with every word matched as a case-insensitive substring."""
+    conditions = []
+    params = []
+    for token in tokenize(term):
+        conditions.append(f"{document} ILIKE %s")
+        escaped = token.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        params.append(f"%{escaped}%")
+    return " AND ".join(conditions) or "TRUE", params
+
+
+def fuzzy_available():
+    """Whether the search functions of migration ``003_wyszukiwanie`` exist.
+
+    A positive answer is kept for good; a negative one is checked again after
+    ``FUZZY_RECHECK_INTERVAL`` seconds.
+    """
+    checked_at = _fuzzy["checked_at"]
+    if _fuzzy["available"] or (checked_at is not None and time.monotonic() - checked_at < FUZZY_RECHECK_INTERVAL):
+        return _fuzzy["available"]
+    result = db.execute_query("SELECT to_regprocedure('szukaj_wynik(text, text)') IS NOT NULL AS dostepne")
+    _fuzzy["available"] = bool(result and result[0]["dostepne"])
+    _fuzzy["checked_at"] = time.monotonic()
+    return _fuzzy["available"]
+
+
+def search_clauses(kind, alias, term):
+    """Return ``(score, score_params, condition, condition_params)`` searching ``term`` in ``kind``.
+
+    ``kind`` is a key of ``DOCUMENTS`` and ``alias`` the table alias prefix.
+    Uses the ranked trigram search when available, plain substring matching
+    otherwise.
+    """
+    indexed, plain = DOCUMENTS[kind]
+    if fuzzy_available():
+        document = indexed.format(a=alias)
+        score, score_params = score_expression(document, term)
+        condition, condition_params = match_clause(document, term)
+    else:
+        score, score_params = "0::real", []
+        condition, condition_params = plain_match_clause(plain.format(a=alias), term)
+    return score, score_params, condition, condition_params
+
+
+def search_clients(term, limit=20, offset=0):
+    """Clients matching ``term``, best first, with a relevance score ``wynik``."""
+    if not tokenize(term):
+        return []
+    return db.get_clients(search=term, limit=limit, offset=offset)
+
+
+def search_devices(term, client_id=None, building_id=None, limit=20, offset=0):
+    """Devices matching ``term`` (model or serial number), best first, with ``wynik``."""
+    if not tokenize(term):
+        return []
+    return db.get_devices(
+        client_id=client_id, building_id=building_id, search=term, limit=limit, offset=offset
+    )
+
+
+def search_buildings(term, client_id=None, limit=20, offset=0):
+    """Buildings matching ``term`` (name or address), best first, with ``wynik``."""
+    if not tokenize(term):
+        return []
+    return db.get_buildings(client_id=client_id, search=term, limit=limit, offset=offset)
+
+
+def search_all(term, limit=10):
+    """Search clients, devices and buildings at once, e.g. for a global search box."""
+    return {
+        "klienci": search_clients(term, limit=limit) or [],
+        "urządzenia": search_devices(term, limit=limit) or [],
+        "budynki": search_buildings(term, limit=limit) or [],
+    }
@@ -1,101 +1,443 @@
+"""
+Supabase access: the data helpers of ``utils.db`` over the PostgREST API,
+plus real-time subscriptions, storage and authentication.
+
+Table reads and writes go through one shared ``httpx`` client, so every
+request reuses the same connection pool (multiplexed over HTTP/2 when the
+``h2`` package is installed) instead of opening connections per call.
+Listings fetch their joined names in the same request through embedded
+resource selects, lookups of many rows are batched into ``in.(...)``
+filters, and reads are served through the result cache of ``utils.cache``
+like the direct PostgreSQL helpers.
+"""
+
+import threading
+import time
+
+import httpx
 from supabase import create_client
 import pandas as pd
 from config import SUPABASE_URL, SUPABASE_KEY
+from config import SUPABASE_MAX_CONNECTIONS, SUPABASE_TIMEOUT, SUPABASE_IN_BATCH_SIZE, SUPABASE_HEALTH_TTL
+from utils import cache
+from utils import db
+from utils.pagination import encode_cursor, decode_cursor
+
+try:
+    import h2  # noqa: F401 (enables HTTP/2 in httpx)
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
 
-# Initialize Supabase client
+# Initialize Supabase client (subscriptions, storage and auth; table access uses rest_request)
 supabase = create_client(SUPABASE_URL, SUPABASE_KEY) if SUPABASE_URL and SUPABASE_KEY else None
 
-def is_connected():
-    """Check if Supabase client is connected."""
-    if not supabase:
-        return False
+# Embedded resource selects with the joins of utils.db's listings; foreign keys
+# are named by column so PostgREST never has to guess the relationship
+BUILDING_SELECT = "*,klient:klienci!id_klienta(nazwa)"
+DEVICE_SELECT = "*,budynek:budynki!id_budynku(nazwa,klient:klienci!id_klienta(nazwa))"
+# Filtering devices by client goes through the building, as in utils.db
+DEVICE_BY_CLIENT_SELECT = "*,budynek:budynki!id_budynku!inner(nazwa,klient:klienci!id_klienta(nazwa))"
+SERVICE_ORDER_SELECT = "*,klient:klienci!id_klienta(nazwa),urządzenie:urządzenia_hvac!id_urządzenia(model)"
+
+BUILDING_TABLES = frozenset({"budynki", "klienci"})
+DEVICE_TABLES = frozenset({"urządzenia_hvac", "budynki", "klienci"})
+SERVICE_ORDER_TABLES = frozenset({"zlecenia_serwisowe", "klienci", "urządzenia_hvac"})
+
+_http = None
+_http_lock = threading.Lock()
+_http_stats = {"requests": 0, "errors": 0}
+_health = {"checked_at": None, "connected": False}
+_health_lock = threading.Lock()
+
+def get_http_client():
+    """Get the shared REST client, creating it on first use."""
+    global _http
+    if _http is None:
+        with _http_lock:
+            if _http is None:
+                _http = httpx.Client(
+                    base_url=f"{SUPABASE_URL.rstrip('/')}/rest/v1/",
+                    headers={"apikey": SUPABASE_KEY, "Authorization": f"Bearer {SUPABASE_KEY}"},
+                    http2=HTTP2,
+                    limits=httpx.Limits(
+                        max_connections=SUPABASE_MAX_CONNECTIONS,
+                        max_keepalive_connections=SUPABASE_MAX_CONNECTIONS
+                    ),
+                    timeout=SUPABASE_TIMEOUT
+                )
+    return _http
+
+def close_http_client():
+    """Close the shared REST client (e.g. on shutdown)."""
+    global _http
+    with _http_lock:
+        if _http is not None:
+            _http.close()
+            _http = None
+
+def get_http_stats():
+    """Get the REST request and error counts."""
+    with _http_lock:
+        return dict(_http_stats, http2=HTTP2)
+
+def rest_request(method, path, params=None, json=None, prefer=None):
+    """Send a PostgREST request and return its decoded JSON body (None on error)."""
+    with _http_lock:
+        _http_stats["requests"] += 1
     try:
-        # Try a simple query to check connection
-        supabase.table('klienci').select('id').limit(1).execute()
-        return True
+        response = get_http_client().request(
+            method, path, params=params, json=json,
+            headers={"Prefer": prefer} if prefer else None
+        )
+        response.raise_for_status()
+        return response.json() if response.content else []
     except Exception as e:
-        print(f"Supabase connection error: {e}")
+        with _http_lock:
+            _http_stats["errors"] += 1
+        print(f"Supabase request error: {e}")
+        return None
+
+def is_connected():
+    """Check if Supabase answers; the result is reused for ``SUPABASE_HEALTH_TTL`` seconds."""
+    if not supabase:
         return False
+    with _health_lock:
+        checked_at = _health["checked_at"]
+        if checked_at is None or time.monotonic() - checked_at >= SUPABASE_HEALTH_TTL:
+            result = rest_request("GET", "klienci", params=[("select", "id"), ("limit", "1")])
+            _health["connected"] = result is not None
+            _health["checked_at"] = time.monotonic()
+        return _health["connected"]
+
+# Reads (served through utils.cache, tagged with the tables they embed)
+def _quote(value):
+    """Quote a value inside a PostgREST ``in.(...)`` list or ``or=(...)`` tree.
+
+    Plain ``column=eq.value`` filters take the raw value; quotes there would
+    become part of it.
+    """
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def _in_filter(values):
+    return "in.(" + ",".join(str(v) if isinstance(v, int) else _quote(v) for v in values) + ")"
+
+def _select(table, params, tables=None, flatten=None):
+    """GET rows of ``table`` with PostgREST query ``params`` (a list of pairs); None on error."""
+    def load():
+        rows = rest_request("GET", table, params=params)
+        if rows is None or flatten is None:
+            return rows
+        return [flatten(row) for row in rows]
+
+    return cache.result_cache.get_or_load(
+        ("rest", table, cache.freeze(params)), load, tables or frozenset({table})
+    )
+
+def _rpc(function, args, select="*", tables=None, flatten=None):
+    """Call a set-returning database function; its rows can embed resources like a table's."""
+    def load():
+        rows = rest_request("POST", f"rpc/{function}", params=[("select", select)], json=args)
+        if rows is None or flatten is None:
+            return rows
+        return [flatten(row) for row in rows]
+
+    return cache.result_cache.get_or_load(
+        ("rpc", function, select, cache.freeze(args)), load, tables
+    )
+
+def _select_in(table, column, values, select="*", tables=None, flatten=None):
+    """Rows of ``table`` whose ``column`` is in ``values``, in one request per
+    ``SUPABASE_IN_BATCH_SIZE`` values instead of one per value."""
+    values = list(dict.fromkeys(value for value in values if value is not None))
+    rows = []
+    for start in range(0, len(values), SUPABASE_IN_BATCH_SIZE):
+        batch = values[start:start + SUPABASE_IN_BATCH_SIZE]
+        result = _select(table, [("select", select), (column, _in_filter(batch))], tables, flatten)
+        if result is None:
+            return None
+        rows.extend(result)
+    return rows
+
+def _flatten_building(row):
+    row['nazwa_klienta'] = (row.pop('klient', None) or {}).get('nazwa')
+    return row
+
+def _flatten_device(row):
+    building = row.pop('budynek', None) or {}
+    row['nazwa_budynku'] = building.get('nazwa')
+    row['nazwa_klienta'] = (building.get('klient') or {}).get('nazwa')
+    return row
+
+def _flatten_service_order(row):
+    row['nazwa_klienta'] = (row.pop('klient', None) or {}).get('nazwa')
+    row['model_urządzenia'] = (row.pop('urządzenie', None) or {}).get('model')
+    return row
+
+def _device_filters(client_id=None, building_id=None):
+    select = DEVICE_BY_CLIENT_SELECT if client_id else DEVICE_SELECT
+    params = [("select", select)]
+    if client_id:
+        params.append(("budynek.id_klienta", f"eq.{int(client_id)}"))
+    if building_id:
+        params.append(("id_budynku", f"eq.{int(building_id)}"))
+    return params
+
+def _service_order_filters(status=None, client_id=None, device_id=None):
+    params = [("select", SERVICE_ORDER_SELECT)]
+    if status:
+        params.append(("status", f"eq.{status}"))
+    if client_id:
+        params.append(("id_klienta", f"eq.{int(client_id)}"))
+    if device_id:
+        params.append(("id_urządzenia", f"eq.{int(device_id)}"))
+    return params
+
+# Keyset pagination (see utils/pagination.py)
+def _fetch_page(table, params, listing, column, descending, cursor, limit, tables=None, flatten=None):
+    """Fetch the page of ``table`` ordered by ``(column, id)`` after ``cursor``; NULLs sort last.
+
+    Returns ``(rows, next_cursor)``; ``next_cursor`` is None on the last page.
+    """
+    params = list(params)
+    op = "lt" if descending else "gt"
+    if cursor:
+        value, last_id = decode_cursor(listing, cursor)
+        if value is None:
+            params.append(("or", f"(and({column}.is.null,id.{op}.{int(last_id)}))"))
+        else:
+            value = _quote(value)
+            params.append((
+                "or", f"({column}.{op}.{value},and({column}.eq.{value},id.{op}.{int(last_id)}),{column}.is.null)"
+            ))
+
+    direction = "desc" if descending else "asc"
+    params.append(("order", f"{column}.{direction}.nullslast,id.{direction}"))
+    params.append(("limit", str(limit + 1)))
+    rows = _select(table, params, tables, flatten) or []
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(listing, [rows[-1][column], rows[-1]['id']])
+    return rows, next_cursor
+
+def _search_page(function, args, listing, cursor, limit, select="*", tables=None, flatten=None):
+    """Fetch the page of a ranked search function after ``cursor``; returns ``(rows, next_cursor)``.
+
+    The functions rank and filter in the database and take an offset, so the
+    cursor holds the offset of the next page.
+    """
+    offset = decode_cursor(listing, cursor)[0] if cursor else 0
+    rows = _rpc(
+        function, dict(args, limit_wynikow=limit + 1, przesuniecie=offset), select, tables, flatten
+    ) or []
+    next_cursor = encode_cursor(listing, [offset + limit]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
 
 # Client-related functions
 def get_clients(search=None, limit=100, offset=0):
     """Get clients with optional search filter using Supabase."""
     if not supabase:
         return []
-    
-    query = supabase.table('klienci').select('*')
-    
+
     if search:
-        query = query.or_(f"nazwa.ilike.%{search}%,email.ilike.%{search}%,telefon.ilike.%{search}%")
-    
-    response = query.order('nazwa').limit(limit).offset(offset).execute()
-    return response.data if response else []
+        # Ranked trigram search in the database (see utils/search.py)
+        return _rpc('szukaj_klientow', {
+            'fraza': search, 'limit_wynikow': limit, 'przesuniecie': offset
+        }, tables=frozenset({'klienci'})) or []
+
+    return _select('klienci', [
+        ("select", "*"), ("order", "nazwa"), ("limit", str(limit)), ("offset", str(offset))
+    ]) or []
+
+def get_clients_page(search=None, client_type=None, cursor=None, limit=50):
+    """Get the page of clients after ``cursor`` (by name, or by relevance when searching).
+
+    Returns ``(clients, next_cursor)``; ``next_cursor`` is None on the last page.
+    """
+    if not supabase:
+        return [], None
+
+    if search:
+        return _search_page(
+            'szukaj_klientow', {'fraza': search, 'typ_klienta_filtr': client_type}, 'klienci:szukaj',
+            cursor, limit, tables=frozenset({'klienci'})
+        )
+
+    params = [("select", "*")]
+    if client_type:
+        params.append(("typ_klienta", f"eq.{client_type}"))
+    return _fetch_page('klienci', params, 'klienci', 'nazwa', False, cursor, limit)
 
 def get_client_by_id(client_id):
     """Get a client by ID using Supabase."""
     if not supabase:
         return None
-    
-    response = supabase.table('klienci').select('*').eq('id', client_id).execute()
-    return response.data[0] if response and response.data else None
 
+    result = _select('klienci', [("select", "*"), ("id", f"eq.{int(client_id)}")])
+    return result[0] if result else None
+
+def get_clients_by_ids(client_ids):
+    """Get the clients with the given IDs in batched ``in.(...)`` requests."""
+    if not supabase:
+        return []
+
+    return _select_in('klienci', 'id', [int(client_id) for client_id in client_ids]) or []
+
+# Writes run the same hooks as utils.db's; the client score features are kept
+# by database triggers (migration 005) for both backends
 def create_client(client_data):
     """Create a new client using Supabase."""
     if not supabase:
         return None
-    
-    response = supabase.table('klienci').insert(client_data).execute()
-    return response.data[0]['id'] if response and response.data else None
+
+    result = rest_request("POST", "klienci", json=client_data, prefer="return=representation")
+    if result:
+        cache.invalidate('klienci')
+        db.invalidate_dashboard_snapshot()
+        db.notify_client_change(result[0]['id'])
+    return result[0]['id'] if result else None
 
 def update_client(client_id, client_data):
     """Update an existing client using Supabase."""
     if not supabase:
         return False
-    
-    response = supabase.table('klienci').update(client_data).eq('id', client_id).execute()
-    return bool(response and response.data)
+
+    result = rest_request(
+        "PATCH", "klienci", params=[("id", f"eq.{int(client_id)}")], json=client_data,
+        prefer="return=representation"
+    )
+    if result:
+        cache.invalidate('klienci')
+        db.invalidate_dashboard_snapshot()
+        db.notify_client_change(int(client_id))
+    return bool(result)
 
 # Device-related functions
 def get_devices(client_id=None, building_id=None, search=None, limit=100, offset=0):
-    """Get devices with optional filters using Supabase."""
+    """Get devices with their building and client names, with optional filters, using Supabase."""
     if not supabase:
         return []
-    
-    # This is a simplified version - in a real app, you'd need to handle the joins properly
-    query = supabase.table('urządzenia_hvac').select('*')
-    
+
+    if search:
+        # Ranked trigram search in the database (see utils/search.py)
+        return _rpc('szukaj_urzadzen', {
+            'fraza': search, 'id_klienta_filtr': client_id, 'id_budynku_filtr': building_id,
+            'limit_wynikow': limit, 'przesuniecie': offset
+        }, DEVICE_SELECT, DEVICE_TABLES, _flatten_device) or []
+
+    params = _device_filters(client_id, building_id) + [
+        ("order", "data_instalacji.desc.nullslast"), ("limit", str(limit)), ("offset", str(offset))
+    ]
+    return _select('urządzenia_hvac', params, DEVICE_TABLES, _flatten_device) or []
+
+def get_devices_page(client_id=None, building_id=None, search=None, cursor=None, limit=50):
+    """Get the page of devices after ``cursor`` (newest installation first, or by relevance).
+
+    Returns ``(devices, next_cursor)``; ``next_cursor`` is None on the last page.
+    """
+    if not supabase:
+        return [], None
+
+    if search:
+        return _search_page(
+            'szukaj_urzadzen', {'fraza': search, 'id_klienta_filtr': client_id, 'id_budynku_filtr': building_id},
+            'urządzenia:szukaj', cursor, limit, DEVICE_SELECT, DEVICE_TABLES, _flatten_device
+        )
+
+    return _fetch_page(
+        'urządzenia_hvac', _device_filters(client_id, building_id), 'urządzenia', 'data_instalacji', True,
+        cursor, limit, DEVICE_TABLES, _flatten_device
+    )
+
+def get_device_by_id(device_id):
+    """Get a device with its building and client names by ID using Supabase."""
+    if not supabase:
+        return None
+
+    result = _select(
+        'urządzenia_hvac', [("select", DEVICE_SELECT), ("id", f"eq.{int(device_id)}")],
+        DEVICE_TABLES, _flatten_device
+    )
+    return result[0] if result else None
+
+def get_devices_by_ids(device_ids):
+    """Get the devices with the given IDs in batched ``in.(...)`` requests."""
+    if not supabase:
+        return []
+
+    return _select_in(
+        'urządzenia_hvac', 'id', [int(device_id) for device_id in device_ids],
+        DEVICE_SELECT, DEVICE_TABLES, _flatten_device
+    ) or []
+
+def create_device(device_data):
+    """Create a new device using Supabase."""
+    if not supabase:
+        return None
+
+    result = rest_request("POST", "urządzenia_hvac", json=device_data, prefer="return=representation")
+    if result:
+        cache.invalidate('urządzenia_hvac')
+        db.invalidate_dashboard_snapshot()
+    return result[0]['id'] if result else None
+
+# Building-related functions
+def get_buildings(client_id=None, search=None, limit=100, offset=0):
+    """Get buildings with their client names, with optional filters, using Supabase."""
+    if not supabase:
+        return []
+
+    if search:
+        return _rpc('szukaj_budynkow', {
+            'fraza': search, 'id_klienta_filtr': client_id, 'limit_wynikow': limit, 'przesuniecie': offset
+        }, BUILDING_SELECT, BUILDING_TABLES, _flatten_building) or []
+
+    params = [("select", BUILDING_SELECT)]
     if client_id:
-        # This assumes you have a view or RPC function that handles the join
-        query = query.eq('id_klienta', client_id)
-    
-    if building_id:
-        query = query.eq('id_budynku', building_id)
-    
+        params.append(("id_klienta", f"eq.{int(client_id)}"))
+    params += [("order", "nazwa"), ("limit", str(limit)), ("offset", str(offset))]
+    return _select('budynki', params, BUILDING_TABLES, _flatten_building) or []
+
+def get_buildings_page(client_id=None, search=None, cursor=None, limit=50):
+    """Get the page of buildings after ``cursor`` (by name, or by relevance when searching).
+
+    Returns ``(buildings, next_cursor)``; ``next_cursor`` is None on the last page.
+    """
+    if not supabase:
+        return [], None
+
     if search:
-        query = query.or_(f"model.ilike.%{search}%,numer_seryjny.ilike.%{search}%")
-    
-    response = query.order('data_instalacji', desc=True).limit(limit).offset(offset).execute()
-    return response.data if response else []
+        return _search_page(
+            'szukaj_budynkow', {'fraza': search, 'id_klienta_filtr': client_id}, 'budynki:szukaj',
+            cursor, limit, BUILDING_SELECT, BUILDING_TABLES, _flatten_building
+        )
+
+    params = [("select", BUILDING_SELECT)]
+    if client_id:
+        params.append(("id_klienta", f"eq.{int(client_id)}"))
+    return _fetch_page('budynki', params, 'budynki', 'nazwa', False, cursor, limit, BUILDING_TABLES, _flatten_building)
 
 # Service order-related functions
 def get_service_orders(status=None, client_id=None, device_id=None, limit=100, offset=0):
-    """Get service orders with optional filters using Supabase."""
+    """Get service orders with their client names and device models, with optional filters."""
     if not supabase:
         return []
-    
-    query = supabase.table('zlecenia_serwisowe').select('*')
-    
-    if status:
-        query = query.eq('status', status)
-    
-    if client_id:
-        query = query.eq('id_klienta', client_id)
-    
-    if device_id:
-        query = query.eq('id_urządzenia', device_id)
-    
-    response = query.order('data_utworzenia', desc=True).limit(limit).offset(offset).execute()
-    return response.data if response else []
+
+    params = _service_order_filters(status, client_id, device_id) + [
+        ("order", "data_utworzenia.desc.nullslast"), ("limit", str(limit)), ("offset", str(offset))
+    ]
+    return _select('zlecenia_serwisowe', params, SERVICE_ORDER_TABLES, _flatten_service_order) or []
+
+def get_service_orders_page(status=None, client_id=None, device_id=None, cursor=None, limit=50):
+    """Get the page of service orders after ``cursor`` (newest first). Returns ``(orders, next_cursor)``."""
+    if not supabase:
+        return [], None
+
+    return _fetch_page(
+        'zlecenia_serwisowe', _service_order_filters(status, client_id, device_id), 'zlecenia',
+        'data_utworzenia', True, cursor, limit, SERVICE_ORDER_TABLES, _flatten_service_order
+    )
 
 # Real-time subscriptions
 def subscribe_to_service_orders(callback):